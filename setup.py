@@ -12,8 +12,10 @@ setup(
     packages=find_packages(),
     entry_points={
         'console_scripts': [
+            'soil-env = soil.cli:env',
             'soil-pipeline = soil.cli:pipeline',
             'soil-ref = soil.cli:ref',
+            'soil-report = soil.cli:report',
             'soil-run = soil.cli:run',
         ]
     },
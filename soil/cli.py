@@ -1,62 +1,174 @@
 import click
+import importlib
 
-import soil.pipelines.dna_db.cli
-import soil.pipelines.rna_assembly.cli
 
-import soil.ref_data.cli
+class LazyGroup(click.Group):
+    """ Click group which only imports the module of a sub command when the command is run. Importing all the wrappers
+    pulls in pandas, pysam, pypeliner etc. which makes printing the help slow.
 
-import soil.wrappers.bwa.cli
-import soil.wrappers.eagle.cli
-import soil.wrappers.mixcr.cli
-import soil.wrappers.msgf_plus.cli
-import soil.wrappers.mutect.cli
-import soil.wrappers.optitype.cli
-import soil.wrappers.platypus.cli
-import soil.wrappers.star.cli
-import soil.wrappers.strelka.cli
-import soil.wrappers.topiary.cli
-import soil.wrappers.titan.cli
-import soil.wrappers.transdecoder.cli
-import soil.wrappers.vardict.cli
+    :param lazy_commands: Dictionary with command names as keys and the import path of the command as values.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.lazy_commands = kwargs.pop('lazy_commands', {})
+
+        super(LazyGroup, self).__init__(*args, **kwargs)
+
+    def list_commands(self, ctx):
+        return sorted(set(super(LazyGroup, self).list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        if name in self.commands:
+            return self.commands[name]
+
+        if name not in self.lazy_commands:
+            return None
+
+        module_name, attr_name = self.lazy_commands[name].rsplit('.', 1)
+
+        command = getattr(importlib.import_module(module_name), attr_name)
+
+        self.add_command(command, name)
+
+        return command
+
+    def format_commands(self, ctx, formatter):
+        # Only list the names of commands which have not been imported to keep the help fast
+        rows = []
+
+        for name in self.list_commands(ctx):
+            if name in self.commands:
+                rows.append((name, self.commands[name].short_help or ''))
+
+            else:
+                rows.append((name, ''))
+
+        if len(rows) > 0:
+            with formatter.section('Commands'):
+                formatter.write_dl(rows)
 
 
 @click.group()
-def pipeline():
+def env():
+    """ Tools for managing the conda environments used by soil.
+    """
     pass
 
 
-pipeline.add_command(soil.pipelines.rna_assembly.cli.rna_assembly)
-pipeline.add_command(soil.pipelines.dna_db.cli.dna_db)
+@env.command(context_settings={'max_content_width': 120})
+@click.option(
+    '--archive', is_flag=True,
+    help='''Set this flag to also write a relocatable archive of each environment with conda-pack. If
+    SOIL_ENV_LOCAL_DIR is set when a workflow is built, jobs unpack the archives there on the node running them.'''
+)
+@click.option(
+    '--dry-run', is_flag=True,
+    help='''Set this flag to list the package sets without creating environments.'''
+)
+def prebuild(archive, dry_run):
+    """ Create the shared conda environments used by the shipped workflows from the pinned package versions.
+    """
+    import soil.utils.sandbox
+    import soil.utils.workflow
 
+    store_dir = soil.utils.sandbox.get_env_store_dir()
 
-@click.group()
+    if store_dir is None:
+        raise click.UsageError('Shared environments are disabled. Set SOIL_ENV_DIR to the directory to store them.')
+
+    for package_names in soil.utils.sandbox.get_workflow_package_sets():
+        try:
+            sandbox = soil.utils.workflow.get_sandbox(package_names)
+
+        except KeyError as e:
+            click.echo('Skipping {}, unknown package {}'.format(' '.join(package_names), e), err=True)
+
+            continue
+
+        click.echo(' '.join(package_names))
+
+        if dry_run:
+            continue
+
+        sandbox.create_conda_env(store_dir)
+
+        if archive:
+            sandbox.create_archive()
+
+
+@click.group(
+    cls=LazyGroup,
+    lazy_commands={
+        'dna-db': 'soil.pipelines.dna_db.cli.dna_db',
+        'rna-assembly': 'soil.pipelines.rna_assembly.cli.rna_assembly',
+    }
+)
+def pipeline():
+    pass
+
+
+@click.group(
+    cls=LazyGroup,
+    lazy_commands={
+        'download': 'soil.ref_data.cli.download',
+        'index': 'soil.ref_data.cli.index',
+        'mappability': 'soil.ref_data.cli.mappability',
+        'show-config': 'soil.ref_data.cli.show_config',
+    }
+)
 def ref():
     """ Tools for handling reference data files used by soil.
     """
     pass
 
 
-ref.add_command(soil.ref_data.cli.download)
-ref.add_command(soil.ref_data.cli.index)
-ref.add_command(soil.ref_data.cli.mappability)
-ref.add_command(soil.ref_data.cli.show_config)
+@click.command(context_settings={'max_content_width': 120})
+@click.option(
+    '-i', '--in-file', required=True, type=click.Path(exists=True, resolve_path=True),
+    help='''Path of report file written by a soil runner.'''
+)
+@click.option(
+    '-o', '--out-file', default=None, type=click.Path(resolve_path=True),
+    help='''Path where summary will be written in TSV format. If not set the summary is printed.'''
+)
+@click.option(
+    '-a', '--by-axis', is_flag=True,
+    help='''Set this flag to summarise tasks separately for each set of axes they were split over.'''
+)
+def report(in_file, out_file, by_axis):
+    """ Summarise the resources used by the tasks of a soil run.
+    """
+    import soil.utils.report
 
+    df = soil.utils.report.load_report(in_file)
 
-@click.group()
-def run():
-    pass
+    summary = soil.utils.report.summarise_report(df, by_axis=by_axis)
 
+    if out_file is None:
+        click.echo(summary.to_string(index=False))
 
-run.add_command(soil.wrappers.bwa.cli.bwa)
-run.add_command(soil.wrappers.eagle.cli.eagle)
-run.add_command(soil.wrappers.mixcr.cli.mixcr)
-run.add_command(soil.wrappers.msgf_plus.cli.msgf_plus)
-run.add_command(soil.wrappers.mutect.cli.mutect)
-run.add_command(soil.wrappers.optitype.cli.optitype)
-run.add_command(soil.wrappers.platypus.cli.platypus)
-run.add_command(soil.wrappers.star.cli.star)
-run.add_command(soil.wrappers.strelka.cli.strelka)
-run.add_command(soil.wrappers.topiary.cli.topiary)
-run.add_command(soil.wrappers.titan.cli.titan)
-run.add_command(soil.wrappers.transdecoder.cli.transdecoder)
-run.add_command(soil.wrappers.vardict.cli.vardict)
+    else:
+        summary.to_csv(out_file, index=False, sep='\t')
+
+
+@click.group(
+    cls=LazyGroup,
+    lazy_commands={
+        'batch': 'soil.utils.batch.batch',
+        'bwa': 'soil.wrappers.bwa.cli.bwa',
+        'eagle': 'soil.wrappers.eagle.cli.eagle',
+        'mixcr': 'soil.wrappers.mixcr.cli.mixcr',
+        'msgf-plus': 'soil.wrappers.msgf_plus.cli.msgf_plus',
+        'mutect': 'soil.wrappers.mutect.cli.mutect',
+        'optitype': 'soil.wrappers.optitype.cli.optitype',
+        'platypus': 'soil.wrappers.platypus.cli.platypus',
+        'star': 'soil.wrappers.star.cli.star',
+        'strelka': 'soil.wrappers.strelka.cli.strelka',
+        'topiary': 'soil.wrappers.topiary.cli.topiary',
+        'titan': 'soil.wrappers.titan.cli.titan',
+        'transdecoder': 'soil.wrappers.transdecoder.cli.transdecoder',
+        'vardict': 'soil.wrappers.vardict.cli.vardict',
+    }
+)
+def run():
+    pass
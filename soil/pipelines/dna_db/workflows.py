@@ -1,7 +1,7 @@
 import pypeliner
 import pypeliner.managed as mgd
-import pypeliner.sandbox
 
+import soil.utils.sandbox
 import soil.utils.workflow
 import soil.wrappers.bwa.workflows
 import soil.wrappers.sambamba.tasks
@@ -175,17 +175,19 @@ def create_db_workflow(
         genome_version='GRCh37',
         pyensembl_cache_dir=None):
 
-    sandbox = pypeliner.sandbox.CondaSandbox(pip_packages=['varcode'])
+    sandbox = soil.utils.sandbox.SharedCondaSandbox(pip_packages=['varcode'])
 
     workflow = pypeliner.workflow.Workflow(default_sandbox=sandbox)
 
     workflow.transform(
         name='clean_ref_fasta',
+        ctx={'local': True},
         func=tasks.clean_ref_proteome_ids,
         args=(
             mgd.InputFile(ref_proteome_fasta_file),
             mgd.TempOutputFile('ref.fasta')
-        )
+        ),
+        sandbox=soil.utils.sandbox.NoSandbox(),
     )
 
     workflow.transform(
@@ -34,7 +34,13 @@ def create(config_file, ref_genome_version, out_dir, cosmic, local_download, thr
 @click.option('-r', '--ref_genome_version', default='GRCh37', type=click.Choice(['GRCh37', ]))
 @click.option('--cosmic', is_flag=True)
 @click.option('--local-download', is_flag=True)
-def download(config_file, ref_genome_version, out_dir, cosmic, local_download):
+@click.option(
+    '--stream', is_flag=True,
+    help='''Set this flag to decompress the genome, proteome, transcriptome and annotation files as they are downloaded
+    and write them straight to the output, instead of writing each file and its decompressed copy to the working
+    directory. Downloads then use one connection and restart if they fail.'''
+)
+def download(config_file, ref_genome_version, out_dir, cosmic, local_download, stream):
     """ Download reference data.
     """
     if config_file is None:
@@ -44,7 +50,7 @@ def download(config_file, ref_genome_version, out_dir, cosmic, local_download):
         config = yaml.load(fh)
 
     return soil.ref_data.workflows.crete_download_ref_data_workflow(
-        config, out_dir, cosmic=cosmic, local_download=local_download
+        config, out_dir, cosmic=cosmic, local_download=local_download, stream=stream
     )
 
 
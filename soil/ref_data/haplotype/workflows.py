@@ -10,7 +10,7 @@ import soil.wrappers.bcftools.tasks
 import tasks
 
 
-def create_eagle_ref_data_workflow(vcf_url_template, out_file, local_download=False):
+def create_eagle_ref_data_workflow(vcf_url_template, out_file, checksums=None, local_download=False):
 
     chrom_map_file = soil.utils.package_data.load_data_file('ref_data/data/GRCh37/chrom_map.tsv')
 
@@ -36,7 +36,10 @@ def create_eagle_ref_data_workflow(vcf_url_template, out_file, local_download=Fa
         args=(
             mgd.TempInputObj('vcf_url', 'chrom'),
             mgd.TempOutputFile('raw.vcf.gz', 'chrom')
-        )
+        ),
+        kwargs={
+            'checksums': checksums
+        }
     )
 
     workflow.transform(
@@ -1,34 +1,60 @@
 from __future__ import division
 
-from Bio import SeqIO
 from collections import defaultdict
 
-import numpy as np
-import pandas as pd
 import pypeliner.commandline as cli
-import pysam
 
 import soil.utils.workflow
 
 
-def split_fasta_by_chrom(in_file, out_file_callback):
+def split_fasta_by_chrom(in_file, out_file_callback, pack_size=None):
+    """ Split a FASTA file into one file per chromosome.
+
+    If pack_size is set chromosomes shorter than pack_size are packed together into files with up to pack_size bases.
+    Files are keyed by the first chromosome they contain and chromosomes are assigned in sorted order, so the keys sort
+    in the same order as the chromosomes.
+    """
+    from Bio import SeqIO
 
     with open(in_file, 'r') as in_fh:
-        for record in SeqIO.parse(in_fh, format='fasta'):
-            out_file = out_file_callback[record.id]
+        lengths = dict((record.id, len(record.seq)) for record in SeqIO.parse(in_fh, format='fasta'))
 
-            with open(out_file, 'w') as out_fh:
-                SeqIO.write(record, out_fh, format='fasta')
+    keys = {}
 
+    key = None
 
-def create_kmer_reads(in_file, out_file_callback, k=100, split_size=int(1e6)):
+    key_size = 0
+
+    for chrom in sorted(lengths):
+        if (key is None) or (pack_size is None) or (key_size + lengths[chrom] > pack_size):
+            key = chrom
+
+            key_size = 0
+
+        keys[chrom] = key
+
+        key_size += lengths[chrom]
+
+    written_keys = set()
 
     with open(in_file, 'r') as in_fh:
-        record = SeqIO.parse(in_fh, format='fasta').next()
+        for record in SeqIO.parse(in_fh, format='fasta'):
+            key = keys[record.id]
+
+            if key in written_keys:
+                mode = 'a'
+
+            else:
+                mode = 'w'
+
+                written_keys.add(key)
+
+            with open(out_file_callback[key], mode) as out_fh:
+                SeqIO.write(record, out_fh, format='fasta')
 
-    chrom = record.id
 
-    seq = str(record.seq)
+def create_kmer_reads(in_file, out_file_callback, k=100, split_size=int(1e6)):
+    from Bio import SeqIO
 
     file_idx = 0
 
@@ -36,27 +62,33 @@ def create_kmer_reads(in_file, out_file_callback, k=100, split_size=int(1e6)):
 
     out_fh = open(out_file_callback[file_idx], 'w')
 
-    for beg in range(len(record.seq) - k + 1):
-        if file_size >= split_size:
-            out_fh.close()
+    with open(in_file, 'r') as in_fh:
+        for record in SeqIO.parse(in_fh, format='fasta'):
+            chrom = record.id
+
+            seq = str(record.seq)
+
+            for beg in range(len(seq) - k + 1):
+                if file_size >= split_size:
+                    out_fh.close()
 
-            file_idx += 1
+                    file_idx += 1
 
-            file_size = 0
+                    file_size = 0
 
-            out_fh = open(out_file_callback[file_idx], 'w')
+                    out_fh = open(out_file_callback[file_idx], 'w')
 
-        end = beg + k
+                end = beg + k
 
-        kmer = seq[beg:end].upper()
+                kmer = seq[beg:end].upper()
 
-        assert len(kmer) == k
+                assert len(kmer) == k
 
-        out_fh.write('>{chrom}:{beg}-{end}\n'.format(**locals()))
+                out_fh.write('>{chrom}:{beg}-{end}\n'.format(**locals()))
 
-        out_fh.write(kmer + '\n')
+                out_fh.write(kmer + '\n')
 
-        file_size += 1
+                file_size += 1
 
     out_fh.close()
 
@@ -77,6 +109,9 @@ def bwa_mem_align(in_file, ref_genome_fasta_file, out_file, threads=1):
 
 
 def compute_mappability(in_file, out_file, max_map_qual=None):
+    import pandas as pd
+    import pysam
+
     bam = pysam.AlignmentFile(in_file)
 
     probs = defaultdict(float)
@@ -126,6 +161,8 @@ def compute_mappability_segs(in_file, out_file):
 
     This is necessary to keep the memory usage of :func:`compute_chrom_mean_mappability low`.
     """
+    import pandas as pd
+
     def collapse_seg(df):
         return pd.Series(
             data=[
@@ -144,9 +181,11 @@ def compute_mappability_segs(in_file, out_file):
 
     data = data.reset_index()
 
-    data.sort_values(by='coord', inplace=True)
+    data.sort_values(by=['chrom', 'coord'], inplace=True)
 
-    data['seg'] = ((data['mappability'].diff() != 0) | (data['count'].diff() != 0)).cumsum()
+    new_chrom = (data['chrom'] != data['chrom'].shift())
+
+    data['seg'] = (new_chrom | (data['mappability'].diff() != 0) | (data['count'].diff() != 0)).cumsum()
 
     data = data.groupby('seg').apply(collapse_seg)
 
@@ -154,8 +193,10 @@ def compute_mappability_segs(in_file, out_file):
 
 
 def compute_chrom_mean_mappability(in_files, out_file):
-    """ Merge all splits from a chromosome and compute mean mappability.
+    """ Merge all splits from a chromosome, or a group of packed chromosomes, and compute mean mappability.
     """
+    import pandas as pd
+
     data = []
 
     for file_name in soil.utils.workflow.flatten_input(in_files):
@@ -175,7 +216,7 @@ def compute_chrom_mean_mappability(in_files, out_file):
 
     data.sort_values(by=['chrom', 'beg', 'end'], inplace=True)
 
-    groups = _numpy_groupby(data, ['mappability', ])
+    groups = _numpy_groupby(data, ['chrom', 'mappability'])
 
     data = []
 
@@ -190,6 +231,8 @@ def compute_chrom_mean_mappability(in_files, out_file):
 def _numpy_groupby(df, group_cols):
     """ Memory efficient groupby.
     """
+    import numpy as np
+
     cols = list(df.columns)
 
     group_col_idx = [cols.index(x) for x in group_cols]
@@ -207,6 +250,8 @@ def _numpy_groupby(df, group_cols):
 
 
 def write_bed(in_files, out_file):
+    import pandas as pd
+
     for file_name in soil.utils.workflow.flatten_input(in_files):
         df = pd.read_csv(file_name, sep='\t')
 
@@ -214,6 +259,9 @@ def write_bed(in_files, out_file):
 
 
 def write_chrom_sizes(in_file, out_file):
+    from Bio import SeqIO
+    import pandas as pd
+
     sizes = []
 
     with open(in_file, 'r') as in_fh:
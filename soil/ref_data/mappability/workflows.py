@@ -1,6 +1,7 @@
 import pypeliner
 import pypeliner.managed as mgd
 
+import soil.utils.sandbox
 import soil.utils.workflow
 
 import tasks
@@ -24,7 +25,10 @@ def create_mappability_workflow(
         args=(
             mgd.InputFile(ref_genome_fasta_file),
             mgd.TempOutputFile('chrom.fasta', 'chrom')
-        )
+        ),
+        kwargs={
+            'pack_size': split_size
+        }
     )
 
     workflow.transform(
@@ -105,11 +109,13 @@ def create_mappability_workflow(
 
     workflow.transform(
         name='write_chrom_sizes',
+        ctx={'local': True},
         func=tasks.write_chrom_sizes,
         args=(
             mgd.InputFile(ref_genome_fasta_file),
             mgd.TempOutputFile('chrom_sizes.txt'),
-        )
+        ),
+        sandbox=soil.utils.sandbox.NoSandbox(),
     )
 
     workflow.commandline(
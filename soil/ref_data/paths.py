@@ -1,6 +1,8 @@
 import os
 import yaml
 
+import soil.utils.genome
+
 
 class SoilRefDataPaths(object):
     """ Simple class to handle access to reference data paths.
@@ -56,6 +58,12 @@ class SoilRefDataPaths(object):
         """
         return os.path.join(self.base_dir, 'genome.fa')
 
+    @property
+    def genome_gaps_file(self):
+        """ Path of BED file with the assembly gaps (runs of N) of the reference genome.
+        """
+        return soil.utils.genome.get_gaps_file(self.genome_fasta_file)
+
     @property
     def genome_bwa_mappability_wig_file(self):
         """ Path to file with average BWA mem mappability of bins
@@ -86,6 +94,13 @@ class SoilRefDataPaths(object):
         """
         return os.path.join(self.base_dir, 'proteome.fa')
 
+    @property
+    def proteome_filter_stats_file(self):
+        """ Path of TSV file with the number of proteome records kept and dropped because they contain non standard
+        amino acids.
+        """
+        return os.path.join(self.base_dir, 'proteome.filter_stats.tsv')
+
     @property
     def transcriptome_fasta_file(self):
         """ Path of reference transcriptome FASTA file.
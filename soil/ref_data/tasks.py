@@ -1,12 +1,28 @@
-import Bio.Seq
-import Bio.SeqIO
+import collections
+import hashlib
+import itertools
+import multiprocessing
 import os
 import pypeliner.commandline as cli
-import pysam
-import pysftp
+import re
 import shutil
+import zlib
 
 import soil.ref_data.mappability.workflows
+import soil.utils.download
+
+# Matches the letters of the extended IUPAC protein alphabet which are not standard amino acids.
+BAD_AMINO_ACID_REGEX = re.compile('[BJOUXZ]')
+
+# Number of bytes copied at a time when sorting and merging FASTA files.
+COPY_BLOCK_SIZE = 16 * 2 ** 20
+
+# Magic bytes at the start of compressed files.
+MAGIC_BYTES = {
+    '\x1f\x8b\x08': 'gz',
+    '\x42\x5a\x68': 'bz2',
+    '\x50\x4b\x03\x04': 'zip'
+}
 
 
 def configure_iedb_module(in_sentinel, out_sentinel):
@@ -31,15 +47,39 @@ def decompress(in_file, out_file):
     cli.execute(*cmd)
 
 
-def download(url, local_path):
-    cli.execute('wget', url, '-c', '-O', local_path)
+def download(url, local_path, checksums=None):
+    """ Download a file over parallel connections, resuming an interrupted attempt.
+
+    :param url: URL of file.
+    :param local_path: Path where file will be written.
+    :param checksums: Dictionary of checksums as algorithm:hex digest keyed by URL. The file is verified if its URL has
+        an entry.
+    """
+    soil.utils.download.download(url, local_path, checksum=(checksums or {}).get(url))
+
+
+def download_decompress_concat(urls, out_file, checksums=None):
+    """ Download files and concatenate them, decompressing gzip files as they arrive. Unlike downloading, decompressing
+    and concatenating with separate tasks, only the output is written to disk.
 
-    cli.execute('touch', local_path)
+    :param urls: List of URLs of files.
+    :param out_file: Path where concatenated file will be written.
+    :param checksums: Dictionary of checksums of the compressed files as algorithm:hex digest keyed by URL.
+    """
+    with open(out_file, 'wb') as out_fh:
+        for url in urls:
+            blocks = soil.utils.download.stream(url, checksum=(checksums or {}).get(url))
 
+            for data in _decompress_blocks(blocks):
+                out_fh.write(data)
 
-def download_from_sftp(host, host_path, local_path, user, password):
-    with pysftp.Connection(host, username=user, password=password) as sftp:
-        sftp.get(host_path, localpath=local_path)
+
+def download_from_sftp(host, host_path, local_path, user, password, checksums=None):
+    url = 'sftp://{0}{1}'.format(host, host_path)
+
+    soil.utils.download.download(
+        url, local_path, checksum=(checksums or {}).get(url), user=user, password=password
+    )
 
 
 def download_pyensembl_cache(ensembl_version, out_sentinel):
@@ -72,40 +112,101 @@ def extract_tar_file(in_file, out_sentinel):
     open(out_sentinel, 'w').close()
 
 
-def filter_bad_proiteins(in_file, out_file):
-    bad_chars = set(Bio.Alphabet.IUPAC.ExtendedIUPACProtein.letters) - set(Bio.Alphabet.IUPAC.IUPACProtein.letters)
+def filter_bad_proiteins(in_file, out_file, num_processes=1, stats_file=None):
+    """ Write the records of a protein FASTA file whose sequences only contain the standard amino acids. Records are
+    copied unchanged, and the file can be split into shards filtered by separate processes.
 
-    with open(in_file, 'r') as in_fh, open(out_file, 'w') as out_fh:
-        for record in Bio.SeqIO.parse(in_fh, 'fasta'):
-            write_record = True
+    :param in_file: Path of protein FASTA file.
+    :param out_file: Path where filtered FASTA file will be written.
+    :param num_processes: Number of processes to filter shards of the file with.
+    :param stats_file: Path where a TSV file with the number of kept and dropped records, and the number of dropped
+        records containing each non standard amino acid, will be written. Not written if None.
+    :returns: Dictionary of the counts written to the stats file.
+    """
+    shards = _get_fasta_shards(in_file, num_processes)
 
-            for aa in bad_chars:
-                if aa in record.seq:
-                    write_record = False
+    if len(shards) == 1:
+        shard_files = [out_file, ]
 
-            if write_record:
-                Bio.SeqIO.write(record, out_fh, 'fasta')
+    else:
+        shard_files = ['{0}.shard_{1}'.format(out_file, i) for i in range(len(shards))]
+
+    args = [(in_file, beg, end, x) for (beg, end), x in zip(shards, shard_files)]
+
+    if len(args) == 1:
+        results = [_filter_fasta_shard(args[0]), ]
+
+    else:
+        pool = multiprocessing.Pool(min(num_processes, len(args)))
+
+        try:
+            results = pool.map(_filter_fasta_shard, args)
+
+        finally:
+            pool.close()
+
+            pool.join()
+
+        with open(out_file, 'wb') as out_fh:
+            for file_name in shard_files:
+                with open(file_name, 'rb') as in_fh:
+                    shutil.copyfileobj(in_fh, out_fh, COPY_BLOCK_SIZE)
+
+                os.remove(file_name)
+
+    counts = collections.Counter({'kept': 0, 'dropped': 0})
+
+    for x in results:
+        counts.update(x)
+
+    if stats_file is not None:
+        with open(stats_file, 'w') as fh:
+            fh.write('category\tcount\n')
+
+            for key in ['kept', 'dropped'] + sorted(x for x in counts if x not in ('kept', 'dropped')):
+                fh.write('{0}\t{1}\n'.format(key, counts[key]))
+
+    return dict(counts)
 
 
 def lex_sort_fasta(in_file, out_file):
-    raw_ref = pysam.FastaFile(in_file)
+    """ Write the contigs of a FASTA file with chr1 to chr22, chrX, chrY and chrM first followed by the others in sorted
+    order.
+
+    Sequences are copied in blocks between the byte offsets in the FASTA index, so memory use does not depend on contig
+    size. The input is indexed first if it has no index. The sequence lines are copied unchanged, so their offsets in
+    the output are known from the bytes written, and the output is checked against digests of the input sequences
+    computed while copying without indexing it.
+
+    :param in_file: Path of FASTA file.
+    :param out_file: Path where sorted FASTA file will be written.
+    """
+    in_index = _load_fasta_index(in_file)
 
     lex_order = ['chr{}'.format(i) for i in range(1, 23) + ['X', 'Y', 'M']]
 
-    contigs = set(raw_ref.references) - set(lex_order)
+    lex_order = [x for x in lex_order if x in in_index]
+
+    lex_order = lex_order + sorted(set(in_index) - set(lex_order))
 
-    lex_order = lex_order + sorted(contigs)
+    digests = {}
 
-    with open(out_file, 'w') as out_fh:
-        for i, chrom in enumerate(lex_order):
-            record = Bio.SeqIO.SeqRecord(Bio.Seq.Seq(raw_ref.fetch(chrom)), description='', id=chrom)
+    out_index = {}
 
-            Bio.SeqIO.write(record, out_fh, 'fasta')
+    with open(in_file, 'rb') as in_fh, open(out_file, 'wb') as out_fh:
+        for chrom in lex_order:
+            out_fh.write('>{}\n'.format(chrom))
 
-    lex_ref = pysam.FastaFile(out_file)
+            offset = out_fh.tell()
 
-    for chrom in raw_ref.references:
-        assert raw_ref.fetch(chrom) == lex_ref.fetch(chrom)
+            digests[chrom] = _copy_fasta_sequence(in_fh, in_index[chrom], out_fh=out_fh)
+
+            out_index[chrom] = (offset, out_fh.tell() - offset)
+
+    with open(out_file, 'rb') as fh:
+        for chrom in lex_order:
+            if _copy_fasta_sequence(fh, out_index[chrom]) != digests[chrom]:
+                raise Exception('Sequence of {0} in {1} does not match {2}.'.format(chrom, out_file, in_file))
 
 
 def mappability_wrapper(bwa_sentinel_file, out_file, **kwargs):
@@ -116,6 +217,64 @@ def mappability_wrapper(bwa_sentinel_file, out_file, **kwargs):
     )
 
 
+def write_gaps_file(in_file, out_file, min_gap_size=100):
+    """ Write a BED file with the runs of N bases (assembly gaps) in a FASTA file.
+
+    :param in_file: Path of FASTA file.
+    :param out_file: Path where BED file will be written.
+    :param min_gap_size: Minimum length of a run of N bases to be written.
+    """
+    n_runs = re.compile('[Nn]+')
+
+    def write_gap(chrom, beg, end):
+        if (beg is not None) and (end - beg >= min_gap_size):
+            out_fh.write('{0}\t{1}\t{2}\n'.format(chrom, beg, end))
+
+    with open(in_file, 'r') as in_fh, open(out_file, 'w') as out_fh:
+        chrom = None
+
+        gap_beg = None
+
+        gap_end = None
+
+        pos = 0
+
+        for line in in_fh:
+            if line.startswith('>'):
+                write_gap(chrom, gap_beg, gap_end)
+
+                chrom = line[1:].split()[0]
+
+                gap_beg = None
+
+                gap_end = None
+
+                pos = 0
+
+                continue
+
+            line = line.rstrip()
+
+            for match in n_runs.finditer(line):
+                beg = pos + match.start()
+
+                end = pos + match.end()
+
+                if beg == gap_end:
+                    gap_end = end
+
+                else:
+                    write_gap(chrom, gap_beg, gap_end)
+
+                    gap_beg = beg
+
+                    gap_end = end
+
+            pos += len(line)
+
+        write_gap(chrom, gap_beg, gap_end)
+
+
 def unzip_file(in_file, out_sentinel, tmp_dir):
     if os.path.exists(tmp_dir):
         shutil.rmtree(tmp_dir)
@@ -138,20 +297,223 @@ def unzip_file(in_file, out_sentinel, tmp_dir):
     shutil.rmtree(tmp_dir)
 
 
-def _guess_file_type(filename):
-    magic_dict = {
-        '\x1f\x8b\x08': 'gz',
-        '\x42\x5a\x68': 'bz2',
-        '\x50\x4b\x03\x04': 'zip'
-    }
+def _copy_fasta_sequence(in_fh, entry, out_fh=None):
+    """ Copy the sequence lines of a contig in blocks, and return the MD5 digest of the sequence without line breaks.
 
-    max_len = max(len(x) for x in magic_dict)
+    :param in_fh: File handle of the FASTA file.
+    :param entry: Tuple of the byte offset and number of bytes of the sequence lines from :func:`_load_fasta_index`.
+    :param out_fh: File handle the lines are written to. Only the digest is computed if None.
+    """
+    offset, num_bytes = entry
 
-    with open(filename) as f:
-        file_start = f.read(max_len)
+    md5 = hashlib.md5()
+
+    in_fh.seek(offset)
+
+    last_data = ''
+
+    while num_bytes > 0:
+        data = in_fh.read(min(COPY_BLOCK_SIZE, num_bytes))
+
+        if not data:
+            break
+
+        num_bytes -= len(data)
+
+        md5.update(data.translate(None, '\r\n'))
+
+        if out_fh is not None:
+            out_fh.write(data)
+
+        last_data = data
+
+    # The last line of a file may not end with a line break
+    if (out_fh is not None) and (len(last_data) > 0) and (not last_data.endswith('\n')):
+        out_fh.write('\n')
+
+    return md5.hexdigest()
 
-    for magic, file_type in magic_dict.items():
+
+def _decompress_blocks(blocks):
+    """ Decompress a stream of blocks if it is gzip compressed, detected from the start of the stream. Other streams are
+    passed through like :func:`decompress` copies other files.
+    """
+    max_len = max(len(x) for x in MAGIC_BYTES)
+
+    head = ''
+
+    for block in blocks:
+        head += block
+
+        if len(head) >= max_len:
+            break
+
+    if _get_file_type(head) != 'gz':
+        yield head
+
+        for block in blocks:
+            yield block
+
+        return
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    for block in itertools.chain([head, ], blocks):
+        while block:
+            yield decompressor.decompress(block)
+
+            # Files such as bgzip output are several gzip members one after another
+            block = decompressor.unused_data
+
+            if block:
+                yield decompressor.flush()
+
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    yield decompressor.flush()
+
+
+def _load_fasta_index(file_name):
+    """ Load the FASTA index of a file, creating it if it does not exist. Returns a dictionary of the byte offset and
+    number of bytes of the sequence lines of each contig, including line breaks.
+    """
+    import pysam
+
+    index_file = file_name + '.fai'
+
+    if not os.path.exists(index_file):
+        pysam.faidx(file_name)
+
+    index = {}
+
+    with open(index_file, 'r') as fh:
+        for line in fh:
+            name, length, offset, line_bases, line_width = line.split('\t')[:5]
+
+            length, offset, line_bases, line_width = int(length), int(offset), int(line_bases), int(line_width)
+
+            if length == 0:
+                num_bytes = 0
+
+            else:
+                num_lines, remainder = divmod(length, line_bases)
+
+                num_bytes = num_lines * line_width
+
+                if remainder > 0:
+                    num_bytes += remainder + (line_width - line_bases)
+
+            index[name] = (offset, num_bytes)
+
+    return index
+
+
+def _filter_fasta_shard(args):
+    """ Filter the records of a protein FASTA file between two byte offsets, which should be at the start of records.
+    Returns a dictionary of the number of kept and dropped records.
+    """
+    in_file, beg, end, out_file = args
+
+    counts = collections.Counter()
+
+    def write_record(record, bad_chars):
+        if len(record) == 0:
+            return
+
+        if len(bad_chars) == 0:
+            out_fh.writelines(record)
+
+            counts['kept'] += 1
+
+        else:
+            counts['dropped'] += 1
+
+            for aa in bad_chars:
+                counts['dropped_{}'.format(aa)] += 1
+
+    with open(in_file, 'rb') as in_fh, open(out_file, 'wb') as out_fh:
+        in_fh.seek(beg)
+
+        pos = beg
+
+        record = []
+
+        bad_chars = set()
+
+        # Iterating over the file reads ahead, so use readline to track the position
+        while pos < end:
+            line = in_fh.readline()
+
+            if not line:
+                break
+
+            pos += len(line)
+
+            if line.startswith('>'):
+                write_record(record, bad_chars)
+
+                record = [line, ]
+
+                bad_chars = set()
+
+            # Text before the first record is dropped, as Bio.SeqIO does
+            elif len(record) > 0:
+                record.append(line)
+
+                bad_chars.update(BAD_AMINO_ACID_REGEX.findall(line))
+
+        write_record(record, bad_chars)
+
+    return dict(counts)
+
+
+def _get_fasta_shards(file_name, num_shards):
+    """ Split a FASTA file into shards of roughly equal size which start at the beginning of a record. Returns a list of
+    tuples of the start and end byte offsets.
+    """
+    size = os.path.getsize(file_name)
+
+    bounds = [0, ]
+
+    with open(file_name, 'rb') as fh:
+        for i in range(1, num_shards):
+            fh.seek(max(size * i // num_shards, bounds[-1]))
+
+            # Skip the rest of the line the offset falls in
+            pos = fh.tell() + len(fh.readline())
+
+            while True:
+                line = fh.readline()
+
+                if (not line) or line.startswith('>'):
+                    break
+
+                pos += len(line)
+
+            if pos > bounds[-1]:
+                bounds.append(pos)
+
+    if size > bounds[-1]:
+        bounds.append(size)
+
+    if len(bounds) == 1:
+        return [(0, size), ]
+
+    return zip(bounds[:-1], bounds[1:])
+
+
+def _get_file_type(file_start):
+    for magic, file_type in MAGIC_BYTES.items():
         if file_start.startswith(magic):
             return file_type
 
     return None
+
+
+def _guess_file_type(filename):
+    max_len = max(len(x) for x in MAGIC_BYTES)
+
+    with open(filename) as f:
+        file_start = f.read(max_len)
+
+    return _get_file_type(file_start)
@@ -6,6 +6,7 @@ import yaml
 
 import soil.ref_data.paths
 import soil.ref_data.haplotype.workflows
+import soil.utils.genome
 import soil.utils.workflow
 import soil.wrappers.bwa.tasks
 import soil.wrappers.kallisto.tasks
@@ -15,11 +16,15 @@ import soil.wrappers.star.tasks
 import tasks
 
 
-def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_download=False):
+def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_download=False, stream=False):
     """ Download reference files.
 
     This workflow mainly retrieves files from the internet. There are some light to moderately heavy computational tasks
     as well.
+
+    If stream is set, the files which are concatenated such as the genome are decompressed as they are downloaded and
+    written straight to the output. This avoids writing two temporary copies of each file, but downloads use a single
+    connection and restart from the beginning if they fail.
     """
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
@@ -29,6 +34,8 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
     with open(ref_data_paths.config_file, 'w') as fh:
         yaml.dump(config, fh)
 
+    checksums = config.get('checksums') or {}
+
     if cosmic:
         cosmic_user = click.prompt('Please enter COSMIC user ID')
 
@@ -52,7 +59,9 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
             mgd.OutputFile(ref_data_paths.gene_annotations_gtf_file)
         ),
         kwargs={
-            'local_download': local_download
+            'checksums': checksums,
+            'local_download': local_download,
+            'stream': stream
         }
     )
 
@@ -64,7 +73,9 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
             mgd.TempOutputFile('raw_ref.fasta')
         ),
         kwargs={
-            'local_download': local_download
+            'checksums': checksums,
+            'local_download': local_download,
+            'stream': stream
         }
     )
 
@@ -85,7 +96,9 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
             mgd.TempOutputFile('raw_ref_prot.fasta')
         ),
         kwargs={
-            'local_download': local_download
+            'checksums': checksums,
+            'local_download': local_download,
+            'stream': stream
         }
     )
 
@@ -95,7 +108,10 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
         args=(
             mgd.TempInputFile('raw_ref_prot.fasta'),
             mgd.OutputFile(ref_data_paths.proteome_fasta_file)
-        )
+        ),
+        kwargs={
+            'stats_file': mgd.OutputFile(ref_data_paths.proteome_filter_stats_file)
+        }
     )
 
     workflow.subworkflow(
@@ -106,7 +122,9 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
             mgd.OutputFile(ref_data_paths.transcriptome_fasta_file)
         ),
         kwargs={
-            'local_download': local_download
+            'checksums': checksums,
+            'local_download': local_download,
+            'stream': stream
         }
     )
 
@@ -117,7 +135,10 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
         args=(
             mgd.TempInputObj('dbsnp_url'),
             mgd.OutputFile(ref_data_paths.dbsnp_vcf_file)
-        )
+        ),
+        kwargs={
+            'checksums': checksums
+        }
     )
 
     if cosmic:
@@ -131,6 +152,7 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
                 cosmic_password
             ),
             kwargs={
+                'checksums': checksums,
                 'local_download': local_download
             }
         )
@@ -142,7 +164,10 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
         args=(
             mgd.TempInputObj('snpeff_url'),
             mgd.TempOutputFile('snpeff.zip')
-        )
+        ),
+        kwargs={
+            'checksums': checksums
+        }
     )
 
     workflow.transform(
@@ -162,7 +187,10 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
         args=(
             mgd.TempInputObj('genetic_map_txt_url'),
             mgd.OutputFile(ref_data_paths.genetic_map_file)
-        )
+        ),
+        kwargs={
+            'checksums': checksums
+        }
     )
 
     workflow.subworkflow(
@@ -173,6 +201,7 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
             mgd.OutputFile(ref_data_paths.haplotypes_bcf)
         ),
         kwargs={
+            'checksums': checksums,
             'local_download': local_download
         }
     )
@@ -184,7 +213,10 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
         args=(
             mgd.TempInputObj('iedb_mhc_one_url'),
             mgd.TempOutputFile('mhc1.tar.gz')
-        )
+        ),
+        kwargs={
+            'checksums': checksums
+        }
     )
 
     workflow.transform(
@@ -212,7 +244,10 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
         args=(
             mgd.TempInputObj('vep_cache_url'),
             mgd.TempOutputFile('vep.tar.gz')
-        )
+        ),
+        kwargs={
+            'checksums': checksums
+        }
     )
 
     workflow.transform(
@@ -231,7 +266,7 @@ def crete_download_ref_data_workflow(config, out_dir, cosmic=False, local_downlo
             mgd.TempInputObj('vep_plugins_urls'),
             ref_data_paths.vep_plugins_dir
         ),
-        kwargs={'local_download': local_download}
+        kwargs={'checksums': checksums, 'local_download': local_download}
     )
 
     workflow.setobj(obj=mgd.TempOutputObj('pyensembl_version'), value=config['pyensembl']['version'])
@@ -271,6 +306,33 @@ def create_index_ref_data_workflow(out_dir, cosmic=False, threads=1):
         )
     )
 
+    workflow.transform(
+        name='build_ref_genome_gaps_file',
+        func=tasks.write_gaps_file,
+        args=(
+            mgd.InputFile(ref_data_paths.genome_fasta_file),
+            mgd.OutputFile(ref_data_paths.genome_gaps_file)
+        )
+    )
+
+    workflow.commandline(
+        name='link_bwa_ref_gaps',
+        args=(
+            'ln',
+            mgd.InputFile(ref_data_paths.genome_gaps_file),
+            mgd.OutputFile(soil.utils.genome.get_gaps_file(ref_data_paths.bwa_genome_fasta_file))
+        )
+    )
+
+    workflow.commandline(
+        name='link_star_ref_gaps',
+        args=(
+            'ln',
+            mgd.InputFile(ref_data_paths.genome_gaps_file),
+            mgd.OutputFile(soil.utils.genome.get_gaps_file(ref_data_paths.star_genome_fasta_file))
+        )
+    )
+
     workflow.transform(
         name='bwa_index_ref_genome',
         ctx={'mem': 8, 'mem_retry_increment': 8, 'num_retry': 3},
@@ -378,7 +440,7 @@ def create_index_ref_data_workflow(out_dir, cosmic=False, threads=1):
 #=========================================================================
 
 
-def _create_download_decompress_workflow(url, local_path, local_download=False):
+def _create_download_decompress_workflow(url, local_path, checksums=None, local_download=False):
     workflow = pypeliner.workflow.Workflow()
 
     workflow.setobj(mgd.TempOutputObj('url'), value=url)
@@ -391,6 +453,9 @@ def _create_download_decompress_workflow(url, local_path, local_download=False):
             mgd.TempInputObj('url'),
             mgd.TempOutputFile('download'),
         ),
+        kwargs={
+            'checksums': checksums
+        }
     )
 
     workflow.transform(
@@ -405,9 +470,25 @@ def _create_download_decompress_workflow(url, local_path, local_download=False):
     return workflow
 
 
-def _create_download_decompress_concat_workflow(urls, out_file, local_download=False):
+def _create_download_decompress_concat_workflow(urls, out_file, checksums=None, local_download=False, stream=False):
     workflow = pypeliner.workflow.Workflow()
 
+    if stream:
+        workflow.transform(
+            name='download_decompress_concat',
+            ctx={'local': local_download},
+            func=tasks.download_decompress_concat,
+            args=(
+                urls,
+                mgd.OutputFile(out_file),
+            ),
+            kwargs={
+                'checksums': checksums
+            }
+        )
+
+        return workflow
+
     local_files = []
 
     for i, url in enumerate(urls):
@@ -423,6 +504,7 @@ def _create_download_decompress_concat_workflow(urls, out_file, local_download=F
                 local_files[i].as_output(),
             ),
             kwargs={
+                'checksums': checksums,
                 'local_download': local_download
             }
         )
@@ -443,6 +525,7 @@ def _create_download_cosmic_workflow(
         user,
         password,
         host='sftp-cancer.sanger.ac.uk',
+        checksums=None,
         local_download=False):
 
     host_base_path = '/files/{}/cosmic/v83/VCF'.format(ref_data_version.lower())
@@ -470,6 +553,7 @@ def _create_download_cosmic_workflow(
             mgd.TempOutputFile('coding.vcf.gz'),
         ),
         kwargs={
+            'checksums': checksums,
             'local_download': local_download
         }
     )
@@ -485,6 +569,7 @@ def _create_download_cosmic_workflow(
             mgd.TempOutputFile('non_coding.vcf.gz'),
         ),
         kwargs={
+            'checksums': checksums,
             'local_download': local_download
         }
     )
@@ -505,7 +590,15 @@ def _create_download_cosmic_workflow(
     return workflow
 
 
-def _create_download_cosmic_file_subworkflow(host, host_path, user, password, out_file, local_download=False):
+def _create_download_cosmic_file_subworkflow(
+        host,
+        host_path,
+        user,
+        password,
+        out_file,
+        checksums=None,
+        local_download=False):
+
     sandbox = soil.utils.workflow.get_sandbox(['bcftools', 'samtools'])
 
     workflow = pypeliner.workflow.Workflow(default_sandbox=sandbox)
@@ -520,7 +613,10 @@ def _create_download_cosmic_file_subworkflow(host, host_path, user, password, ou
             mgd.TempOutputFile('file.vcf.gz'),
             user,
             password
-        )
+        ),
+        kwargs={
+            'checksums': checksums
+        }
     )
 
     workflow.transform(
@@ -544,7 +640,7 @@ def _create_download_cosmic_file_subworkflow(host, host_path, user, password, ou
     return workflow
 
 
-def _create_download_vep_plugins_workflow(urls, out_dir, local_download=False):
+def _create_download_vep_plugins_workflow(urls, out_dir, checksums=None, local_download=False):
     workflow = pypeliner.workflow.Workflow()
 
     for i, url in enumerate(urls):
@@ -559,7 +655,10 @@ def _create_download_vep_plugins_workflow(urls, out_dir, local_download=False):
             args=(
                 mgd.TempInputObj('url_{}'.format(i)),
                 mgd.OutputFile(out_file),
-            )
+            ),
+            kwargs={
+                'checksums': checksums
+            }
         )
 
     return workflow
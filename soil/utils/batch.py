@@ -0,0 +1,297 @@
+"""
+Runs of a wrapper over the samples of a cohort with a single runner.
+
+Running a wrapper once per sample starts a controller per sample, each building its workflow, polling the cluster and
+competing with the others for the same reference files. `soil-run batch` instead builds one workflow with a sub workflow
+per sample of a sample sheet, so the jobs of every sample are scheduled together. The sub workflows are split over a
+sample axis, so a task has the same name for every sample and the resources used by one sample inform the requests of
+the others. See :mod:`soil.utils.history`.
+
+The sample sheet is a tab separated file with a header. The `sample` column names the sample, and the other columns are
+options of the wrapper command given by their long name, with or without the leading dashes, i.e. `out_vcf_file` or
+`--out-vcf-file`. Options which can be given multiple times take values separated by commas, options which take several
+values take them separated by spaces, and flags are set by true, yes or 1. Options which are the same for every sample,
+such as the reference genome, can be given after the wrapper command instead. Values in the sheet replace shared values
+of the same option.
+
+The workflows of the samples are built by jobs on the host, so the headers of the input files are read in parallel.
+Tasks which are cached with :func:`soil.utils.task_cache.cached_task`, such as index builds of shared reference files,
+run once for the cohort when `--task-cache-dir` is set.
+"""
+import click
+import csv
+import pypeliner
+
+import soil.utils.cli
+
+# Values of a column of the sample sheet which set a flag.
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+@soil.utils.cli.runner
+@click.option(
+    '-s', '--sample-sheet', required=True, type=click.Path(exists=True, resolve_path=True),
+    help='''Path of a tab separated file with a sample column naming each sample and a column for each option of the
+    wrapper command which differs between samples.'''
+)
+@click.argument('wrapper_args', nargs=-1, required=True, type=click.UNPROCESSED)
+def batch(sample_sheet, wrapper_args):
+    """ Run a wrapper command on every sample of a sample sheet as one workflow, i.e.
+
+    soil-run batch -s samples.tsv -wd work strelka somatic -r ref.fasta
+    """
+    command_names, shared_args = _get_wrapper_command_names(wrapper_args)
+
+    command = get_wrapper_command(command_names)
+
+    samples = load_sample_sheet(sample_sheet)
+
+    out_files = {}
+
+    sample_params = {}
+
+    for sample, row in samples:
+        params = get_sample_params(command, row, shared_args)
+
+        # Samples writing to the same output would overwrite each other, so fail before anything runs
+        for key, value in sorted(params.items()):
+            if (not key.startswith('out')) or (value is None):
+                continue
+
+            if value in out_files:
+                raise Exception('Samples {0} and {1} both write {2}.'.format(out_files[value], sample, value))
+
+            out_files[value] = sample
+
+        sample_params[sample] = params
+
+    workflow = pypeliner.workflow.Workflow()
+
+    workflow.setobj(
+        obj=pypeliner.managed.TempOutputObj('params', 'sample'),
+        value=sample_params
+    )
+
+    # Samples are chunks of an axis rather than named sub workflows, so tasks have the same name for every sample and
+    # share their resource history
+    workflow.subworkflow(
+        name='run_wrapper',
+        axes=('sample', ),
+        ctx={'local': True},
+        func=create_sample_workflow,
+        args=(
+            command_names,
+            pypeliner.managed.TempInputObj('params', 'sample'),
+        )
+    )
+
+    return workflow
+
+# Everything after the wrapper command name belongs to the wrapper
+batch.allow_interspersed_args = False
+
+
+def create_sample_workflow(command_names, params):
+    """ Build the workflow of a wrapper command for one sample.
+
+    :param command_names: Names of the wrapper command under soil-run, i.e. ('strelka', 'somatic').
+    :param params: Dictionary of parsed options of the wrapper command.
+    """
+    command = get_wrapper_command(command_names)
+
+    return command.workflow_func(**params)
+
+
+def get_sample_params(command, row, shared_args=()):
+    """ Parse the options of a wrapper command for a sample, as they would be parsed on the command line.
+
+    :param command: Wrapper command created with :func:`soil.utils.cli.runner`.
+    :param row: Dictionary of the values of a row of the sample sheet keyed by column.
+    :param shared_args: List of command line arguments used for every sample.
+    """
+    params = dict((x.name, x) for x in command.workflow_params)
+
+    args = []
+
+    sheet_names = set()
+
+    for column, value in sorted(row.items()):
+        name = column.lstrip('-').replace('-', '_')
+
+        if (name == 'sample') or (value is None) or (value.strip() == ''):
+            continue
+
+        if name not in params:
+            raise Exception('Column {0} of the sample sheet is not an option of {1}.'.format(column, command.name))
+
+        sheet_names.add(name)
+
+        param = params[name]
+
+        opt = max(param.opts, key=len)
+
+        if param.is_flag:
+            if value.strip().lower() in TRUE_VALUES:
+                args.append(opt)
+
+            continue
+
+        if param.multiple:
+            values = value.split(',')
+
+        else:
+            values = [value, ]
+
+        for x in values:
+            args.append(opt)
+
+            if param.nargs > 1:
+                args.extend(x.split())
+
+            else:
+                args.append(x.strip())
+
+    # Click concatenates the values of options given multiple times, so values in the sheet would otherwise be added to
+    # the shared values instead of replacing them
+    args = _drop_options(shared_args, command.workflow_params, sheet_names) + args
+
+    parser = click.Command(command.name, params=command.workflow_params)
+
+    ctx = parser.make_context(command.name, args)
+
+    return ctx.params
+
+
+def get_wrapper_command(command_names):
+    """ Get the command of a wrapper from its names under soil-run.
+
+    :param command_names: Names of the group and command, i.e. ('strelka', 'somatic').
+    """
+    import soil.cli
+
+    command = soil.cli.run
+
+    for name in command_names:
+        command = command.get_command(None, name)
+
+        if command is None:
+            raise click.UsageError('Unknown wrapper command {}.'.format(' '.join(command_names)))
+
+    if not hasattr(command, 'workflow_func'):
+        raise click.UsageError('{} is not a wrapper command.'.format(' '.join(command_names)))
+
+    return command
+
+
+def load_sample_sheet(file_name):
+    """ Load a tab separated sample sheet. Returns a list of tuples of the sample name and a dictionary of the values of
+    the other columns.
+
+    :param file_name: Path of the sample sheet.
+    """
+    samples = []
+
+    with open(file_name, 'rb') as fh:
+        reader = csv.DictReader(fh, delimiter='\t')
+
+        if 'sample' not in (reader.fieldnames or []):
+            raise Exception('Sample sheet {} has no sample column.'.format(file_name))
+
+        for row in reader:
+            sample = (row.pop('sample') or '').strip()
+
+            # Blank lines
+            if (sample == '') and all((x or '').strip() == '' for x in row.values()):
+                continue
+
+            if sample in [x for x, _ in samples]:
+                raise Exception('Sample {} is in the sample sheet more than once.'.format(sample))
+
+            if (sample == '') or ('/' in sample):
+                raise Exception('Sample names cannot be empty or contain /, found {}.'.format(sample))
+
+            samples.append((sample, row))
+
+    if len(samples) == 0:
+        raise Exception('Sample sheet {} has no samples.'.format(file_name))
+
+    return samples
+
+
+def _drop_options(args, params, names):
+    """ Remove the occurrences of the options with the given names and their values from a list of command line
+    arguments.
+    """
+    opts = {}
+
+    for param in params:
+        for opt in param.opts + param.secondary_opts:
+            opts[opt] = param
+
+    kept = []
+
+    i = 0
+
+    while i < len(args):
+        arg = args[i]
+
+        # Everything after -- is an argument
+        if arg == '--':
+            kept.extend(args[i:])
+
+            break
+
+        if arg.startswith('--'):
+            opt, has_value, _ = arg.partition('=')
+
+        else:
+            # Short options can be followed by their value, i.e. -rref.fasta
+            opt = arg[:2]
+
+            has_value = len(arg) > 2
+
+        param = opts.get(opt)
+
+        if (param is None) or (param.name not in names):
+            kept.append(arg)
+
+            i += 1
+
+            continue
+
+        if param.is_flag or has_value:
+            i += 1
+
+        else:
+            i += 1 + param.nargs
+
+    return kept
+
+
+def _get_wrapper_command_names(wrapper_args):
+    """ Split the arguments after soil-run batch into the names of the wrapper command and the shared options.
+    """
+    import soil.cli
+
+    command = soil.cli.run
+
+    names = []
+
+    for arg in wrapper_args:
+        if not isinstance(command, click.MultiCommand):
+            break
+
+        if arg == 'batch':
+            raise click.UsageError('Batches cannot be nested.')
+
+        command = command.get_command(None, arg)
+
+        if command is None:
+            raise click.UsageError('Unknown wrapper command {}.'.format(' '.join(names + [arg, ])))
+
+        names.append(arg)
+
+    if isinstance(command, click.MultiCommand):
+        raise click.UsageError('Missing wrapper command after {}.'.format(' '.join(names)))
+
+    return tuple(names), list(wrapper_args[len(names):])
@@ -0,0 +1,315 @@
+"""
+Persistent cache for values computed from the headers of input files, such as chromosome lengths, sample names and
+region plans. These are computed on the submit host when workflows are built, so caching them avoids re-opening large
+files on slow file systems every time a workflow is built or resumed.
+
+Values are stored in the directory set by the SOIL_CACHE_DIR environment variable, or ~/.cache/soil if it is not set.
+Set SOIL_CACHE_DIR to an empty string to disable the cache. Values which have not been used for
+:data:`MAX_ENTRY_AGE` seconds are removed, as are the least recently used values once the cached values take more than
+:data:`MAX_CACHE_SIZE` bytes. The other stores in the directory, such as the conda environments, are not affected.
+
+The stores shared between runs, such as the task cache and the conda environments, use :func:`lock` to stop jobs on
+different hosts building the same entry at the same time.
+"""
+import contextlib
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+# Seconds between checks for cached values to remove.
+EVICT_TIME = 24 * 60 * 60
+
+# Name of the file whose modification time records the last check for cached values to remove.
+EVICT_FILE = '.last_evict'
+
+# Number of bytes at the start of a file used to compute the checksum. This covers the header of BAM and VCF files.
+HEADER_SIZE = 2 ** 16
+
+# Maximum number of bytes of cached values.
+MAX_CACHE_SIZE = 2 ** 30
+
+# Seconds since a cached value was last used after which it is removed.
+MAX_ENTRY_AGE = 30 * 24 * 60 * 60
+
+# Seconds between checks of a lock held by another process.
+LOCK_POLL_TIME = 10
+
+# Seconds between updates of the modification time of a held lock, so waiting processes can tell the holder is alive.
+LOCK_TOUCH_TIME = 60
+
+# Seconds without an update after which a lock is assumed to be left by a process which died.
+STALE_LOCK_TIME = 5 * 60
+
+# Increment to invalidate existing cache entries if the format of cached values changes.
+VERSION = 1
+
+
+def cached(*file_args, **kwargs):
+    """ Decorator to cache the return value of a function which depends on the contents of files.
+
+    Entries are keyed by the function, its arguments and the identity of the files, that is the path, size, modification
+    time and a checksum of the header. If any of these change the value is recomputed.
+
+    :param file_args: Names of the arguments which are paths of files the return value depends on.
+    :param related_files: Optional function which is called with the same arguments as the decorated function and
+        returns a list of additional files the return value depends on, such as indexes. Files which do not exist are
+        allowed.
+    """
+    related_files = kwargs.pop('related_files', None)
+
+    if len(kwargs) > 0:
+        raise Exception('Unknown arguments: {}'.format(', '.join(kwargs.keys())))
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_dir = get_cache_dir()
+
+            if cache_dir is None:
+                return func(*args, **kwargs)
+
+            call_args = inspect.getcallargs(func, *args, **kwargs)
+
+            file_names = [call_args[x] for x in file_args]
+
+            if related_files is not None:
+                file_names.extend(related_files(*args, **kwargs))
+
+            key = [VERSION, func.__module__, func.__name__, sorted(call_args.items())]
+
+            key.extend([get_file_id(x) for x in file_names])
+
+            cache_file = os.path.join(cache_dir, hashlib.md5(repr(key)).hexdigest() + '.pickle')
+
+            try:
+                with open(cache_file, 'rb') as fh:
+                    value = pickle.load(fh)
+
+                # Values are removed by the time they were last used
+                _touch(cache_file)
+
+                return value
+
+            except Exception:
+                pass
+
+            value = func(*args, **kwargs)
+
+            _write_cache_file(cache_file, value)
+
+            _evict(cache_dir)
+
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def get_cache_dir():
+    """ Get the directory where cached values are stored or None if caching is disabled.
+    """
+    cache_dir = os.environ.get('SOIL_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'soil'))
+
+    if cache_dir == '':
+        return None
+
+    return cache_dir
+
+
+def get_file_id(file_name):
+    """ Get a tuple identifying the contents of a file. Useful for detecting when a file has changed.
+
+    :param file_name: Path of file. Can be None or a path which does not exist.
+    :returns: A tuple of the absolute path, size, modification time and checksum of the first HEADER_SIZE bytes.
+    """
+    if file_name is None:
+        return None
+
+    file_name = os.path.abspath(file_name)
+
+    if not os.path.exists(file_name):
+        return (file_name, None)
+
+    stat = os.stat(file_name)
+
+    with open(file_name, 'rb') as fh:
+        checksum = hashlib.md5(fh.read(HEADER_SIZE)).hexdigest()
+
+    return (file_name, stat.st_size, stat.st_mtime, checksum)
+
+
+@contextlib.contextmanager
+def lock(lock_dir, poll_time=LOCK_POLL_TIME):
+    """ Hold a lock shared between processes on different hosts, using the creation of a directory which is atomic on
+    network file systems. The modification time of the directory is updated while the lock is held, so a lock left by a
+    process which died is taken over after :data:`STALE_LOCK_TIME` seconds however long the holder takes.
+
+    :param lock_dir: Path of the lock directory. The parent directory must exist.
+    :param poll_time: Seconds between checks of a lock held by another process.
+    """
+    while True:
+        try:
+            os.mkdir(lock_dir)
+
+            break
+
+        except OSError:
+            try:
+                if (time.time() - os.path.getmtime(lock_dir)) > STALE_LOCK_TIME:
+                    os.rmdir(lock_dir)
+
+                    continue
+
+            except OSError:
+                # Released by the other process
+                continue
+
+            time.sleep(poll_time)
+
+    stop = threading.Event()
+
+    thread = threading.Thread(target=_touch_lock, args=(lock_dir, stop))
+
+    thread.daemon = True
+
+    thread.start()
+
+    try:
+        yield
+
+    finally:
+        stop.set()
+
+        thread.join()
+
+        try:
+            os.rmdir(lock_dir)
+
+        except OSError:
+            pass
+
+
+def makedirs(dir_name):
+    """ Create a directory and its parents if they do not exist, allowing for other processes creating them at the same
+    time. Returns the path of the directory.
+
+    :param dir_name: Path of directory.
+    """
+    if not os.path.exists(dir_name):
+        try:
+            os.makedirs(dir_name)
+
+        except OSError:
+            # Created by another process
+            if not os.path.isdir(dir_name):
+                raise
+
+    return dir_name
+
+
+def _evict(cache_dir):
+    """ Remove cached values which have not been used recently, then the least recently used until the values fit in
+    :data:`MAX_CACHE_SIZE` bytes. Runs at most once every :data:`EVICT_TIME` seconds.
+    """
+    # Failing to clean the cache should never stop a workflow from being built
+    try:
+        evict_file = os.path.join(cache_dir, EVICT_FILE)
+
+        if os.path.exists(evict_file) and (time.time() - os.path.getmtime(evict_file) < EVICT_TIME):
+            return
+
+        open(evict_file, 'a').close()
+
+        _touch(evict_file)
+
+        now = time.time()
+
+        entries = []
+
+        for file_name in os.listdir(cache_dir):
+            # Left by processes which died while writing a value
+            if file_name.endswith('.tmp'):
+                file_name = os.path.join(cache_dir, file_name)
+
+                if now - os.path.getmtime(file_name) > EVICT_TIME:
+                    _remove(file_name)
+
+            elif file_name.endswith('.pickle'):
+                file_name = os.path.join(cache_dir, file_name)
+
+                stat = os.stat(file_name)
+
+                if now - stat.st_mtime > MAX_ENTRY_AGE:
+                    _remove(file_name)
+
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, file_name))
+
+        cache_size = sum(x[1] for x in entries)
+
+        for _, size, file_name in sorted(entries):
+            if cache_size <= MAX_CACHE_SIZE:
+                break
+
+            _remove(file_name)
+
+            cache_size -= size
+
+    except Exception:
+        pass
+
+
+def _remove(file_name):
+    # Removed by another process at the same time
+    try:
+        os.remove(file_name)
+
+    except OSError:
+        pass
+
+
+def _touch(file_name):
+    try:
+        os.utime(file_name, None)
+
+    except OSError:
+        pass
+
+
+def _touch_lock(lock_dir, stop):
+    stop.wait(LOCK_TOUCH_TIME)
+
+    while not stop.is_set():
+        try:
+            os.utime(lock_dir, None)
+
+        except OSError:
+            pass
+
+        stop.wait(LOCK_TOUCH_TIME)
+
+
+def _write_cache_file(cache_file, value):
+    # Failing to write the cache should never stop a workflow from being built
+    try:
+        cache_dir = os.path.dirname(cache_file)
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+
+        with os.fdopen(fd, 'wb') as fh:
+            pickle.dump(value, fh, pickle.HIGHEST_PROTOCOL)
+
+        os.rename(tmp_file, cache_file)
+
+    except Exception:
+        pass
@@ -1,8 +1,16 @@
 import click
 import functools
+import logging
 import os
 import pypeliner
 import shutil
+import sys
+
+import soil.utils.execqueue
+import soil.utils.history
+import soil.utils.plan
+import soil.utils.report
+import soil.utils.staging
 
 
 def runner(func):
@@ -10,37 +18,148 @@ def runner(func):
     """
     @functools.wraps(func)
     def func_wrapper(*args, **kwargs):
+        adaptive_mem = kwargs.pop('adaptive_mem')
+
+        array_jobs = kwargs.pop('array_jobs')
+
+        disk_budget = kwargs.pop('disk_budget')
+
+        local_scratch_dir = kwargs.pop('local_scratch_dir')
+
+        local_wall_time = kwargs.pop('local_wall_time')
+
+        max_mem = kwargs.pop('max_mem')
+
+        max_threads = kwargs.pop('max_threads')
+
         no_cleanup = kwargs.pop('no_cleanup')
 
+        plan = kwargs.pop('plan')
+
+        plan_axis_sizes = kwargs.pop('plan_axis_size')
+
+        priority = kwargs.pop('priority')
+
+        report_file = kwargs.pop('report_file')
+
+        if report_file is None:
+            report_file = _get_default_report_file(kwargs)
+
         resume = kwargs.pop('resume')
 
         save_working_dir = kwargs.pop('save_working_dir')
 
+        speculate = kwargs.pop('speculate')
+
         submit = kwargs.pop('submit')
 
+        task_cache_dir = kwargs.pop('task_cache_dir')
+
         if submit == 'qsub':
             submit = 'asyncqsub'
 
+        if array_jobs and (submit not in ('asyncqsub', 'drmaa')):
+            raise Exception('Array jobs can only be used with `--submit qsub` or `--submit drmaa` on grid engine.')
+
+        if (speculate is not None) and (submit != 'local') and (not array_jobs):
+            raise Exception('Duplicate jobs can only be started with `--submit local` or `--array-jobs`.')
+
         working_dir = kwargs.pop('working_dir')
 
-        if os.path.exists(working_dir) and (not resume):
-            raise Exception('''
-                Runner failing because working directory {} exists.
-                Either remove working directory or use --resume flag to resume an interrupted run.
-                '''.format(working_dir))
+        max_jobs = kwargs.pop('max_jobs')
+
+        pack_jobs = (submit == 'local') and ((max_threads is not None) or (max_mem is not None))
+
+        if pack_jobs:
+            host_threads, host_mem = soil.utils.execqueue.get_host_resources()
+
+            if max_threads is None:
+                max_threads = host_threads
+
+            if max_mem is None:
+                max_mem = host_mem
 
         config = {
-            'maxjobs': kwargs.pop('max_jobs'),
+            # The soil queues and grid engine limit the number of jobs which run, so the scheduler sends every ready job
+            'maxjobs': sys.maxsize if (array_jobs or pack_jobs or priority or (disk_budget is not None)) else max_jobs,
             'nativespec': kwargs.pop('native_spec'),
             'nocleanup': no_cleanup,
             'submit': submit,
             'tmpdir': working_dir,
         }
 
+        if plan:
+            workflow = func(*args, **kwargs)
+
+            _print_plan(workflow, plan_axis_sizes, report_file)
+
+            return
+
+        if os.path.exists(working_dir) and (not resume):
+            raise Exception('''
+                Runner failing because working directory {} exists.
+                Either remove working directory or use --resume flag to resume an interrupted run.
+                '''.format(working_dir))
+
         workflow = func(*args, **kwargs)
 
         pyp = pypeliner.app.Pypeline(config=config)
 
+        if array_jobs:
+            pyp.exec_queue = soil.utils.execqueue.ArrayJobQueue(
+                modules=pyp.modules, native_spec=config['nativespec'], max_running=max_jobs
+            )
+
+        elif speculate is not None:
+            pyp.exec_queue = soil.utils.execqueue.PollingLocalJobQueue(modules=pyp.modules)
+
+        if speculate is not None:
+            pyp.exec_queue = soil.utils.execqueue.SpeculativeJobQueue(pyp.exec_queue, multiple=speculate)
+
+        history = _load_history()
+
+        if priority:
+            priorities = _get_priorities(workflow, history)
+
+        else:
+            priorities = None
+
+        disk_kwargs = {'disk_budget': disk_budget, 'scratch_dir': working_dir, 'history': history}
+
+        if pack_jobs:
+            pyp.exec_queue = soil.utils.execqueue.ResourceJobQueue(
+                pyp.exec_queue, max_threads, max_mem, priorities=priorities, **disk_kwargs
+            )
+
+        elif priority or (disk_budget is not None):
+            # Array jobs are throttled by grid engine, so every job is let through to be grouped into arrays
+            pyp.exec_queue = soil.utils.execqueue.PriorityJobQueue(
+                pyp.exec_queue, max_jobs=(None if array_jobs else max_jobs), priorities=priorities, **disk_kwargs
+            )
+
+        if local_scratch_dir is not None:
+            pyp.exec_queue = soil.utils.staging.StagingJobQueue(pyp.exec_queue, local_scratch_dir)
+
+        if task_cache_dir is None:
+            env = None
+
+        else:
+            env = {'SOIL_TASK_CACHE_DIR': task_cache_dir}
+
+        # Jobs already run on the host with local submission
+        if (submit == 'local') or ((local_wall_time or 0) <= 0):
+            local_wall_time = None
+
+        if (report_file is not None) or (history is not None) or (env is not None):
+            pyp.exec_queue = soil.utils.execqueue.ProfilingJobQueue(
+                pyp.exec_queue,
+                report_file=report_file,
+                history=history,
+                adapt_mem=adaptive_mem,
+                env=env,
+                local_wall_time=local_wall_time
+            )
+
         pyp.run(workflow)
 
         if not save_working_dir:
@@ -50,11 +169,83 @@ def runner(func):
 
     func_wrapper = click.command(context_settings={'max_content_width': 120}, name=name)(func_wrapper)
 
+    # Keep the workflow function and its options separate from the runner options so soil-run batch can build it
+    func_wrapper.workflow_func = func
+
+    func_wrapper.workflow_params = list(func_wrapper.params)
+
     _add_runner_cli_args(func_wrapper)
 
     return func_wrapper
 
 
+def _load_history():
+    history_file = soil.utils.history.get_history_file()
+
+    if history_file is None:
+        return None
+
+    return soil.utils.history.MemoryHistory(history_file)
+
+
+def _get_priorities(workflow, history):
+    # Priorities only change the order jobs start, so a workflow which cannot be planned should still run
+    try:
+        return soil.utils.plan.get_priorities(workflow, history=history)
+
+    except Exception as e:
+        logging.getLogger('soil').warning('Failed to compute job priorities: {}'.format(e))
+
+        return None
+
+
+def _print_plan(workflow, plan_axis_sizes, report_file):
+    """ Print the jobs a workflow will run. The sizes of axes split by jobs are taken from the report of a previous run
+    if it exists, and can be overridden by the user.
+    """
+    axis_sizes = {}
+
+    if (report_file is not None) and os.path.exists(report_file):
+        axis_sizes.update(soil.utils.report.get_axis_sizes(report_file))
+
+    for value in plan_axis_sizes:
+        axis, size = _parse_axis_size(value)
+
+        axis_sizes[axis] = size
+
+    plan = soil.utils.plan.get_plan(workflow, axis_sizes=axis_sizes, history=_load_history())
+
+    click.echo(soil.utils.plan.format_plan(plan))
+
+
+def _parse_axis_size(value):
+    try:
+        axis, size = value.split('=')
+
+        return axis, int(size)
+
+    except ValueError:
+        raise click.BadParameter('Axis sizes should be of the form AXIS=SIZE not {}'.format(value))
+
+
+def _get_default_report_file(kwargs):
+    """ Guess where to write the run report from the output arguments of a runner. The report is written next to the
+    first output file, or inside the output directory.
+    """
+    for key in sorted(kwargs):
+        value = kwargs[key]
+
+        if (not key.startswith('out')) or (not isinstance(value, basestring)):
+            continue
+
+        if key.endswith('dir') or os.path.isdir(value):
+            return os.path.join(value, 'soil_report.tsv')
+
+        return value + '.soil_report.tsv'
+
+    return None
+
+
 def _add_runner_cli_args(func):
     """ Add standard pipeline arguments to command line interface for a runner function.
 
@@ -71,7 +262,28 @@ def _add_runner_cli_args(func):
 
     click.option(
         '-mj', '--max-jobs', default=1, type=int,
-        help='''Maximum number of jobs to run.'''
+        help='''Maximum number of jobs to run. With --array-jobs this is the maximum number of running tasks of each
+        array job.'''
+    )(func)
+
+    click.option(
+        '-mt', '--max-threads', default=None, type=int,
+        help='''Number of threads available when using `--submit local`. If this or --max-mem is set, jobs are started
+        whenever the threads and memory they request fit, instead of limiting the number of jobs with --max-jobs.
+        Defaults to the number of CPUs of the host if only --max-mem is set.'''
+    )(func)
+
+    click.option(
+        '-mm', '--max-mem', default=None, type=float,
+        help='''Memory in GB available when using `--submit local`. See --max-threads. Defaults to the memory of the
+        host if only --max-threads is set.'''
+    )(func)
+
+    click.option(
+        '-db', '--disk-budget', default=None, type=float,
+        help='''Space in GB the working directory may use. Jobs are held while the space used plus the space running
+        jobs are expected to write, from previous runs or the size of their inputs, would exceed it. Not limited by
+        default.'''
     )(func)
 
     click.option(
@@ -91,6 +303,21 @@ def _add_runner_cli_args(func):
         specified. See pypeliner documentation for details.'''
     )(func)
 
+    click.option(
+        '--array-jobs', is_flag=True,
+        help='''Set this flag to submit jobs of the same task with the same memory and thread requests, such as the jobs
+        of a task split over regions, as grid engine array jobs instead of one submission per job. Uses qsub, so works
+        with `--submit qsub` or `--submit drmaa`. The number of running tasks of each array is limited by grid engine
+        to --max-jobs.'''
+    )(func)
+
+    click.option(
+        '--speculate', default=None, type=float,
+        help='''Start a duplicate of a job once it has run this many times the median time of the finished jobs of its
+        task, and keep whichever copy finishes first. Useful when a few jobs of a scattered task land on slow nodes.
+        Works with `--submit local` or `--array-jobs`. Disabled by default.'''
+    )(func)
+
     click.option(
         '--resume', is_flag=True,
         help=' '.join([
@@ -110,6 +337,64 @@ def _add_runner_cli_args(func):
         help='''If set working directory will not be removed upon successful completion.'''
     )(func)
 
+    click.option(
+        '-rf', '--report-file', default=None, type=click.Path(resolve_path=True),
+        help='''Path where a report of the wall time, CPU time, peak memory and IO of every job will be written.
+        Defaults to a file named soil_report.tsv in the output directory, or the output file name with .soil_report.tsv
+        appended. Use soil-report to summarise.'''
+    )(func)
+
+    click.option(
+        '-tc', '--task-cache-dir', default=os.environ.get('SOIL_TASK_CACHE_DIR') or None,
+        type=click.Path(resolve_path=True),
+        help='''Directory where the outputs of expensive tasks such as alignment, sorting and index building are cached
+        by the checksums of their inputs, their arguments and package versions, so later runs on the same inputs reuse
+        them. Can be shared between users. This can be set globally through the SOIL_TASK_CACHE_DIR environment
+        variable. Disabled by default.'''
+    )(func)
+
+    click.option(
+        '-ls', '--local-scratch-dir', default=os.environ.get('SOIL_LOCAL_SCRATCH_DIR') or None,
+        help='''Directory on the nodes running jobs, such as '$TMPDIR', where temporary space used by tasks is placed
+        instead of the working directory. Environment variables are expanded on the node, so quote them. Jobs use the
+        working directory if it does not exist. This can be set globally through the SOIL_LOCAL_SCRATCH_DIR environment
+        variable.'''
+    )(func)
+
+    click.option(
+        '--local-wall-time', default=None, type=float,
+        help='''Run jobs of single threaded Python tasks without a conda sandbox which took at most this many seconds
+        and little memory in previous runs with inputs of a similar size on the host instead of submitting them to the
+        cluster, up to one job per CPU of the host at a time. Command line tools are always submitted. Disabled by
+        default.'''
+    )(func)
+
+    click.option(
+        '--priority/--fifo', default=False,
+        help='''Start ready jobs with the most work downstream of them first, using the wall times of previous runs or
+        the number of downstream jobs, or start jobs in the order they become ready. Defaults to --fifo.'''
+    )(func)
+
+    click.option(
+        '--plan', default=False, is_flag=True,
+        help='''If set the workflow is built and the number of jobs of each task, the requested threads and memory, and
+        an estimate of the critical path from the wall times of previous runs are printed. Nothing is run.'''
+    )(func)
+
+    click.option(
+        '--plan-axis-size', multiple=True, type=str,
+        help='''Number of chunks of an axis which is split by a job, such as kmer_group, as AXIS=SIZE. Used by --plan.
+        Defaults to the number of chunks in the report of a previous run if it exists, or one. Can be given multiple
+        times.'''
+    )(func)
+
+    click.option(
+        '--adaptive-mem/--static-mem', default=True,
+        help='''Set memory requests from the peak memory used by the same task with similar inputs in previous runs, or
+        use the static values from the workflow. The history is stored in SOIL_HISTORY_FILE or the soil cache directory.
+        Memory requests fall back to the static values when there is no history.'''
+    )(func)
+
 
 def parse_alignment_cli_args(fastq_files, library_id=None, read_group_ids=None, sample_id=None):
     """ Parse standard alignment arguments. Assumes paired end data which all comes from the same library.
@@ -0,0 +1,1610 @@
+"""
+Wrappers for pypeliner job queues. These wrap the queue created by pypeliner, so they work with any submission
+strategy. :class:`ArrayJobQueue` replaces the queue created by pypeliner for grid engine clusters.
+"""
+import getpass
+import hashlib
+import logging
+import math
+import multiprocessing
+import os
+import pipes
+import pypeliner.arguments
+import pypeliner.commandline
+import pypeliner.delegator
+import pypeliner.execqueue.base
+import pypeliner.execqueue.local
+import pypeliner.execqueue.utils
+import pypeliner.helpers
+import pypeliner.sandbox
+import resource
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+import soil.utils.history
+import soil.utils.report
+
+# Largest memory request in GB of jobs which are moved to the host by :class:`ProfilingJobQueue`.
+LOCAL_MAX_MEM = 2
+
+# Seconds between samples of the memory used by the processes of a job. Peaks between samples are caught by the peak
+# memory the kernel records for each process.
+MEM_SAMPLE_TIME = 5
+
+# Added to the names and temporary paths of duplicate jobs started by :class:`SpeculativeJobQueue`.
+SPECULATIVE_SUFFIX = '.speculative'
+
+# Prefix of the directories next to the outputs of a job where each copy of a job which can be duplicated writes them.
+COPY_DIR_PREFIX = '.soil_copy_'
+
+
+class ProfiledJob(object):
+    """ Wrapper for a job sent to a pypeliner queue which records the resources used by the job when it is called.
+
+    Attributes are forwarded to the wrapped job, so the wrapper can be used in place of the job by pypeliner. The
+    wrapper is pickled along with the job when it is sent to a compute node, so the resources are measured in the
+    process which runs the job. Each job is run by a fresh process, so the resource usage of the process is the usage
+    of the job. The peak memory is the largest sum of the resident memory of the process and its descendants while the
+    job runs, so tools run in a pipe at the same time are counted together.
+
+    :param job: The job sent to the queue.
+    :param env: Dictionary of environment variables to set in the process which runs the job, since cluster jobs do
+        not always inherit the environment of the runner.
+    """
+
+    def __init__(self, job, env=None):
+        self.__dict__['job'] = job
+
+        self.__dict__['env'] = env
+
+        self.__dict__['stats'] = None
+
+    def __getattr__(self, name):
+        # Avoid forwarding special methods pickle looks for, and recursing before the job is set when unpickling
+        if name.startswith('__') or ('job' not in self.__dict__):
+            raise AttributeError(name)
+
+        return getattr(self.__dict__['job'], name)
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+
+        else:
+            setattr(self.__dict__['job'], name, value)
+
+    def __call__(self):
+        if self.env is not None:
+            os.environ.update(self.env)
+
+        start_time = time.time()
+
+        start_cpu_time = _get_cpu_time()
+
+        start_io = _get_io_bytes()
+
+        sampler = _MemorySampler(os.getpid())
+
+        sampler.start()
+
+        try:
+            self.job()
+
+        finally:
+            sampler.stop()
+
+            end_io = _get_io_bytes()
+
+            if (start_io is None) or (end_io is None):
+                read_bytes, write_bytes = None, None
+
+            else:
+                read_bytes, write_bytes = [end - start for start, end in zip(start_io, end_io)]
+
+            self.stats = {
+                'start_time': start_time,
+                'wall_time': time.time() - start_time,
+                'cpu_time': _get_cpu_time() - start_cpu_time,
+                'max_rss': max(_get_max_rss(), sampler.max_rss / (1024.0 ** 3)),
+                'read_bytes': read_bytes,
+                'write_bytes': write_bytes,
+            }
+
+
+class ProfilingJobQueue(pypeliner.execqueue.base.JobQueue):
+    """ Queue which runs jobs from another queue wrapped in :class:`ProfiledJob`, appends the resources used by each
+    job to a report file and keeps a history of the peak memory used by each task.
+
+    If a history is given the memory request of a job is set from the memory used by previous jobs of the same task with
+    similar inputs. The `mem` value of the ctx is used if there is no relevant history. Retries of a job escalate the
+    prediction by the `mem_retry_factor` and `mem_retry_increment` of the ctx and never ask for less than the ctx, so
+    the retry settings of the ctx still apply if the history is wrong.
+
+    :param queue: The pypeliner queue to submit jobs to.
+    :param report_file: Path of report file or None. Records are appended so resumed runs are added to the same report.
+        See :mod:`soil.utils.report`.
+    :param history: A :class:`soil.utils.history.MemoryHistory` or None.
+    :param adapt_mem: If True the memory requests of jobs are set from the history.
+    :param env: Dictionary of environment variables to set in the processes which run jobs.
+    :param local_wall_time: If set, jobs of single threaded Python tasks without a sandbox which took at most this many
+        seconds and :data:`LOCAL_MAX_MEM` GB in previous runs with inputs of a similar size are run on the host instead
+        of being submitted, which avoids the submission latency for trivial tasks. Command line tasks and tasks run in
+        a conda environment are always submitted, as are retries. Requires a history.
+    :param max_local_jobs: Maximum number of jobs moved to the host which run at once. Further jobs are submitted as
+        usual. Defaults to the number of CPUs of the host.
+    """
+
+    def __init__(
+            self,
+            queue,
+            report_file=None,
+            history=None,
+            adapt_mem=True,
+            env=None,
+            local_wall_time=None,
+            max_local_jobs=None):
+
+        self.queue = queue
+
+        self.report_file = report_file
+
+        self.history = history
+
+        self.adapt_mem = adapt_mem
+
+        self.env = env
+
+        self.local_wall_time = local_wall_time
+
+        if max_local_jobs is None:
+            max_local_jobs = multiprocessing.cpu_count()
+
+        self.max_local_jobs = max_local_jobs
+
+        self.ctxs = {}
+
+        self.input_sizes = {}
+
+        self.local_names = set()
+
+        self.num_sent = {}
+
+    def __enter__(self):
+        self.queue.__enter__()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.queue.__exit__(exc_type, exc_value, traceback)
+
+    def send(self, ctx, name, sent, temps_dir):
+        if self.history is not None:
+            input_size = soil.utils.history.get_input_size(sent)
+
+            self.input_sizes[name] = input_size
+
+            if self.adapt_mem and ('mem' in ctx) and (not ctx.get('local', False)):
+                ctx = self._get_adapted_ctx(ctx, name, sent, input_size)
+
+            if (self.local_wall_time is not None) and (self.num_sent.get(name, 0) == 0):
+                ctx = self._get_local_ctx(ctx, name, sent, input_size)
+
+        self.num_sent[name] = self.num_sent.get(name, 0) + 1
+
+        self.ctxs[name] = ctx
+
+        self.queue.send(ctx, name, ProfiledJob(sent, env=self.env), temps_dir)
+
+    def wait(self, *args, **kwargs):
+        return self.queue.wait(*args, **kwargs)
+
+    def receive(self, name):
+        ctx = self.ctxs.pop(name, {})
+
+        input_size = self.input_sizes.pop(name, None)
+
+        self.local_names.discard(name)
+
+        received = self.queue.receive(name)
+
+        if not isinstance(received, ProfiledJob):
+            return received
+
+        # A problem with the report or history should not stop the workflow
+        try:
+            if self.report_file is not None:
+                soil.utils.report.write_record(self.report_file, name, received.job, received.stats, ctx)
+
+            if (self.history is not None) and received.finished and (received.stats is not None):
+                task_name, _ = soil.utils.report.get_job_task(received.job)
+
+                self.history.add(
+                    task_name,
+                    input_size,
+                    received.stats['max_rss'],
+                    wall_time=received.stats['wall_time'],
+                    write_bytes=received.stats['write_bytes']
+                )
+
+        except Exception as e:
+            logging.getLogger('soil').warning('Failed to record resources used by {0}: {1}'.format(name, e))
+
+        return received.job
+
+    @property
+    def length(self):
+        return self.queue.length
+
+    def _get_adapted_ctx(self, ctx, name, job, input_size):
+        task_name, _ = soil.utils.report.get_job_task(job)
+
+        mem = self.history.get_mem(task_name, input_size)
+
+        if mem is None:
+            return ctx
+
+        attempt = self.num_sent.get(name, 0)
+
+        # Retries are sent with the same name. Escalate the prediction as pypeliner escalates the ctx, since the job may
+        # have run out of the predicted memory, and fall back to the escalated ctx if it is larger.
+        if attempt > 0:
+            mem = mem * (ctx.get('mem_retry_factor', 1) ** attempt) + ctx.get('mem_retry_increment', 0) * attempt
+
+            mem = max(int(math.ceil(mem)), ctx['mem'])
+
+        ctx = dict(ctx)
+
+        ctx['mem'] = mem
+
+        return ctx
+
+    def _get_local_ctx(self, ctx, name, job, input_size):
+        if ctx.get('local', False) or (ctx.get('threads', 1) > 1) or (not _is_python_job(job)):
+            return ctx
+
+        # Jobs moved to the host are not counted by the queues which limit running jobs
+        if len(self.local_names) >= self.max_local_jobs:
+            return ctx
+
+        task_name, _ = soil.utils.report.get_job_task(job)
+
+        wall_time = self.history.get_wall_time(task_name, input_size)
+
+        mem = self.history.get_mem(task_name, input_size)
+
+        if (wall_time is None) or (wall_time > self.local_wall_time) or (mem is None) or (mem > LOCAL_MAX_MEM):
+            return ctx
+
+        ctx = dict(ctx)
+
+        ctx['local'] = True
+
+        self.local_names.add(name)
+
+        return ctx
+
+    @property
+    def empty(self):
+        return self.queue.empty
+
+
+class PriorityJobQueue(pypeliner.execqueue.base.JobQueue):
+    """ Queue which holds jobs sent by pypeliner and starts the ones with the most work downstream of them first, so
+    long chains of tasks are started before jobs which finish quickly.
+
+    The number of jobs this queue sends on to the wrapped queue is limited here rather than by the pypeliner scheduler,
+    so the scheduler should be allowed to send every ready job.
+
+    If a disk budget is given, jobs are also held while the space used in the scratch directory plus the space the
+    running jobs and the job are expected to write would exceed the budget. The space a job writes is predicted from
+    the history, or assumed to be the size of its inputs, less what the job has already written. Jobs are started when
+    nothing else is running, so a job larger than the budget still runs. pypeliner deletes temporary files once the
+    last job which uses them finishes, so the space used is measured again at the first send or wait after a job was
+    received, if jobs are held. Walking the scratch directory is slow on shared file systems, so in between the
+    measurement is kept and the estimates of jobs started since are added to it.
+
+    :param queue: The pypeliner queue to submit jobs to.
+    :param max_jobs: Maximum number of jobs to run at once.
+    :param priorities: Dictionary with task names as keys and priorities as values, as computed by
+        :func:`soil.utils.plan.get_priorities`. Tasks of sub workflows which are not in the dictionary use the priority
+        of the sub workflow, and other tasks the lowest priority. Jobs are started in the order they were sent if None.
+    :param disk_budget: Space in GB the scratch directory may use, or None for no limit.
+    :param scratch_dir: Directory whose size is limited by the disk budget, usually the working directory of the run.
+    :param history: A :class:`soil.utils.history.MemoryHistory` or None.
+    """
+
+    def __init__(self, queue, max_jobs=None, priorities=None, disk_budget=None, scratch_dir=None, history=None):
+        self.queue = queue
+
+        self.max_jobs = max_jobs
+
+        self.priorities = priorities
+
+        self.disk_budget = disk_budget
+
+        self.scratch_dir = scratch_dir
+
+        self.history = history
+
+        self.disk_estimates = {}
+
+        self.disk_stale = False
+
+        self.disk_used = None
+
+        self.pending = []
+
+        self.running = {}
+
+        self.running_jobs = {}
+
+    def __enter__(self):
+        self.queue.__enter__()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.queue.__exit__(exc_type, exc_value, traceback)
+
+    def send(self, ctx, name, sent, temps_dir):
+        if (self.disk_budget is not None) and (not ctx.get('local', False)):
+            self.disk_estimates[name] = self._get_disk_estimate(sent)
+
+        self.pending.append((self._get_priority(sent), ctx, name, sent, temps_dir))
+
+        # Stable sort, so jobs with the same priority are started in the order they were sent
+        self.pending.sort(key=lambda x: x[0], reverse=True)
+
+        self._send_pending()
+
+    def wait(self, *args, **kwargs):
+        # Temporary files of the last received job have been deleted by now, which may free space for held jobs
+        if self.disk_budget is not None:
+            self._send_pending()
+
+        return self.queue.wait(*args, **kwargs)
+
+    def receive(self, name):
+        self.running.pop(name, None)
+
+        self.running_jobs.pop(name, None)
+
+        self.disk_estimates.pop(name, None)
+
+        try:
+            return self.queue.receive(name)
+
+        finally:
+            # The estimate of the job stays in the measurement until then, which is conservative
+            self._send_pending()
+
+            # Measured again at the next send or wait, once pypeliner has deleted the temporary files of the job
+            self.disk_stale = True
+
+    @property
+    def length(self):
+        return self.queue.length + len(self.pending)
+
+    @property
+    def empty(self):
+        return self.length == 0
+
+    def _can_send(self, ctx):
+        if ctx.get('local', False):
+            return True
+
+        return (self.max_jobs is None) or (self._get_num_running() < self.max_jobs)
+
+    def _get_disk_estimate(self, sent):
+        input_size = soil.utils.history.get_input_size(sent)
+
+        if self.history is not None:
+            task_name, _ = soil.utils.report.get_job_task(sent)
+
+            write_bytes = self.history.get_write_bytes(task_name, input_size)
+
+            if write_bytes is not None:
+                return write_bytes
+
+        return input_size
+
+    def _get_num_running(self):
+        return len([x for x in self.running.values() if not x.get('local', False)])
+
+    def _get_priority(self, sent):
+        if self.priorities is None:
+            return ()
+
+        task_name, _ = soil.utils.report.get_job_task(sent)
+
+        # Sub workflows are not expanded when planning, so their tasks use the priority of the enclosing sub workflow
+        while task_name not in self.priorities:
+            if '/' not in task_name:
+                return ()
+
+            task_name = task_name.rsplit('/', 1)[0]
+
+        return self.priorities[task_name]
+
+    def _measure_disk(self):
+        """ Measure the space used in the scratch directory plus the space the running jobs are still expected to
+        write.
+        """
+        self.disk_used = _get_dir_size(self.scratch_dir)
+
+        for name, estimate in self.disk_estimates.items():
+            if name in self.running:
+                self.disk_used += max(0, estimate - _get_job_written_size(self.running_jobs[name]))
+
+        self.disk_stale = False
+
+    def _send_pending(self):
+        if (self.disk_budget is not None) and (len(self.pending) > 0) and ((self.disk_used is None) or self.disk_stale):
+            self._measure_disk()
+
+        pending = []
+
+        for priority, ctx, name, sent, temps_dir in self.pending:
+            disk_estimate = self.disk_estimates.get(name, 0)
+
+            if self._can_send(ctx) and self._fits_disk((self.disk_used or 0) + disk_estimate):
+                self.queue.send(ctx, name, sent, temps_dir)
+
+                self.running[name] = ctx
+
+                self.running_jobs[name] = sent
+
+                if self.disk_used is not None:
+                    self.disk_used += disk_estimate
+
+            else:
+                pending.append((priority, ctx, name, sent, temps_dir))
+
+        self.pending = pending
+
+    def _fits_disk(self, disk_used):
+        if (self.disk_budget is None) or (self._get_num_running() == 0):
+            return True
+
+        return disk_used <= (self.disk_budget * (1024 ** 3))
+
+
+class ResourceJobQueue(PriorityJobQueue):
+    """ Queue which starts jobs only when the threads and memory requested by their ctx fit in the totals of the host,
+    instead of limiting the number of jobs.
+
+    Jobs are started in order of priority, but smaller jobs are started ahead of larger ones which do not fit yet, so
+    the host is kept full. Jobs which request more than the host totals are started when nothing else is running. Jobs
+    with `local` set in their ctx, such as setting objects, are not counted.
+
+    :param queue: The pypeliner queue to submit jobs to.
+    :param max_threads: Number of threads of the host.
+    :param max_mem: Memory of the host in GB.
+    :param kwargs: Priorities and disk budget. See :class:`PriorityJobQueue`.
+    """
+
+    def __init__(self, queue, max_threads, max_mem, **kwargs):
+        super(ResourceJobQueue, self).__init__(queue, **kwargs)
+
+        self.max_threads = max_threads
+
+        self.max_mem = max_mem
+
+    def _can_send(self, ctx):
+        if ctx.get('local', False):
+            return True
+
+        used_threads, used_mem = 0, 0
+
+        for x in self.running.values():
+            threads, mem = self._get_resources(x)
+
+            used_threads += threads
+
+            used_mem += mem
+
+        threads, mem = self._get_resources(ctx)
+
+        return ((used_threads + threads) <= self.max_threads) and ((used_mem + mem) <= self.max_mem)
+
+    def _get_resources(self, ctx):
+        if ctx.get('local', False):
+            return 0, 0
+
+        # Jobs larger than the host can only run alone
+        threads = min(ctx.get('threads', 1), self.max_threads)
+
+        mem = min(ctx.get('mem', 0), self.max_mem)
+
+        return threads, mem
+
+
+class SpeculativeJob(object):
+    """ Wrapper for a copy of a job which can run at the same time as other copies of the job.
+
+    Each copy writes its outputs and logs to a directory of its own next to them, see :func:`_get_copy_filename`, so
+    the renames pypeliner does when a job finishes stay inside that directory. Only the copy which is kept has its
+    files moved into place, by :meth:`promote` when it is received, so a copy which finishes after another copy was
+    received never changes files downstream jobs have started to use. Copies use the same file names as the job, so
+    files tools write next to their outputs, such as indexes, are moved with them.
+
+    Attributes are forwarded to the wrapped job like :class:`ProfiledJob`.
+
+    :param job: The job sent to the queue.
+    :param copy_id: Identifier of the copy which is unique among the copies of all jobs. See :func:`_get_copy_id`.
+    :param temp_suffix: Added to the paths of the temporary space of the job.
+    """
+
+    def __init__(self, job, copy_id, temp_suffix=''):
+        self.__dict__['job'] = job
+
+        self.__dict__['copy_id'] = copy_id
+
+        self.__dict__['temp_suffix'] = temp_suffix
+
+        self.__dict__['filenames'] = None
+
+    def __getattr__(self, name):
+        if name.startswith('__') or ('job' not in self.__dict__):
+            raise AttributeError(name)
+
+        return getattr(self.__dict__['job'], name)
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+
+        else:
+            setattr(self.__dict__['job'], name, value)
+
+    def __call__(self):
+        stores = _get_job_stores(self.job)
+
+        self.filenames = [(x.filename, x.write_filename) for x in stores]
+
+        for store in stores:
+            store.filename = _get_copy_filename(store.filename, self.copy_id)
+
+            store.write_filename = _get_copy_filename(store.write_filename, self.copy_id)
+
+            pypeliner.helpers.makedirs(os.path.dirname(store.filename))
+
+        for arg in self.job.arglist:
+            if isinstance(arg, pypeliner.arguments.TempSpaceArg):
+                arg.filename += self.temp_suffix
+
+        self.job()
+
+    def cleanup(self):
+        """ Remove the files written by a copy which is not kept. Called on the copy sent to the queue, after the copy
+        has stopped.
+        """
+        for store in _get_job_stores(self.job):
+            shutil.rmtree(os.path.dirname(_get_copy_filename(store.filename, self.copy_id)), ignore_errors=True)
+
+        for arg in self.job.arglist:
+            if isinstance(arg, pypeliner.arguments.TempSpaceArg):
+                pypeliner.helpers.removefiledir(arg.filename + self.temp_suffix)
+
+    def promote(self):
+        """ Move the outputs and logs of the copy which is kept into place, along with any other files the job wrote
+        next to them. Called on the received copy.
+        """
+        if self.filenames is None:
+            return
+
+        copy_dirs = set()
+
+        for store, (filename, write_filename) in zip(_get_job_stores(self.job), self.filenames):
+            copy_dirs.update([os.path.dirname(store.filename), os.path.dirname(store.write_filename)])
+
+            store.filename = filename
+
+            store.write_filename = write_filename
+
+        for copy_dir in sorted(copy_dirs):
+            if not os.path.isdir(copy_dir):
+                continue
+
+            for file_name in os.listdir(copy_dir):
+                os.rename(os.path.join(copy_dir, file_name), os.path.join(os.path.dirname(copy_dir), file_name))
+
+            shutil.rmtree(copy_dir, ignore_errors=True)
+
+
+class SpeculativeJobQueue(pypeliner.execqueue.base.JobQueue):
+    """ Queue which starts a duplicate of a job which has run much longer than the finished jobs of its task, such as a
+    job of a scattered task which landed on a slow node, and keeps the result of whichever copy finishes first. The
+    other copy is deleted if the wrapped queue can delete it, otherwise its result is discarded, and its files are
+    removed once it stops.
+
+    Both the job and its duplicate are sent wrapped in :class:`SpeculativeJob`, so neither writes to the final paths of
+    the outputs until it is received. Jobs which create the chunks of an axis write files named by the job, so are
+    never duplicated. Duplicates are sent straight to the wrapped queue, so they are not counted by queues which wrap
+    this one, such as :class:`PriorityJobQueue`.
+
+    The wrapped queue must return None from `wait(immediate=True)` when no job has finished, and have `delete` and
+    `discard` methods to stop and forget the copy which did not finish first, such as :class:`PollingLocalJobQueue` and
+    :class:`ArrayJobQueue`.
+
+    :param queue: The pypeliner queue to submit jobs to.
+    :param multiple: Duplicate a job once it has run this many times the median time of the finished jobs of its task.
+    :param min_finished: Number of jobs of a task which must finish before jobs of the task are duplicated.
+    :param min_time: Seconds a job must run before it is duplicated.
+    :param poll_time: Seconds between checks for slow jobs.
+    """
+
+    def __init__(self, queue, multiple=3, min_finished=3, min_time=60, poll_time=10):
+        self.queue = queue
+
+        self.multiple = multiple
+
+        self.min_finished = min_finished
+
+        self.min_time = min_time
+
+        self.poll_time = poll_time
+
+        self.abandoned = set()
+
+        self.copies = {}
+
+        self.durations = {}
+
+        self.jobs = {}
+
+        self.results = {}
+
+        self.untracked = set()
+
+        self.wrappers = {}
+
+    def __enter__(self):
+        self.queue.__enter__()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.queue.__exit__(exc_type, exc_value, traceback)
+
+    def send(self, ctx, name, sent, temps_dir):
+        if ctx.get('local', False):
+            self.untracked.add(name)
+
+        else:
+            task_name, _ = soil.utils.report.get_job_task(sent)
+
+            can_duplicate = _can_duplicate(sent)
+
+            self.jobs[name] = {
+                'task_name': task_name,
+                'ctx': ctx,
+                'sent': sent,
+                'temps_dir': temps_dir,
+                'can_duplicate': can_duplicate,
+                'running': [name, ],
+                'start_times': {name: time.time()},
+            }
+
+            self.copies[name] = name
+
+            # The job may be duplicated later, so it has to write to a directory of its own from the start
+            if can_duplicate:
+                sent = SpeculativeJob(sent, _get_copy_id(name))
+
+                self.wrappers[name] = sent
+
+        self.queue.send(ctx, name, sent, temps_dir)
+
+    def wait(self):
+        while True:
+            copy_name = self.queue.wait(immediate=True)
+
+            if copy_name is None:
+                self._duplicate_slow_jobs()
+
+                time.sleep(self.poll_time)
+
+            elif copy_name in self.untracked:
+                return copy_name
+
+            else:
+                name = self._receive_copy(copy_name)
+
+                if name is not None:
+                    return name
+
+    def receive(self, name):
+        if name in self.untracked:
+            self.untracked.remove(name)
+
+            return self.queue.receive(name)
+
+        received, error = self.results.pop(name)
+
+        if error is not None:
+            raise error
+
+        return received
+
+    @property
+    def length(self):
+        return len(self.untracked) + len(self.jobs) + len(self.results)
+
+    @property
+    def empty(self):
+        return self.length == 0
+
+    def _duplicate_slow_jobs(self):
+        now = time.time()
+
+        for name, job in self.jobs.items():
+            # Only one duplicate is started for each job
+            if (not job['can_duplicate']) or (len(job['start_times']) > 1):
+                continue
+
+            durations = sorted(self.durations.get(job['task_name'], []))
+
+            if len(durations) < self.min_finished:
+                continue
+
+            median = durations[len(durations) // 2]
+
+            if (now - job['start_times'][name]) < max(self.min_time, self.multiple * median):
+                continue
+
+            copy_name = name + SPECULATIVE_SUFFIX
+
+            temps_dir = os.path.join(job['temps_dir'], 'speculative')
+
+            if not os.path.exists(temps_dir):
+                os.makedirs(temps_dir)
+
+            logging.getLogger('soil').info('Starting a duplicate of slow job {}'.format(name))
+
+            wrapper = SpeculativeJob(job['sent'], _get_copy_id(copy_name), temp_suffix=SPECULATIVE_SUFFIX)
+
+            self.wrappers[copy_name] = wrapper
+
+            self.queue.send(job['ctx'], copy_name, wrapper, temps_dir)
+
+            job['running'].append(copy_name)
+
+            job['start_times'][copy_name] = now
+
+            self.copies[copy_name] = name
+
+    def _receive_copy(self, copy_name):
+        """ Receive a finished copy of a job. Returns the name of the job if it has a result, or None if another copy
+        is still running.
+        """
+        name = self.copies.pop(copy_name)
+
+        wrapper = self.wrappers.pop(copy_name, None)
+
+        # The result of a deleted copy is never written, so it is discarded instead of received
+        if copy_name in self.abandoned:
+            self.abandoned.remove(copy_name)
+
+            self.queue.discard(copy_name)
+
+            _cleanup(wrapper)
+
+            return None
+
+        job = self.jobs[name]
+
+        job['running'].remove(copy_name)
+
+        try:
+            received = self.queue.receive(copy_name)
+
+            error = None
+
+        except pypeliner.execqueue.base.ReceiveError as e:
+            received = None
+
+            error = e
+
+        finished = (error is None) and getattr(received, 'finished', False)
+
+        # Wait for the other copy if this one failed
+        if (not finished) and (len(job['running']) > 0):
+            _cleanup(wrapper)
+
+            return None
+
+        for other_name in job['running']:
+            self.abandoned.add(other_name)
+
+            # The copy is discarded when it finishes if it cannot be deleted
+            try:
+                self.queue.delete(other_name)
+
+            except Exception as e:
+                logging.getLogger('soil').warning('Failed to delete {0}: {1}'.format(other_name, e))
+
+        if finished:
+            self.durations.setdefault(job['task_name'], []).append(time.time() - job['start_times'][copy_name])
+
+        if isinstance(received, SpeculativeJob):
+            received.promote()
+
+            received = received.job
+
+        else:
+            _cleanup(wrapper)
+
+        del self.jobs[name]
+
+        self.results[name] = (received, error)
+
+        return name
+
+
+class PollingLocalJobQueue(pypeliner.execqueue.local.LocalJobQueue):
+    """ Queue of jobs run on the host which polls the job processes, so `wait(immediate=True)` returns None when no job
+    has finished instead of waiting, and processes started by other queues are never reaped.
+
+    Each job is started in a session of its own, so deleting a job also stops the tools it started.
+    """
+
+    def __init__(self, modules=None, poll_time=1, **kwargs):
+        super(PollingLocalJobQueue, self).__init__(modules=modules, **kwargs)
+
+        self.poll_time = poll_time
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Jobs are not in the session of the runner, so they are not stopped with it
+        for name in list(self.jobs):
+            if name not in self.pid_returncodes:
+                self.delete(name)
+
+    def create(self, ctx, name, sent, temps_dir):
+        return SessionLocalJob(ctx, name, sent, temps_dir, self.modules)
+
+    def delete(self, name):
+        """ Stop a running job and the processes it started. It is still returned by :meth:`wait` when its process
+        exits.
+        """
+        try:
+            os.killpg(self.jobs[name].process.pid, signal.SIGTERM)
+
+        except OSError:
+            # Already exited
+            pass
+
+    def discard(self, name):
+        """ Forget a finished job without receiving it.
+        """
+        job = self.jobs.pop(name)
+
+        self.pid_returncodes.pop(name, None)
+
+        job.close_debug_files()
+
+    def wait(self, immediate=False):
+        while True:
+            for name, job in self.jobs.items():
+                if name in self.pid_returncodes:
+                    continue
+
+                returncode = job.process.poll()
+
+                if returncode is not None:
+                    self.pid_names.pop(job.process.pid, None)
+
+                    self.pid_returncodes[name] = returncode
+
+                    return name
+
+            if immediate:
+                return None
+
+            time.sleep(self.poll_time)
+
+
+class SessionLocalJob(pypeliner.execqueue.local.LocalJob):
+    """ Job run on the host by a process which leads a new session, so the job and the processes it starts can be
+    signalled together as a process group.
+    """
+
+    def __init__(self, ctx, name, sent, temps_dir, modules):
+        self.name = name
+
+        self.logger = logging.getLogger('pypeliner.execqueue')
+
+        self.delegated = pypeliner.delegator.Delegator(sent, os.path.join(temps_dir, 'job.dgt'), modules)
+
+        self.command = self.delegated.initialize()
+
+        self.debug_filenames = {
+            'job stdout': os.path.join(temps_dir, 'job.out'),
+            'job stderr': os.path.join(temps_dir, 'job.err'),
+        }
+
+        self.debug_files = []
+
+        try:
+            self.debug_files.append(open(self.debug_filenames['job stdout'], 'w'))
+
+            self.debug_files.append(open(self.debug_filenames['job stderr'], 'w'))
+
+            self.process = subprocess.Popen(
+                self.command, stdout=self.debug_files[0], stderr=self.debug_files[1], preexec_fn=os.setsid
+            )
+
+        except OSError as e:
+            self.close_debug_files()
+
+            error_text = '{0} submit failed\n'.format(name)
+
+            error_text += 'delegator command: {}\n'.format(' '.join(self.command))
+
+            error_text += '{}\n'.format(e)
+
+            error_text += pypeliner.execqueue.utils.log_text(self.debug_filenames)
+
+            self.logger.error(error_text)
+
+            raise pypeliner.execqueue.base.SubmitError()
+
+
+class ArrayJobQueue(pypeliner.execqueue.base.JobQueue):
+    """ Queue which submits jobs to a grid engine cluster as array jobs. Jobs of the same task sent with the same ctx,
+    such as the jobs of a task split over regions or chromosomes, are submitted together as one array job with a task
+    for each job. This replaces one submission per job, so the scheduler is not flooded when a task is split into
+    thousands of jobs.
+
+    Every ready job should be sent to this queue, with the number of running jobs limited by grid engine through
+    max_running rather than by the pypeliner scheduler, otherwise each array holds only the jobs freed by the last one
+    to finish. Jobs are held for up to batch_time seconds while arrays are running, so jobs which become ready one after
+    another as upstream jobs finish are submitted together. Each task of an array writes the exit code of its job to the
+    job temps directory, so jobs are received as soon as they finish rather than when the whole array finishes. Arrays
+    which have left the cluster are found with one call to qstat per poll. The exit codes of the last tasks of an array
+    may not be visible on the runner yet when it leaves qstat on file systems which cache attributes, such as NFS, so
+    tasks without an exit code are only treated as killed once the array has been missing for finish_polls polls. Jobs
+    with `local` set in their ctx are run on the host.
+
+    :param modules: Modules pypeliner imports before running jobs.
+    :param native_spec: Submission parameters. Special values are {mem} and {threads} which are filled from the ctx.
+    :param max_array_size: Maximum number of jobs in one array job.
+    :param max_running: Maximum number of tasks of each array which run at once, or None for no limit.
+    :param batch_time: Seconds a job is held to be submitted with jobs sent after it.
+    :param poll_time: Seconds between checks for finished jobs.
+    :param finish_polls: Number of polls an array must be missing from qstat before tasks without an exit code are
+        treated as killed.
+    """
+
+    def __init__(
+            self,
+            modules=None,
+            native_spec='',
+            max_array_size=1000,
+            max_running=None,
+            batch_time=10,
+            poll_time=5,
+            finish_polls=12):
+        self.modules = modules
+
+        self.native_spec = native_spec
+
+        self.max_array_size = max_array_size
+
+        self.max_running = max_running
+
+        self.batch_time = batch_time
+
+        self.poll_time = poll_time
+
+        self.finish_polls = finish_polls
+
+        self.qsub_bin = pypeliner.helpers.which('qsub')
+
+        self.qstat_bin = pypeliner.helpers.which('qstat')
+
+        self.user = getpass.getuser()
+
+        self.local_queue = PollingLocalJobQueue(modules)
+
+        self.name_islocal = {}
+
+        self.unsubmitted = []
+
+        self.unsubmitted_time = None
+
+        self.arrays = []
+
+        self.jobs = {}
+
+    def __enter__(self):
+        self.local_queue.__enter__()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.local_queue.__exit__(exc_type, exc_value, traceback)
+
+        for array in self.arrays:
+            array.delete()
+
+    def send(self, ctx, name, sent, temps_dir):
+        if ctx.get('local', False):
+            self.local_queue.send(ctx, name, sent, temps_dir)
+
+        else:
+            if len(self.unsubmitted) == 0:
+                self.unsubmitted_time = time.time()
+
+            self.unsubmitted.append((ctx, name, sent, temps_dir))
+
+    def wait(self, immediate=False):
+        while True:
+            self._submit()
+
+            if not self.local_queue.empty:
+                name = self.local_queue.wait(immediate=True)
+
+                if name is not None:
+                    self.name_islocal[name] = True
+
+                    return name
+
+            for name, job in self.jobs.items():
+                if job.finished:
+                    return name
+
+            self._update_arrays()
+
+            if immediate:
+                return None
+
+            time.sleep(self.poll_time)
+
+    def receive(self, name):
+        if self.name_islocal.pop(name, False):
+            return self.local_queue.receive(name)
+
+        job = self.jobs.pop(name)
+
+        job.finalize()
+
+        return job.received
+
+    def delete(self, name):
+        """ Stop a running job. It is still returned by :meth:`wait` when it stops.
+        """
+        if name in self.local_queue.jobs:
+            self.local_queue.delete(name)
+
+        elif name in self.jobs:
+            self.jobs[name].delete()
+
+    def discard(self, name):
+        """ Forget a finished job without receiving it.
+        """
+        if self.name_islocal.pop(name, False):
+            self.local_queue.discard(name)
+
+        else:
+            self.jobs.pop(name)
+
+    @property
+    def length(self):
+        return len(self.unsubmitted) + len(self.jobs) + self.local_queue.length
+
+    @property
+    def empty(self):
+        return self.length == 0
+
+    def _submit(self):
+        if len(self.unsubmitted) == 0:
+            return
+
+        # Nothing else can finish while no array is running, so waiting longer would only delay the jobs
+        if (len(self.arrays) > 0) and ((time.time() - self.unsubmitted_time) < self.batch_time):
+            return
+
+        groups = {}
+
+        for ctx, name, sent, temps_dir in self.unsubmitted:
+            task_name, _ = soil.utils.report.get_job_task(sent)
+
+            key = (task_name, repr(sorted(ctx.items())))
+
+            groups.setdefault(key, (ctx, []))[1].append((name, sent, temps_dir))
+
+        self.unsubmitted = []
+
+        size = self.max_array_size
+
+        for (task_name, _), (ctx, group) in sorted(groups.items()):
+            for i in range(0, len(group), size):
+                jobs = [ArrayTask(name, sent, temps_dir, self.modules) for name, sent, temps_dir in group[i:i + size]]
+
+                array = ArrayJob(task_name, ctx, jobs, self.qsub_bin, self.native_spec, max_running=self.max_running)
+
+                for idx, job in enumerate(jobs, 1):
+                    job.array = array
+
+                    job.index = idx
+
+                    self.jobs[job.name] = job
+
+                self.arrays.append(array)
+
+    def _update_arrays(self):
+        """ Mark the arrays which have not been listed by qstat for finish_polls polls, or whose tasks have all written
+        their exit code, as finished, so tasks which were killed before writing their exit code are received.
+        """
+        if len(self.arrays) == 0:
+            return
+
+        try:
+            output = subprocess.check_output([self.qstat_bin, '-u', self.user], universal_newlines=True)
+
+        except (OSError, subprocess.CalledProcessError) as e:
+            # Arrays are checked again at the next poll
+            logging.getLogger('soil').warning('Failed to check array jobs with qstat: {}'.format(e))
+
+            return
+
+        job_ids = set()
+
+        for line in output.splitlines():
+            fields = line.split()
+
+            # Skip the header
+            if (len(fields) > 0) and fields[0].isdigit():
+                job_ids.add(fields[0])
+
+        for array in self.arrays:
+            if array.job_id in job_ids:
+                array.missing_polls = 0
+
+                continue
+
+            array.missing_polls += 1
+
+            # Exit codes written by the last tasks may not be visible yet, so wait for them before assuming a kill
+            if (array.missing_polls >= self.finish_polls) or all(os.path.exists(x.exit_code_file) for x in array.jobs):
+                array.finished = True
+
+        self.arrays = [x for x in self.arrays if not x.finished]
+
+
+class ArrayJob(object):
+    """ Array job submitted with qsub. :class:`ArrayJobQueue` marks the array finished some time after it leaves the
+    cluster, which finds tasks which were killed before writing their exit code.
+    """
+
+    def __init__(self, task_name, ctx, jobs, qsub_bin, native_spec, max_running=None):
+        self.jobs = jobs
+
+        self.finished = False
+
+        self.missing_polls = 0
+
+        array_dir = jobs[0].temps_dir
+
+        self.script_file = os.path.join(array_dir, 'array.sh')
+
+        with open(self.script_file, 'w') as fh:
+            fh.write('#!/bin/sh\n')
+
+            fh.write('case "$SGE_TASK_ID" in\n')
+
+            for idx, job in enumerate(jobs, 1):
+                fh.write('{0}) {1} ;;\n'.format(idx, job.get_script()))
+
+            fh.write('esac\n')
+
+        pypeliner.helpers.set_executable(self.script_file)
+
+        self.submit_command = [qsub_bin, '-terse', '-b', 'y', '-t', '1-{}'.format(len(jobs))]
+
+        if max_running is not None:
+            self.submit_command += ['-tc', str(max_running)]
+
+        self.submit_command += native_spec.format(**ctx).split()
+
+        self.submit_command += ['-N', pypeliner.execqueue.utils.qsub_format_name(task_name)]
+
+        self.submit_command += ['-o', os.path.join(array_dir, 'array.out')]
+
+        self.submit_command += ['-e', os.path.join(array_dir, 'array.err')]
+
+        self.submit_command += [self.script_file]
+
+        try:
+            process = subprocess.Popen(
+                self.submit_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+            )
+
+            out, err = process.communicate()
+
+        except OSError as e:
+            out, err = '', str(e)
+
+            process = None
+
+        if (process is None) or (process.returncode != 0):
+            raise pypeliner.execqueue.base.SubmitError(
+                'Failed to submit {0}: {1}\n{2}'.format(task_name, ' '.join(self.submit_command), err)
+            )
+
+        # With -terse qsub prints only the id of the array and its task range, i.e. 123.1-10:1
+        self.job_id = out.strip().split('.')[0]
+
+    def delete(self):
+        """ Delete the array from the cluster if it is still running.
+        """
+        if not self.finished:
+            subprocess.call([pypeliner.helpers.which('qdel'), self.job_id])
+
+
+class ArrayTask(object):
+    """ Job run by one task of an array job.
+    """
+
+    def __init__(self, name, sent, temps_dir, modules):
+        self.name = name
+
+        self.temps_dir = temps_dir
+
+        self.array = None
+
+        self.index = None
+
+        self.received = None
+
+        self.delegated = pypeliner.delegator.Delegator(sent, os.path.join(temps_dir, 'job.dgt'), modules)
+
+        self.command = self.delegated.initialize()
+
+        self.debug_files = {
+            'job stdout': os.path.join(temps_dir, 'job.out'),
+            'job stderr': os.path.join(temps_dir, 'job.err'),
+        }
+
+        self.exit_code_file = os.path.join(temps_dir, 'job.exit_code')
+
+        for file_name in list(self.debug_files.values()) + [self.exit_code_file, ]:
+            pypeliner.helpers.saferemove(file_name)
+
+    @property
+    def finished(self):
+        return os.path.exists(self.exit_code_file) or self.array.finished
+
+    def delete(self):
+        """ Delete the task from the cluster if it is still running.
+        """
+        if self.finished:
+            return
+
+        subprocess.call([pypeliner.helpers.which('qdel'), self.array.job_id, '-t', str(self.index)])
+
+    def finalize(self):
+        exit_code = None
+
+        if os.path.exists(self.exit_code_file):
+            with open(self.exit_code_file, 'r') as fh:
+                exit_code = fh.read().strip()
+
+        # The exit code is missing if the task was killed, in which case the job did not write its result either
+        self.received = self.delegated.finalize()
+
+        if (exit_code not in ('0', None)) or (self.received is None) or (not self.received.started):
+            error_text = '{0} failed to complete with exit code {1}\n'.format(self.name, exit_code)
+
+            error_text += 'submit command: {}\n'.format(' '.join(self.array.submit_command))
+
+            error_text += pypeliner.execqueue.utils.log_text(self.debug_files)
+
+            logging.getLogger('pypeliner.execqueue').error(
+                error_text, extra={'id': self.name, 'status': 'fail', 'type': 'job'}
+            )
+
+            raise pypeliner.execqueue.base.ReceiveError(error_text)
+
+    def get_script(self):
+        """ Shell commands which run the job and write its exit code, renamed into place so it is never read partly
+        written.
+        """
+        tmp_file = self.exit_code_file + '.tmp'
+
+        return '{0} > {1} 2> {2}; echo $? > {3} && mv {3} {4}'.format(
+            ' '.join(pipes.quote(x) for x in self.command),
+            pipes.quote(self.debug_files['job stdout']),
+            pipes.quote(self.debug_files['job stderr']),
+            pipes.quote(tmp_file),
+            pipes.quote(self.exit_code_file)
+        )
+
+
+def _can_duplicate(job):
+    """ Check if a job can be run alongside a duplicate. Jobs which create the chunks of an axis name their output files
+    while running, so the files cannot be redirected.
+    """
+    if not all(hasattr(job, x) for x in ('arglist', 'stdout_storage', 'stderr_storage')):
+        return False
+
+    return not any(hasattr(arg, 'filename_callback') for arg in job.arglist)
+
+
+def _cleanup(wrapper):
+    if wrapper is not None:
+        wrapper.cleanup()
+
+
+def _get_copy_filename(file_name, copy_id):
+    """ Get the path a copy of a job writes a file to, in a directory of the copy next to the file.
+    """
+    return os.path.join(os.path.dirname(file_name), COPY_DIR_PREFIX + copy_id, os.path.basename(file_name))
+
+
+def _get_copy_id(name):
+    """ Get an identifier for a copy of a job from the name it is sent with, short enough to use in paths.
+    """
+    return hashlib.md5(name.encode('utf-8')).hexdigest()
+
+
+def _get_job_stores(job):
+    """ Get the file stores of the logs and outputs of a job.
+    """
+    return [job.stdout_storage, job.stderr_storage] + _get_output_stores(job)
+
+
+def _get_output_stores(job):
+    stores = []
+
+    for arg in job.arglist:
+        for res in arg.get_outputs():
+            store = getattr(res, 'store', None)
+
+            if store is not None:
+                stores.append(store)
+
+            stores.extend(getattr(res, 'extra_stores', []))
+
+    return stores
+
+
+def _is_python_job(job):
+    """ Check if a job calls a Python function outside a conda sandbox, rather than running a command line tool or
+    a function which may call tools from its environment.
+    """
+    func = getattr(job, 'func', None)
+
+    if (func is None) or (func is pypeliner.commandline.execute):
+        return False
+
+    # Sandboxes wrap the function in a closure over the sandbox
+    for cell in (getattr(func, '__closure__', None) or ()):
+        if isinstance(cell.cell_contents, pypeliner.sandbox.CondaSandbox):
+            return False
+
+    return True
+
+
+def get_host_resources():
+    """ Get the number of threads and the memory in GB of the host.
+    """
+    threads = multiprocessing.cpu_count()
+
+    mem = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024.0 ** 3)
+
+    return threads, mem
+
+
+def _get_dir_size(dir_name):
+    """ Get the space in bytes used by the files in a directory.
+    """
+    size = 0
+
+    for path, _, file_names in os.walk(dir_name):
+        for file_name in file_names:
+            try:
+                size += os.lstat(os.path.join(path, file_name)).st_blocks * 512
+
+            except OSError:
+                # Deleted while walking
+                pass
+
+    return size
+
+
+def _get_job_written_size(job):
+    """ Get the space in bytes used so far by the output files and temporary space of a running job.
+    """
+    if not hasattr(job, 'arglist'):
+        return 0
+
+    size = 0
+
+    for store in _get_output_stores(job):
+        for file_name in set([store.filename, store.write_filename]):
+            try:
+                size += os.lstat(file_name).st_blocks * 512
+
+            except OSError:
+                # Not written yet
+                pass
+
+    for arg in job.arglist:
+        if isinstance(arg, pypeliner.arguments.TempSpaceArg):
+            size += _get_dir_size(arg.filename)
+
+    return size
+
+
+def _get_cpu_time():
+    cpu_time = 0
+
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+
+        cpu_time += usage.ru_utime + usage.ru_stime
+
+    return cpu_time
+
+
+def _get_io_bytes():
+    """ Get the bytes read and written by this process and its finished children from the Linux /proc accounting.
+    Returns None if the accounting is not available.
+    """
+    io = {}
+
+    try:
+        with open('/proc/self/io', 'r') as fh:
+            for line in fh:
+                key, value = line.split(':')
+
+                io[key.strip()] = int(value)
+
+    except (IOError, OSError, ValueError):
+        return None
+
+    return io['read_bytes'], io['write_bytes']
+
+
+def _get_max_rss():
+    """ Peak resident memory of this process or the largest of its finished children in GB. This misses processes which
+    held memory at the same time, see :class:`_MemorySampler`, but catches peaks shorter than the sampling interval.
+    """
+    max_rss = max(resource.getrusage(x).ru_maxrss for x in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+    # Linux reports kB
+    return max_rss / (1024.0 * 1024.0)
+
+
+def _get_tree_rss(pid):
+    """ Get the summed resident memory in bytes of a process and its descendants from the Linux /proc file system.
+    Returns 0 if /proc is not available.
+    """
+    # Only the processes of the job are read if the kernel lists the children of each thread
+    if os.path.exists('/proc/{0}/task/{0}/children'.format(pid)):
+        pids = _get_tree_pids(pid)
+
+    else:
+        pids = _get_tree_pids_from_stat(pid)
+
+    total = 0
+
+    for x in pids:
+        try:
+            with open('/proc/{}/statm'.format(x), 'r') as fh:
+                total += int(fh.read().split()[1]) * resource.getpagesize()
+
+        except (IOError, OSError, IndexError, ValueError):
+            # Exited while walking
+            pass
+
+    return total
+
+
+def _get_tree_pids(pid):
+    """ Get the ids of a process and its descendants from the children files of their threads.
+    """
+    pids = []
+
+    stack = [pid, ]
+
+    while len(stack) > 0:
+        x = stack.pop()
+
+        pids.append(x)
+
+        try:
+            tids = os.listdir('/proc/{}/task'.format(x))
+
+        except OSError:
+            continue
+
+        for tid in tids:
+            try:
+                with open('/proc/{0}/task/{1}/children'.format(x, tid), 'r') as fh:
+                    stack.extend(int(y) for y in fh.read().split())
+
+            except (IOError, OSError):
+                # Exited while walking
+                pass
+
+    return pids
+
+
+def _get_tree_pids_from_stat(pid):
+    """ Get the ids of a process and its descendants by reading the parent of every process, for kernels without the
+    children files.
+    """
+    try:
+        all_pids = [int(x) for x in os.listdir('/proc') if x.isdigit()]
+
+    except OSError:
+        return []
+
+    children = {}
+
+    for x in all_pids:
+        try:
+            with open('/proc/{}/stat'.format(x), 'r') as fh:
+                stat = fh.read()
+
+        except (IOError, OSError):
+            # Exited while listing
+            continue
+
+        # The command name can contain spaces, so fields are counted from the parenthesis closing it
+        fields = stat[stat.rindex(')') + 2:].split()
+
+        children.setdefault(int(fields[1]), []).append(x)
+
+    pids = []
+
+    stack = [pid, ]
+
+    while len(stack) > 0:
+        x = stack.pop()
+
+        pids.append(x)
+
+        stack.extend(children.get(x, []))
+
+    return pids
+
+
+class _MemorySampler(object):
+    """ Background thread which samples the summed resident memory of a process and its descendants and keeps the peak
+    in bytes.
+    """
+
+    def __init__(self, pid, poll_time=MEM_SAMPLE_TIME):
+        self.pid = pid
+
+        self.poll_time = poll_time
+
+        self.max_rss = 0
+
+        self.stopped = threading.Event()
+
+        self.thread = threading.Thread(target=self._run)
+
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            self.max_rss = max(self.max_rss, _get_tree_rss(self.pid))
+
+            if self.stopped.wait(self.poll_time):
+                break
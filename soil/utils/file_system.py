@@ -1,4 +1,26 @@
+"""
+Locating files such as executables and config files installed in conda environments.
+
+Walking a conda environment on a network file system takes seconds, and tasks look up several files per job. When a
+sandbox creates or unpacks an environment it writes an index of the paths of every file in it with :func:`write_index`,
+so :func:`find` can look files up without walking the directory. Directories without an index are walked as before.
+
+Installing packages into a conda environment updates its conda-meta directory, so the index records the modification
+time of that directory and is ignored once it changes. Sandboxes write a new index the next time they use the
+environment. Directories which cannot be written, such as a store shared by another user, are left without an index.
+"""
+import json
 import os
+import tempfile
+
+# Name of the index file written in the root of an environment.
+INDEX_FILE = '.soil_file_index.json'
+
+# Version of the index format. Indexes written with other versions are ignored.
+INDEX_VERSION = 2
+
+# Indexes loaded by this process keyed by the directory they cover, or None if a directory has no index.
+_indexes = {}
 
 
 def find(name, path):
@@ -8,6 +30,125 @@ def find(name, path):
     :param path: Path to search for file in.
     :returns: Absolute path to the file.
     """
+    path = os.path.abspath(path)
+
+    index_dir, index = _load_index(path)
+
+    if index is not None:
+        # Paths are stored in the order os.walk visits them, so the first one under the path is the one a walk finds
+        for rel_path in index.get(name, []):
+            file_name = os.path.join(index_dir, rel_path)
+
+            if file_name.startswith(os.path.join(path, '')) and os.path.exists(file_name):
+                return file_name
+
+    # Files added after the index was written
     for root, _, files in os.walk(path):
         if name in files:
             return os.path.join(root, name)
+
+
+def has_current_index(path):
+    """ Check if a directory has an index which is up to date with the packages installed in it.
+
+    :param path: Path of directory.
+    """
+    path = os.path.abspath(path)
+
+    return _read_index(path) is not None
+
+
+def write_index(path):
+    """ Write an index of the files in a directory, such as a conda environment, for :func:`find`.
+
+    :param path: Path of directory to index.
+    :returns: True if the index was written or False if the directory cannot be written.
+    """
+    path = os.path.abspath(path)
+
+    files = {}
+
+    for root, _, file_names in os.walk(path):
+        for name in file_names:
+            files.setdefault(name, []).append(os.path.relpath(os.path.join(root, name), path))
+
+    index = {'version': INDEX_VERSION, 'stamp': _get_stamp(path), 'files': files}
+
+    # Write to a temporary file so jobs reading the index never see a partial file
+    try:
+        fd, tmp_file = tempfile.mkstemp(dir=path, suffix='.tmp')
+
+    except OSError:
+        return False
+
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(index, fh)
+
+        os.rename(tmp_file, os.path.join(path, INDEX_FILE))
+
+    except OSError:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+        return False
+
+    _indexes.pop(path, None)
+
+    return True
+
+
+def _get_stamp(path):
+    """ Get the modification time of the conda-meta directory of an environment, or None if the directory is not one.
+    """
+    meta_dir = os.path.join(path, 'conda-meta')
+
+    if not os.path.isdir(meta_dir):
+        return None
+
+    return os.stat(meta_dir).st_mtime
+
+
+def _load_index(path):
+    """ Load the index of the closest directory containing the path which has one. Returns the directory and the index,
+    or None for both if there is no index.
+    """
+    index_dir = path
+
+    while True:
+        if index_dir not in _indexes:
+            _indexes[index_dir] = _read_index(index_dir)
+
+        if _indexes[index_dir] is not None:
+            return index_dir, _indexes[index_dir]
+
+        parent_dir = os.path.dirname(index_dir)
+
+        if parent_dir == index_dir:
+            return None, None
+
+        index_dir = parent_dir
+
+
+def _read_index(path):
+    """ Read the files of the index of a directory. Returns None if there is no index or it is out of date.
+    """
+    index_file = os.path.join(path, INDEX_FILE)
+
+    if not os.path.exists(index_file):
+        return None
+
+    try:
+        with open(index_file, 'r') as fh:
+            index = json.load(fh)
+
+    except ValueError:
+        return None
+
+    if (not isinstance(index, dict)) or (index.get('version') != INDEX_VERSION):
+        return None
+
+    if index.get('stamp') != _get_stamp(path):
+        return None
+
+    return index['files']
@@ -1,6 +1,19 @@
+from __future__ import division
+
 from collections import OrderedDict
 
-import pysam
+import gzip
+import math
+import os
+import struct
+
+import soil.utils.cache
+
+# Largest coordinate supported by BAI indexes, used as the end of whole chromosome regions in BED files.
+MAX_COORD = 2 ** 29
+
+# Smallest region hotspots will be split into.
+MIN_HOTSPOT_REGION_SIZE = 1000
 
 
 def get_regions(chromosome_lengths, split_size):
@@ -36,13 +49,599 @@ def get_regions(chromosome_lengths, split_size):
     return regions
 
 
-def get_bam_regions(bam_file, split_size, chromosomes='default'):
+def _get_bam_index_files(bam_file, *args, **kwargs):
+    return [bam_file + '.bai', os.path.splitext(bam_file)[0] + '.bai', bam_file + '.csi']
+
+
+def _get_bam_regions_related_files(bam_file, split_size, chromosomes='default', ref_genome_fasta_file=None, **kwargs):
+    related_files = _get_bam_index_files(bam_file)
+
+    if ref_genome_fasta_file is not None:
+        related_files.append(get_gaps_file(ref_genome_fasta_file))
+
+    return related_files
+
+
+@soil.utils.cache.cached(
+    'bam_file',
+    'ref_genome_fasta_file',
+    'target_bed_file',
+    related_files=_get_bam_regions_related_files
+)
+def get_bam_regions(
+        bam_file,
+        split_size,
+        chromosomes='default',
+        ref_genome_fasta_file=None,
+        split_method='fixed',
+        target_bed_file=None,
+        hotspot_factor=None):
+    """ Split up the chromosomes of a BAM file into regions. Useful for parallelising tasks across a genome.
+
+    Chromosomes shorter than split_size, such as decoys and unplaced contigs, are packed together so that each region
+    covers up to split_size bases. These regions are returned as lists of region strings.
+
+    :param bam_file: Path of BAM file. Must be indexed if split_method is `coverage`.
+    :param split_size: Maximum length of regions for `fixed`, or average length of regions for `coverage`.
+    :param chromosomes: Chromosomes to use. See :func:`load_bam_chromosome_lengths`.
+    :param ref_genome_fasta_file: Path of reference genome FASTA file. If a gaps file built by `soil-ref index` exists
+        for the reference, region boundaries are moved into nearby assembly gaps and regions which are all N are
+        dropped.
+    :param split_method: Either `fixed` to cut chromosomes into regions of equal length or `coverage` to cut
+        chromosomes into regions with roughly equal read volume based on the BAM index.
+    :param target_bed_file: Path of BED file with target intervals, for example exome baits. If set the regions are
+        built from the targets using :func:`get_target_regions` and split_method is ignored.
+    :param hotspot_factor: If set, regions with more than hotspot_factor times the median read volume are split into
+        finer regions. See :func:`get_hotspot_regions`. The BAM file must be indexed.
+    :returns: A dictionary with keys being the numeric id of the region and values being the samtools style region
+        string or a list of region strings.
+    """
     chromosome_lengths = load_bam_chromosome_lengths(bam_file, chromosomes=chromosomes)
 
-    return get_regions(chromosome_lengths, split_size)
+    if target_bed_file is not None:
+        return get_target_regions(target_bed_file, split_size, chromosome_lengths=chromosome_lengths)
+
+    if split_method == 'coverage':
+        regions = get_coverage_regions(bam_file, chromosome_lengths, split_size)
+
+    elif split_method == 'fixed':
+        regions = get_regions(chromosome_lengths, split_size)
+
+    else:
+        raise Exception('Unknown split method: {}'.format(split_method))
+
+    if (ref_genome_fasta_file is not None) and (split_size is not None):
+        gaps = load_gaps(ref_genome_fasta_file)
+
+        if gaps is not None:
+            regions = snap_regions_to_gaps(regions, gaps, split_size // 10)
+
+    if split_size is not None:
+        regions = pack_small_chromosomes(regions, chromosome_lengths, split_size)
+
+    if hotspot_factor is not None:
+        regions, hotspot_regions = get_hotspot_regions(bam_file, regions, hotspot_factor)
+
+        regions.update(hotspot_regions)
+
+    return regions
+
+
+@soil.utils.cache.cached('bam_file', related_files=_get_bam_index_files)
+def get_hotspot_regions(bam_file, regions, hotspot_factor):
+    """ Find regions with unusually high read depth, such as the mitochondrial genome, satellite repeats and amplified
+    loci, and split them into finer regions. Useful to stop a few regions dominating the runtime of a workflow.
+
+    The read volume of each region is estimated from the BAM index. Regions with more than hotspot_factor times the
+    median volume are split into pieces with roughly the median volume. Index windows which have more than the median
+    volume on their own are split evenly, down to MIN_HOTSPOT_REGION_SIZE bases.
+
+    :param bam_file: Path of indexed BAM file.
+    :param regions: A dictionary with keys being the numeric id of the region and values being the samtools style region
+        string or a list of region strings. Regions which are lists are never split.
+    :param hotspot_factor: Regions with more than this multiple of the median volume are split.
+    :returns: A tuple of two dictionaries with disjoint keys. The first has the regions which were not split and the
+        second the regions from the hotspots. Sorting the union by key gives the regions in the original order.
+    """
+    window_size, volumes = load_bam_index_volumes(bam_file)
+
+    region_volumes = {}
+
+    for key, region in regions.iteritems():
+        if not isinstance(region, basestring):
+            continue
+
+        region_volumes[key] = sum(v for _, _, v in _get_region_windows(region, window_size, volumes))
+
+    median_volume = _get_median([x for x in region_volumes.values() if x > 0])
+
+    if median_volume is None:
+        return dict(regions), {}
+
+    new_regions = []
+
+    for key in sorted(regions):
+        if region_volumes.get(key, 0) <= hotspot_factor * median_volume:
+            new_regions.append((regions[key], False))
+
+            continue
+
+        for region in _split_hotspot(regions[key], window_size, volumes, median_volume):
+            new_regions.append((region, True))
+
+    normal_regions = {}
+
+    hotspot_regions = {}
+
+    for key, (region, is_hotspot) in enumerate(new_regions):
+        if is_hotspot:
+            hotspot_regions[key] = region
+
+        else:
+            normal_regions[key] = region
+
+    return normal_regions, hotspot_regions
+
+
+def _get_median(values):
+    if len(values) == 0:
+        return None
+
+    values = sorted(values)
+
+    return values[len(values) // 2]
+
+
+def _get_region_windows(region, window_size, volumes):
+    """ Get the parts of the index windows overlapping a region as tuples of start, end and volume. The volume of a
+    window which is partly covered is scaled by the covered fraction.
+    """
+    chrom, beg, end = parse_region(region)
+
+    chrom_volumes = volumes.get(chrom, [])
+
+    if beg is None:
+        beg, end = 1, len(chrom_volumes) * window_size
+
+    windows = []
+
+    for window_idx in range((beg - 1) // window_size, min((end - 1) // window_size + 1, len(chrom_volumes))):
+        window_beg = max(window_idx * window_size + 1, beg)
+
+        window_end = min((window_idx + 1) * window_size, end)
+
+        volume = chrom_volumes[window_idx] * (window_end - window_beg + 1) / window_size
+
+        windows.append((window_beg, window_end, volume))
+
+    return windows
+
+
+def _split_hotspot(region, window_size, volumes, target_volume):
+    chrom = parse_region(region)[0]
+
+    pieces = []
+
+    piece_beg = None
+
+    piece_volume = 0
+
+    for window_beg, window_end, volume in _get_region_windows(region, window_size, volumes):
+        if volume > target_volume:
+            if piece_beg is not None:
+                pieces.append((piece_beg, window_beg - 1))
+
+                piece_beg = None
+
+                piece_volume = 0
+
+            num_pieces = int(math.ceil(volume / target_volume))
+
+            num_pieces = max(min(num_pieces, (window_end - window_beg + 1) // MIN_HOTSPOT_REGION_SIZE), 1)
+
+            bounds = [window_beg + (window_end - window_beg + 1) * i // num_pieces for i in range(num_pieces + 1)]
+
+            for beg, end in zip(bounds[:-1], bounds[1:]):
+                pieces.append((beg, end - 1))
+
+            continue
+
+        if piece_beg is None:
+            piece_beg = window_beg
+
+        piece_volume += volume
+
+        if piece_volume >= target_volume:
+            pieces.append((piece_beg, window_end))
+
+            piece_beg = None
+
+            piece_volume = 0
+
+    if piece_beg is not None:
+        pieces.append((piece_beg, window_end))
+
+    return [format_region(chrom, beg, end) for beg, end in pieces]
+
+
+def pack_small_chromosomes(regions, chromosome_lengths, split_size):
+    """ Pack the regions of chromosomes shorter than split_size into shared regions. Useful to avoid one job per contig
+    on references with many small contigs.
+
+    :param regions: A dictionary with keys being the numeric id of the region and values being samtools style region
+        strings.
+    :param chromosome_lengths: Dictionary with chromosomes as keys and lengths as values.
+    :param split_size: Maximum total length of the regions packed into one region.
+    :returns: A dictionary with keys being the numeric id of the region and values being the samtools style region
+        string or a list of region strings for packed regions.
+
+    >>> pack_small_chromosomes(
+    ...     {0: '1:1-500', 1: '2:1-100', 2: '3:1-300', 3: '4:1-200'},
+    ...     {'1': 500, '2': 100, '3': 300, '4': 200},
+    ...     500
+    ... )
+    {0: '1:1-500', 1: ['2:1-100', '3:1-300'], 2: '4:1-200'}
+    """
+    packed_regions = {}
+
+    unit = []
+
+    unit_size = 0
+
+    for key in sorted(regions):
+        region = regions[key]
+
+        chrom, beg, end = parse_region(region)
+
+        is_small = (chromosome_lengths[chrom] < split_size)
+
+        if beg is None:
+            length = chromosome_lengths[chrom]
+
+        else:
+            length = end - beg + 1
+
+        if (len(unit) > 0) and ((not is_small) or (unit_size + length > split_size)):
+            packed_regions[len(packed_regions)] = _get_region_value(unit)
+
+            unit = []
+
+            unit_size = 0
+
+        if is_small:
+            unit.append(region)
+
+            unit_size += length
+
+        else:
+            packed_regions[len(packed_regions)] = region
+
+    if len(unit) > 0:
+        packed_regions[len(packed_regions)] = _get_region_value(unit)
+
+    return packed_regions
+
+
+def get_coverage_regions(bam_file, chromosome_lengths, split_size):
+    """ Split up chromosomes into regions with roughly equal read volume. Useful for balancing the runtime of tasks
+    parallelised across a genome.
+
+    The number of regions is the same as :func:`get_regions` would produce for the total length of the chromosomes, but
+    the cut points are placed using the per window data volume recorded in the BAM index. Regions never span
+    chromosomes.
+
+    :param bam_file: Path of indexed BAM file.
+    :param chromosome_lengths: Dictionary with chromosomes as keys and lengths as values.
+    :param split_size: Average length of the regions.
+    :returns: A dictionary with keys being the numeric id of the region and values being the samtools style region
+        string.
+    """
+    window_size, volumes = load_bam_index_volumes(bam_file)
+
+    num_regions = int(math.ceil(sum(chromosome_lengths.values()) / split_size))
+
+    total_volume = sum(sum(volumes.get(chrom, [])) for chrom in chromosome_lengths)
+
+    if (num_regions <= len(chromosome_lengths)) or (total_volume == 0):
+        return get_regions(chromosome_lengths, split_size)
+
+    target_volume = total_volume / num_regions
+
+    regions = {}
+
+    region_index = 0
+
+    for chrom, length in chromosome_lengths.iteritems():
+        beg = 1
+
+        volume = 0
+
+        for window_idx, window_volume in enumerate(volumes.get(chrom, [])):
+            end = min((window_idx + 1) * window_size, length)
+
+            volume += window_volume
+
+            if (volume >= target_volume) and (end < length):
+                regions[region_index] = '{}:{}-{}'.format(chrom, beg, end)
+
+                region_index += 1
+
+                beg = end + 1
+
+                volume = 0
+
+        regions[region_index] = '{}:{}-{}'.format(chrom, beg, length)
+
+        region_index += 1
+
+    return regions
+
+
+def get_target_regions(bed_file, split_size, chromosome_lengths=None, padding=100):
+    """ Split up target intervals into regions with roughly equal numbers of targeted bases. Useful for parallelising
+    tasks across an exome or panel.
+
+    :param bed_file: Path of BED file with target intervals.
+    :param split_size: Number of targeted bases per region. If None there is one region per chromosome.
+    :param chromosome_lengths: Dictionary with chromosomes as keys and lengths as values. If set only targets on these
+        chromosomes are used and padded targets are clipped to the chromosome ends.
+    :param padding: Number of bases to add to each side of a target before merging.
+    :returns: A dictionary with keys being the numeric id of the region and values being the samtools style region
+        string if the region has one interval or a list of region strings otherwise.
+    """
+    intervals = load_bed_intervals(bed_file, chromosome_lengths=chromosome_lengths, padding=padding)
+
+    regions = {}
+
+    unit = []
+
+    unit_size = 0
+
+    for idx, (chrom, beg, end) in enumerate(intervals):
+        unit.append(format_region(chrom, beg, end))
+
+        unit_size += end - beg + 1
+
+        if split_size is None:
+            is_full = (idx == len(intervals) - 1) or (intervals[idx + 1][0] != chrom)
+
+        else:
+            is_full = (unit_size >= split_size)
+
+        if is_full:
+            regions[len(regions)] = _get_region_value(unit)
+
+            unit = []
+
+            unit_size = 0
+
+    if len(unit) > 0:
+        regions[len(regions)] = _get_region_value(unit)
+
+    return regions
+
+
+def load_bed_intervals(bed_file, chromosome_lengths=None, padding=0):
+    """ Load, pad and merge the intervals in a BED file.
+
+    :param bed_file: Path of BED file.
+    :param chromosome_lengths: Dictionary with chromosomes as keys and lengths as values. If set only intervals on these
+        chromosomes are returned, in the same order as the dictionary, and intervals are clipped to the chromosome ends.
+    :param padding: Number of bases to add to each side of an interval before merging.
+    :returns: A list of tuples of chromosome, start and end. Coordinates are 1-based and inclusive.
+    """
+    raw_intervals = OrderedDict()
+
+    with open(bed_file, 'r') as fh:
+        for line in fh:
+            if line.startswith(('#', 'browser', 'track')) or (len(line.strip()) == 0):
+                continue
+
+            chrom, beg, end = line.strip().split('\t')[:3]
+
+            if (chromosome_lengths is not None) and (chrom not in chromosome_lengths):
+                continue
+
+            beg = max(int(beg) + 1 - padding, 1)
+
+            end = int(end) + padding
+
+            if chromosome_lengths is not None:
+                end = min(end, chromosome_lengths[chrom])
+
+            raw_intervals.setdefault(chrom, []).append((beg, end))
+
+    if chromosome_lengths is None:
+        chromosomes = raw_intervals.keys()
+
+    else:
+        chromosomes = [x for x in chromosome_lengths if x in raw_intervals]
+
+    intervals = []
+
+    for chrom in chromosomes:
+        merged = []
+
+        for beg, end in sorted(raw_intervals[chrom]):
+            if (len(merged) > 0) and (beg <= merged[-1][1] + 1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+
+            else:
+                merged.append((beg, end))
+
+        intervals.extend([(chrom, beg, end) for beg, end in merged])
+
+    return intervals
+
+
+def get_region_list(region):
+    """ Get the list of region strings for a value of a region plan, which can be a single region or a list of regions.
+
+    >>> get_region_list('1:1-500')
+    ['1:1-500']
+    """
+    if isinstance(region, basestring):
+        return [region, ]
+
+    return list(region)
+
+
+def write_regions_file(region, file_name, bed=False):
+    """ Write the regions of a value from a region plan to a file. Useful for tools which take a file of regions.
+
+    :param region: A region string or list of region strings.
+    :param file_name: Path where the file will be written.
+    :param bed: If True the file is written in BED format, otherwise there will be one samtools style region per line.
+    """
+    with open(file_name, 'w') as fh:
+        for region in get_region_list(region):
+            if bed:
+                chrom, beg, end = parse_region(region)
+
+                if beg is None:
+                    beg, end = 1, MAX_COORD
+
+                fh.write('{0}\t{1}\t{2}\n'.format(chrom, beg - 1, end))
+
+            else:
+                fh.write(region + '\n')
+
+
+def _get_region_value(regions):
+    if len(regions) == 1:
+        return regions[0]
+
+    return list(regions)
+
+
+def snap_regions_to_gaps(regions, gaps, max_shift):
+    """ Move region boundaries into assembly gaps and remove regions which only contain gaps.
+
+    Boundaries between neighbouring regions on a chromosome are moved to the nearest gap within max_shift bases, with
+    the gap itself excluded from both regions. Regions starting or ending inside a gap are trimmed and regions fully
+    inside a gap are dropped.
+
+    :param regions: A dictionary with keys being the numeric id of the region and values being samtools style region
+        strings. See :func:`get_regions`.
+    :param gaps: Dictionary with chromosomes as keys and lists of 0-based half open gap intervals as values. See
+        :func:`load_gaps`.
+    :param max_shift: Maximum distance a boundary will be moved.
+    :returns: A dictionary with keys being the numeric id of the region and values being the samtools style region
+        string.
+
+    >>> snap_regions_to_gaps({0: '1:1-500', 1: '1:501-1000', 2: '1:1001-1200'}, {'1': [(480, 520), (1000, 1200)]}, 50)
+    {0: '1:1-480', 1: '1:521-1000'}
+    """
+    parsed = [parse_region(regions[idx]) for idx in sorted(regions)]
+
+    for idx in range(len(parsed) - 1):
+        chrom, beg, end = parsed[idx]
+
+        next_chrom, next_beg, next_end = parsed[idx + 1]
+
+        if (chrom != next_chrom) or (end is None):
+            continue
+
+        best_gap = None
+
+        best_dist = max_shift + 1
+
+        for gap_beg, gap_end in gaps.get(chrom, []):
+            if (gap_beg < beg) or (gap_end >= next_end):
+                continue
+
+            dist = max(gap_beg - end, end - gap_end, 0)
+
+            if dist < best_dist:
+                best_gap = (gap_beg, gap_end)
+
+                best_dist = dist
+
+        if best_gap is not None:
+            parsed[idx] = (chrom, beg, best_gap[0])
+
+            parsed[idx + 1] = (next_chrom, best_gap[1] + 1, next_end)
+
+    snapped_regions = []
+
+    for chrom, beg, end in parsed:
+        if end is not None:
+            for gap_beg, gap_end in gaps.get(chrom, []):
+                if gap_beg < beg <= gap_end:
+                    beg = gap_end + 1
+
+                if gap_beg < end <= gap_end:
+                    end = gap_beg
+
+            if beg > end:
+                continue
+
+        snapped_regions.append(format_region(chrom, beg, end))
+
+    return dict(enumerate(snapped_regions))
+
+
+def format_region(chrom, beg=None, end=None):
+    """ Format a samtools style region string. Coordinates are 1-based and inclusive.
+    """
+    if beg is None:
+        return chrom
+
+    return '{}:{}-{}'.format(chrom, beg, end)
+
+
+def parse_region(region):
+    """ Parse a samtools style region string.
+
+    :returns: A tuple of chromosome, start and end. Start and end are None if the region is a whole chromosome.
+
+    >>> parse_region('1:1-500')
+    ('1', 1, 500)
+    """
+    if ':' in region:
+        chrom, coords = region.rsplit(':', 1)
+
+        if '-' in coords:
+            beg, end = coords.split('-')
+
+            return chrom, int(beg), int(end)
+
+    return region, None, None
 
 
+def get_gaps_file(ref_genome_fasta_file):
+    """ Path of the BED file of assembly gaps for a reference genome FASTA file.
+    """
+    return ref_genome_fasta_file + '.gaps.bed'
+
+
+def load_gaps(ref_genome_fasta_file):
+    """ Load the assembly gaps of a reference genome built by `soil-ref index`.
+
+    :param ref_genome_fasta_file: Path of reference genome FASTA file.
+    :returns: Dictionary with chromosomes as keys and lists of 0-based half open gap intervals as values. None if the
+        gaps file does not exist.
+    """
+    gaps_file = get_gaps_file(ref_genome_fasta_file)
+
+    if not os.path.exists(gaps_file):
+        return None
+
+    gaps = OrderedDict()
+
+    with open(gaps_file, 'r') as fh:
+        for line in fh:
+            chrom, beg, end = line.strip().split('\t')[:3]
+
+            gaps.setdefault(chrom, []).append((int(beg), int(end)))
+
+    return gaps
+
+
+@soil.utils.cache.cached('file_name')
 def load_bam_chromosome_lengths(file_name, chromosomes='default'):
+    import pysam
+
     chromosome_lengths = OrderedDict()
 
     bam = pysam.Samfile(file_name, 'rb')
@@ -75,3 +674,150 @@ def load_bam_chromosome_lengths(file_name, chromosomes='default'):
         chromosome_lengths[str(chrom)] = int(length)
 
     return chromosome_lengths
+
+
+def load_bam_index_volumes(bam_file):
+    """ Load the amount of read data per genomic window from the index of a BAM file.
+
+    The volume of a window is the number of compressed bytes of alignments starting in the window. This is proportional
+    to the number of reads in the window and can be computed without reading the BAM file. For BAI indexes the volume
+    comes from the linear index which has one entry per 16kb window. CSI indexes have no linear index, so the volume of
+    each bin is spread evenly over the windows it covers.
+
+    :param bam_file: Path of indexed BAM file.
+    :returns: A tuple with the size of the windows and a dictionary with chromosomes as keys and lists of window volumes
+        as values.
+    """
+    import pysam
+
+    index_file = _find_bam_index_file(bam_file)
+
+    if index_file.endswith('.csi'):
+        fh = gzip.open(index_file, 'rb')
+
+    else:
+        fh = open(index_file, 'rb')
+
+    try:
+        magic = fh.read(4)
+
+        if magic == 'BAI\1':
+            min_shift = 14
+
+            depth = 5
+
+        elif magic == 'CSI\1':
+            min_shift, depth, aux_size = _read_index_values(fh, '<3i')
+
+            fh.read(aux_size)
+
+        else:
+            raise Exception('Unknown BAM index format: {}'.format(index_file))
+
+        pseudo_bin = ((1 << (3 * depth + 3)) - 1) // 7 + 1
+
+        raw_volumes = []
+
+        num_refs, = _read_index_values(fh, '<i')
+
+        for _ in range(num_refs):
+            ref_end = None
+
+            ref_volumes = {}
+
+            num_bins, = _read_index_values(fh, '<i')
+
+            for _ in range(num_bins):
+                bin_id, = _read_index_values(fh, '<I')
+
+                if magic == 'CSI\1':
+                    fh.read(8)
+
+                num_chunks, = _read_index_values(fh, '<i')
+
+                chunks = _read_index_values(fh, '<{}Q'.format(2 * num_chunks))
+
+                if bin_id == pseudo_bin:
+                    ref_end = chunks[1]
+
+                elif magic == 'CSI\1':
+                    volume = sum(_get_chunk_volume(beg, end) for beg, end in zip(chunks[::2], chunks[1::2]))
+
+                    beg_window, end_window = _get_bin_windows(bin_id, depth)
+
+                    for window_idx in range(beg_window, end_window):
+                        ref_volumes[window_idx] = ref_volumes.get(window_idx, 0) + volume / (end_window - beg_window)
+
+            if magic == 'BAI\1':
+                num_intervals, = _read_index_values(fh, '<i')
+
+                offsets = list(_read_index_values(fh, '<{}Q'.format(num_intervals)))
+
+                if ref_end is not None:
+                    offsets.append(ref_end)
+
+                for window_idx, (beg, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+                    ref_volumes[window_idx] = _get_chunk_volume(beg, end)
+
+            raw_volumes.append(ref_volumes)
+
+    finally:
+        fh.close()
+
+    bam = pysam.AlignmentFile(bam_file, 'rb')
+
+    volumes = OrderedDict()
+
+    for chrom, length, ref_volumes in zip(bam.references, bam.lengths, raw_volumes):
+        num_windows = int(math.ceil(length / (1 << min_shift)))
+
+        volumes[str(chrom)] = [ref_volumes.get(i, 0) for i in range(num_windows)]
+
+    bam.close()
+
+    return 1 << min_shift, volumes
+
+
+def _find_bam_index_file(bam_file):
+    for index_file in [bam_file + '.bai', os.path.splitext(bam_file)[0] + '.bai', bam_file + '.csi']:
+        if os.path.exists(index_file):
+            return index_file
+
+    raise Exception('No BAI or CSI index found for {}'.format(bam_file))
+
+
+def _get_bin_windows(bin_id, depth):
+    """ Get the half open range of leaf level windows covered by a bin of a BAM index.
+    """
+    level = 0
+
+    while bin_id >= ((1 << (3 * (level + 1))) - 1) // 7:
+        level += 1
+
+    level_offset = ((1 << (3 * level)) - 1) // 7
+
+    num_windows = 1 << (3 * (depth - level))
+
+    beg = (bin_id - level_offset) * num_windows
+
+    return beg, beg + num_windows
+
+
+def _get_chunk_volume(chunk_beg, chunk_end):
+    """ Approximate the number of compressed bytes between two BGZF virtual offsets.
+
+    Chunks inside a single BGZF block only differ in the uncompressed offset, so these are scaled by a typical BAM
+    compression ratio.
+    """
+    compressed_volume = (chunk_end >> 16) - (chunk_beg >> 16)
+
+    if compressed_volume > 0:
+        return compressed_volume
+
+    return max((chunk_end & 0xffff) - (chunk_beg & 0xffff), 0) / 3
+
+
+def _read_index_values(fh, fmt):
+    size = struct.calcsize(fmt)
+
+    return struct.unpack(fmt, fh.read(size))
@@ -0,0 +1,246 @@
+"""
+History of the peak memory, wall time and bytes written by tasks. The peak memory is used to set memory requests for new
+jobs from previous runs instead of the static values in the workflow ctx, the wall time to estimate the run time of
+planned workflows, and the bytes written to estimate the scratch space jobs need.
+
+The history is stored in the file set by the SOIL_HISTORY_FILE environment variable, or history.tsv in the soil cache
+directory if it is not set. See :mod:`soil.utils.cache`. Runs share the file, so records are appended and the file is
+compacted while holding a lock next to it.
+"""
+from __future__ import division
+
+import csv
+import math
+import os
+
+import soil.utils.cache
+
+FIELDS = ['task_name', 'input_size', 'max_rss', 'wall_time', 'write_bytes']
+
+# Seconds between checks of the lock of the history file, which is only held while a record is appended or the file is
+# compacted.
+LOCK_POLL_TIME = 0.1
+
+# Number of most recent records to use per task.
+MAX_RECORDS = 100
+
+
+class MemoryHistory(object):
+    """ Observed peak memory, wall time and bytes written of tasks by input size.
+
+    Memory and bytes written are predicted from previous jobs of the same task with inputs of a similar size, or failing
+    that the jobs with the next largest inputs, so predictions are never based only on smaller jobs.
+
+    :param history_file: Path of history file. Records are appended as jobs finish, and the file is compacted to the
+        most recent :data:`MAX_RECORDS` records of each task when it is loaded.
+    :param margin: Factor to multiply the observed peak memory and bytes written by.
+    :param min_mem: Smallest memory request in GB.
+    """
+
+    def __init__(self, history_file, margin=1.2, min_mem=1):
+        self.history_file = history_file
+
+        self.margin = margin
+
+        self.min_mem = min_mem
+
+        self.records = {}
+
+        if os.path.exists(history_file):
+            fieldnames, num_rows = self._load()
+
+            # Older history files do not have all the fields, so rewrite them with the current fields before appending.
+            # Rewriting also drops records beyond the most recent of each task, so the file does not grow without bound.
+            if (fieldnames != FIELDS) or (num_rows > sum(len(x) for x in self.records.values())):
+                with self._lock():
+                    # Read again, since other runs may have appended records since
+                    self._load()
+
+                    self._write()
+
+    def add(self, task_name, input_size, max_rss, wall_time=None, write_bytes=None):
+        """ Add the peak memory, wall time and bytes written of a finished job.
+
+        :param task_name: Name of task. See :func:`soil.utils.report.get_job_task`.
+        :param input_size: Total size of the job input files in bytes.
+        :param max_rss: Peak memory of the job in GB.
+        :param wall_time: Wall time of the job in seconds.
+        :param write_bytes: Bytes written by the job.
+        """
+        self._add(task_name, input_size, max_rss, wall_time, write_bytes)
+
+        soil.utils.cache.makedirs(os.path.dirname(self.history_file))
+
+        # A record appended while another run compacts the file would be lost when the compacted file replaces it
+        with self._lock():
+            write_header = not os.path.exists(self.history_file)
+
+            with open(self.history_file, 'a') as fh:
+                writer = csv.DictWriter(fh, FIELDS, delimiter='\t')
+
+                if write_header:
+                    writer.writeheader()
+
+                writer.writerow({
+                    'task_name': task_name,
+                    'input_size': input_size,
+                    'max_rss': max_rss,
+                    'wall_time': wall_time,
+                    'write_bytes': write_bytes
+                })
+
+    def get_mem(self, task_name, input_size):
+        """ Predict the memory in GB needed for a job, or None if there is no relevant history.
+
+        :param task_name: Name of task. See :func:`soil.utils.report.get_job_task`.
+        :param input_size: Total size of the job input files in bytes.
+        """
+        similar = [x[1] for x in self._get_similar_records(task_name, input_size)]
+
+        if len(similar) == 0:
+            return None
+
+        return max(int(math.ceil(max(similar) * self.margin)), self.min_mem)
+
+    def get_write_bytes(self, task_name, input_size):
+        """ Predict the bytes a job will write, or None if there is no relevant history.
+
+        :param task_name: Name of task. See :func:`soil.utils.report.get_job_task`.
+        :param input_size: Total size of the job input files in bytes.
+        """
+        similar = [x[3] for x in self._get_similar_records(task_name, input_size) if x[3] is not None]
+
+        if len(similar) == 0:
+            return None
+
+        return int(math.ceil(max(similar) * self.margin))
+
+    def get_wall_time(self, task_name, input_size=None):
+        """ Get the longest recorded wall time in seconds of a task, or None if there is no relevant history.
+
+        The input sizes of jobs are usually not known before a workflow runs, so all records of the task are used unless
+        an input size is given.
+
+        :param task_name: Name of task. See :func:`soil.utils.report.get_job_task`.
+        :param input_size: Total size of the job input files in bytes. If set only jobs with inputs of a similar size
+            are used, as for :meth:`get_mem`.
+        """
+        if input_size is None:
+            records = self.records.get(task_name, [])
+
+        else:
+            records = self._get_similar_records(task_name, input_size)
+
+        wall_times = [x[2] for x in records if x[2] is not None]
+
+        if len(wall_times) == 0:
+            return None
+
+        return max(wall_times)
+
+    def _load(self):
+        """ Load the records of the history file. Returns the fields of the file and the number of records in it.
+        """
+        self.records = {}
+
+        num_rows = 0
+
+        with open(self.history_file, 'r') as fh:
+            reader = csv.DictReader(fh, delimiter='\t')
+
+            for row in reader:
+                num_rows += 1
+
+                self._add(
+                    row['task_name'],
+                    int(row['input_size']),
+                    float(row['max_rss']),
+                    _parse_optional(row.get('wall_time'), float),
+                    _parse_optional(row.get('write_bytes'), int)
+                )
+
+        return reader.fieldnames, num_rows
+
+    def _lock(self):
+        return soil.utils.cache.lock(self.history_file + '.lock', poll_time=LOCK_POLL_TIME)
+
+    def _write(self):
+        # Write to a temporary file so other runs never read a partial history
+        tmp_file = '{0}.{1}.tmp'.format(self.history_file, os.getpid())
+
+        with open(tmp_file, 'w') as fh:
+            writer = csv.DictWriter(fh, FIELDS, delimiter='\t')
+
+            writer.writeheader()
+
+            for task_name, records in sorted(self.records.items()):
+                for input_size, max_rss, wall_time, write_bytes in records:
+                    writer.writerow({
+                        'task_name': task_name,
+                        'input_size': input_size,
+                        'max_rss': max_rss,
+                        'wall_time': wall_time,
+                        'write_bytes': write_bytes
+                    })
+
+        os.rename(tmp_file, self.history_file)
+
+    def _add(self, task_name, input_size, max_rss, wall_time, write_bytes):
+        records = self.records.setdefault(task_name, [])
+
+        records.append((input_size, max_rss, wall_time, write_bytes))
+
+        if len(records) > MAX_RECORDS:
+            records.pop(0)
+
+    def _get_similar_records(self, task_name, input_size):
+        """ Get the records of previous jobs of a task with inputs of a similar size, or failing that the jobs with the
+        next largest inputs.
+        """
+        records = self.records.get(task_name, [])
+
+        similar = [x for x in records if (input_size / 2) <= x[0] <= (input_size * 2)]
+
+        if len(similar) == 0:
+            larger = [x[0] for x in records if x[0] >= input_size]
+
+            if len(larger) > 0:
+                similar = [x for x in records if x[0] == min(larger)]
+
+        return similar
+
+
+def get_history_file():
+    """ Get the path of the history file or None if the history is disabled.
+    """
+    if 'SOIL_HISTORY_FILE' in os.environ:
+        return os.environ['SOIL_HISTORY_FILE'] or None
+
+    cache_dir = soil.utils.cache.get_cache_dir()
+
+    if cache_dir is None:
+        return None
+
+    return os.path.join(cache_dir, 'history.tsv')
+
+
+def get_input_size(job):
+    """ Get the total size in bytes of the input files of a job sent to a pypeliner queue.
+    """
+    input_size = 0
+
+    for arg in job.arglist:
+        for resource in arg.get_inputs():
+            file_name = getattr(resource, 'filename', None)
+
+            if (file_name is not None) and os.path.isfile(file_name):
+                input_size += os.path.getsize(file_name)
+
+    return input_size
+
+
+def _parse_optional(value, type_):
+    if value in (None, ''):
+        return None
+
+    return type_(value)
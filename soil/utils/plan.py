@@ -0,0 +1,395 @@
+"""
+Plans of the jobs a workflow will run, used by the `--plan` option of runners to check the size of a run before it is
+submitted.
+
+Axes set with `setobj` when the workflow is built, such as the regions of the variant callers and the lanes of the
+aligners, have a known size. Axes split by jobs, such as the k-mer groups of the mappability workflow or the spectrum
+splits of MSGF+, are only known when the workflow runs. The sizes of these axes are taken from the report of a previous
+run or given by the user, and assumed to be one otherwise.
+"""
+from __future__ import division
+
+import pypeliner.jobs
+import pypeliner.managed as mgd
+import pypeliner.workflow
+
+INPUT_TYPES = (mgd.InputFile, mgd.TempInputFile, mgd.TempInputObj, mgd.TempInputObjExtract, mgd.InputChunks)
+
+OUTPUT_TYPES = (mgd.OutputFile, mgd.TempOutputFile, mgd.TempOutputObj, mgd.OutputChunks)
+
+
+def get_plan(workflow, axis_sizes=None, history=None, expand=True):
+    """ Get the jobs a workflow will run, expanding axes and sub workflows.
+
+    :param workflow: A pypeliner workflow.
+    :param axis_sizes: Dictionary with the names of axes split by jobs as keys and the number of chunks as values.
+    :param history: A :class:`soil.utils.history.MemoryHistory` used to look up the wall time of tasks, or None.
+    :param expand: If False sub workflows are counted as one job each instead of calling their functions to build them.
+    :returns: A dictionary with the list of tasks in the order they run, the estimated critical path in seconds, tasks
+        without a recorded wall time, axes with an assumed size and sub workflows which could not be expanded.
+    """
+    if axis_sizes is None:
+        axis_sizes = {}
+
+    plan = {
+        'tasks': [],
+        'critical_path': 0,
+        'missing_wall_time': [],
+        'assumed_axes': {},
+        'unexpanded': [],
+    }
+
+    plan['critical_path'], _ = _add_workflow(plan, workflow, [], 1, axis_sizes, history, expand)
+
+    return plan
+
+
+def get_priorities(workflow, history=None):
+    """ Get the priority of each task of a workflow from the work downstream of it, so jobs on long chains of tasks can
+    be started before jobs which finish quickly.
+
+    Sub workflows are not expanded, since building them calls their functions on the runner, which may read the inputs
+    of every sample of a batch before anything starts. Their tasks use the priority of the sub workflow, from its own
+    wall time and job count.
+
+    :param workflow: A pypeliner workflow.
+    :param history: A :class:`soil.utils.history.MemoryHistory` used to look up the wall time of tasks, or None.
+    :returns: A dictionary with task names as keys and tuples of the longest downstream path in seconds, including the
+        task, and the number of jobs on the longest downstream path as values. The number of jobs orders tasks without
+        a recorded wall time.
+    """
+    plan = get_plan(workflow, history=history, expand=False)
+
+    return dict((x['task_name'], (x['tail_time'], x['tail_jobs'])) for x in plan['tasks'])
+
+
+def format_plan(plan):
+    """ Format a plan from :func:`get_plan` as a table of tasks followed by a summary.
+    """
+    header = ['Task', 'Axes', 'Jobs', 'Threads', 'Mem (GB)', 'Wall time']
+
+    rows = []
+
+    for task in plan['tasks']:
+        rows.append([
+            task['task_name'] + (' (local)' if task['local'] else ''),
+            task['axes'],
+            '{:,}'.format(task['num_jobs']),
+            str(task['threads']),
+            '' if task['mem'] is None else str(task['mem']),
+            '' if task['wall_time'] is None else _format_time(task['wall_time']),
+        ])
+
+    widths = [max(len(x) for x in col) for col in zip(header, *rows)]
+
+    lines = []
+
+    for row in [header, ] + rows:
+        cols = [row[0].ljust(widths[0]), row[1].ljust(widths[1])]
+
+        cols.extend([x.rjust(w) for x, w in zip(row[2:], widths[2:])])
+
+        lines.append('  '.join(cols).rstrip())
+
+    lines.append('')
+
+    num_jobs = sum(x['num_jobs'] for x in plan['tasks'])
+
+    num_local_jobs = sum(x['num_jobs'] for x in plan['tasks'] if x['local'])
+
+    threads = sum(x['num_jobs'] * x['threads'] for x in plan['tasks'] if not x['local'])
+
+    mem = sum(x['num_jobs'] * x['mem'] for x in plan['tasks'] if (not x['local']) and (x['mem'] is not None))
+
+    lines.append('Total jobs: {:,} ({:,} local)'.format(num_jobs, num_local_jobs))
+
+    lines.append('Requested threads: {:,}'.format(threads))
+
+    lines.append('Requested memory: {:,} GB'.format(mem))
+
+    lines.append('Estimated critical path: {}'.format(_format_time(plan['critical_path'])))
+
+    if len(plan['missing_wall_time']) > 0:
+        lines.append('Tasks without a recorded wall time, not included in the critical path: {}'.format(
+            ', '.join(plan['missing_wall_time'])
+        ))
+
+    if len(plan['assumed_axes']) > 0:
+        lines.append('Axes split by jobs with assumed sizes: {}'.format(
+            ', '.join(['{}={}'.format(k, v) for k, v in sorted(plan['assumed_axes'].items())])
+        ))
+
+    for task_name, error in plan['unexpanded']:
+        lines.append('Sub workflow {} could not be expanded: {}'.format(task_name, error))
+
+    return '\n'.join(lines)
+
+
+def _add_workflow(plan, workflow, namespaces, num_parent_jobs, axis_sizes, history, expand):
+    """ Add the tasks of a workflow to a plan and return the critical path of the workflow in seconds and the number
+    of jobs on the longest path.
+    """
+    sizes = {}
+
+    objs = {}
+
+    job_defs = {}
+
+    for name, job_def in workflow.job_definitions.items():
+        if isinstance(job_def, pypeliner.jobs.SetObjDefinition):
+            _add_setobj(job_def, sizes, objs)
+
+        else:
+            job_defs[name] = job_def
+
+    inputs = {}
+
+    outputs = {}
+
+    for name, job_def in job_defs.items():
+        inputs[name], outputs[name] = _get_resources(job_def)
+
+        # Axes split by jobs rather than setobj
+        for axis in job_def.axes:
+            if axis not in sizes:
+                sizes[axis] = axis_sizes.get(axis, 1)
+
+                if axis not in axis_sizes:
+                    plan['assumed_axes'][axis] = 1
+
+    # Order tasks by the number of tasks upstream so the plan reads in the order the workflow runs
+    levels = _get_finish_times(dict((x, 1) for x in job_defs), inputs, outputs)
+
+    durations = {}
+
+    job_counts = {}
+
+    tasks = {}
+
+    for name in sorted(job_defs, key=lambda x: (levels[x], x)):
+        job_def = job_defs[name]
+
+        task_name = '/'.join(namespaces + [name, ])
+
+        num_jobs = num_parent_jobs
+
+        for axis in job_def.axes:
+            num_jobs *= sizes[axis]
+
+        if history is None:
+            wall_time = None
+
+        else:
+            wall_time = history.get_wall_time(task_name)
+
+        if wall_time is None:
+            plan['missing_wall_time'].append(task_name)
+
+        tasks[name] = {
+            'task_name': task_name,
+            'axes': '/'.join(job_def.axes),
+            'num_jobs': num_jobs,
+            'threads': job_def.ctx.get('threads', 1),
+            'mem': job_def.ctx.get('mem'),
+            'local': job_def.ctx.get('local', False),
+            'wall_time': wall_time,
+        }
+
+        plan['tasks'].append(tasks[name])
+
+        durations[name] = wall_time or 0
+
+        job_counts[name] = num_jobs
+
+        if expand and isinstance(job_def, pypeliner.jobs.SubWorkflowDefinition):
+            try:
+                sub_workflow = _build_sub_workflow(job_def, objs)
+
+            except Exception as e:
+                plan['unexpanded'].append((task_name, e))
+
+                continue
+
+            sub_duration, sub_job_count = _add_workflow(
+                plan, sub_workflow, namespaces + [name, ], num_jobs, axis_sizes, history, expand
+            )
+
+            durations[name] += sub_duration
+
+            job_counts[name] += sub_job_count
+
+    tail_times = _get_tail_times(durations, inputs, outputs)
+
+    tail_job_counts = _get_tail_times(job_counts, inputs, outputs)
+
+    for name, task in tasks.items():
+        task['tail_time'] = tail_times[name]
+
+        task['tail_jobs'] = tail_job_counts[name]
+
+        # Tasks of sub workflows were added relative to the sub workflow, so add the work after the sub workflow
+        prefix = task['task_name'] + '/'
+
+        for x in plan['tasks']:
+            if x['task_name'].startswith(prefix):
+                x['tail_time'] += tail_times[name] - durations[name]
+
+                x['tail_jobs'] += tail_job_counts[name] - job_counts[name]
+
+    critical_path = max([0, ] + list(_get_finish_times(durations, inputs, outputs).values()))
+
+    critical_job_count = max([0, ] + list(tail_job_counts.values()))
+
+    return critical_path, critical_job_count
+
+
+def _add_setobj(job_def, sizes, objs):
+    """ Record the axis size set by a setobj job, and a representative value of the object for building sub workflows.
+    """
+    obj = job_def.argset.ret
+
+    value = job_def.argset.args[0]
+
+    if len(obj.axes) > len(job_def.axes):
+        sizes[obj.axes[-1]] = len(value)
+
+        if isinstance(value, dict) and (len(value) > 0):
+            value = value[sorted(value)[0]]
+
+    objs[obj.name] = value
+
+
+def _build_sub_workflow(job_def, objs):
+    """ Call the function of a sub workflow job with managed arguments replaced by placeholders to get the workflow.
+    """
+    args = [_resolve_arg(x, job_def.axes, objs) for x in job_def.argset.args]
+
+    kwargs = dict((k, _resolve_arg(v, job_def.axes, objs)) for k, v in job_def.argset.kwargs.items())
+
+    # Sub workflows inherit the ctx of the job that creates them, see pypeliner.jobs.WorkflowCallable
+    parent_ctx = dict((k, v) for k, v in job_def.ctx.items() if k != 'local')
+
+    pypeliner.workflow.parent_ctx = parent_ctx
+
+    try:
+        return job_def.func(*args, **kwargs)
+
+    finally:
+        pypeliner.workflow.parent_ctx = None
+
+
+def _resolve_arg(arg, job_axes, objs):
+    if isinstance(arg, (list, tuple)):
+        return type(arg)(_resolve_arg(x, job_axes, objs) for x in arg)
+
+    elif isinstance(arg, dict):
+        return dict((k, _resolve_arg(v, job_axes, objs)) for k, v in arg.items())
+
+    elif isinstance(arg, (mgd.TempInputObj, mgd.TempInputObjExtract)):
+        if arg.name not in objs:
+            raise Exception('Object {} is not known until the workflow runs'.format(arg.name))
+
+        if isinstance(arg, mgd.TempInputObjExtract):
+            return arg.kwargs['func'](objs[arg.name])
+
+        return objs[arg.name]
+
+    elif isinstance(arg, (mgd.InputFile, mgd.OutputFile)):
+        if len(arg.axes) > len(job_axes):
+            raise Exception('Cannot expand sub workflow with a merged file {}'.format(arg.name))
+
+        return arg.kwargs.get('template', arg.name)
+
+    elif isinstance(arg, (mgd.InputChunks, mgd.InputInstance)):
+        raise Exception('Cannot expand sub workflow which depends on the chunks of an axis')
+
+    elif isinstance(arg, mgd.Managed):
+        return arg.name
+
+    return arg
+
+
+def _get_resources(job_def):
+    """ Get the keys of the resources a job reads and writes.
+    """
+    inputs = set()
+
+    outputs = set()
+
+    stack = list(job_def.argset.args) + list(job_def.argset.kwargs.values()) + [job_def.argset.ret, ]
+
+    while len(stack) > 0:
+        arg = stack.pop()
+
+        if isinstance(arg, (list, tuple)):
+            stack.extend(arg)
+
+        elif isinstance(arg, dict):
+            stack.extend(arg.values())
+
+        elif isinstance(arg, INPUT_TYPES):
+            inputs.add(_get_resource_key(arg))
+
+        elif isinstance(arg, OUTPUT_TYPES):
+            outputs.add(_get_resource_key(arg))
+
+    return inputs, outputs
+
+
+def _get_resource_key(arg):
+    # Chunks are identified by the split axis rather than a name
+    if isinstance(arg, (mgd.InputChunks, mgd.OutputChunks)):
+        return ('chunks', arg.axes[-1])
+
+    return arg.name
+
+
+def _get_finish_times(durations, inputs, outputs):
+    """ Get the time each job finishes if every job starts as soon as the jobs creating its inputs finish.
+    """
+    producers = {}
+
+    for name in durations:
+        for key in outputs[name]:
+            producers.setdefault(key, set()).add(name)
+
+    finish_times = {}
+
+    def get_finish_time(name, visiting):
+        if name not in finish_times:
+            visiting.add(name)
+
+            start_time = 0
+
+            for key in inputs[name]:
+                for producer in producers.get(key, ()):
+                    # Guard against cycles from jobs which update a resource in place
+                    if producer not in visiting:
+                        start_time = max(start_time, get_finish_time(producer, visiting))
+
+            visiting.discard(name)
+
+            finish_times[name] = start_time + durations[name]
+
+        return finish_times[name]
+
+    for name in durations:
+        get_finish_time(name, set())
+
+    return finish_times
+
+
+def _get_tail_times(durations, inputs, outputs):
+    """ Get the longest time from the start of each job to the end of the workflow, following the jobs which use its
+    outputs.
+    """
+    # Reversing the edges turns the time from the end of the workflow into a finish time
+    return _get_finish_times(durations, outputs, inputs)
+
+
+def _format_time(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+
+    hours, minutes = divmod(minutes, 60)
+
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
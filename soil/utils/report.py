@@ -0,0 +1,169 @@
+"""
+Run reports with the resources used by each job of a workflow. Reports are written by
+:class:`soil.utils.execqueue.ProfilingJobQueue` and summarised by the `soil-report` command.
+"""
+import csv
+import os
+
+FIELDS = [
+    'job_name',
+    'task_name',
+    'axes',
+    'host_name',
+    'finished',
+    'start_time',
+    'wall_time',
+    'cpu_time',
+    'max_rss',
+    'read_bytes',
+    'write_bytes',
+    'mem',
+    'threads',
+]
+
+
+def write_record(report_file, job_name, job, stats, ctx):
+    """ Append the resources used by a job to a report file.
+
+    :param report_file: Path of report file. The header is written if the file does not exist.
+    :param job_name: Name of job assigned by pypeliner.
+    :param job: Job received from a pypeliner queue.
+    :param stats: Dictionary of resources used by the job recorded by :class:`soil.utils.execqueue.ProfiledJob`. Can be
+        None if the job did not start.
+    :param ctx: Context the job was submitted with.
+    """
+    task_name, axes = get_job_task(job)
+
+    record = {
+        'job_name': job_name,
+        'task_name': task_name,
+        'axes': axes,
+        'host_name': getattr(job, 'hostname', None),
+        'finished': getattr(job, 'finished', False),
+        'mem': ctx.get('mem'),
+        'threads': ctx.get('threads', 1),
+    }
+
+    if stats is not None:
+        record.update(stats)
+
+    report_dir = os.path.dirname(report_file)
+
+    if not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+
+    write_header = not os.path.exists(report_file)
+
+    with open(report_file, 'a') as fh:
+        writer = csv.DictWriter(fh, FIELDS, delimiter='\t', extrasaction='ignore')
+
+        if write_header:
+            writer.writeheader()
+
+        writer.writerow(record)
+
+
+def get_job_task(job):
+    """ Get the task name and axes of a pypeliner job.
+
+    :param job: Job sent to or received from a pypeliner queue.
+    :returns: A tuple of the task name, including the names of sub workflows, and the axes of the job as a string of the
+        form `axis:chunk` separated by `/`.
+    """
+    node, name = job.id
+
+    namespaces = []
+
+    axes = []
+
+    for x in node:
+        if hasattr(x, 'axis'):
+            axes.append('{0}:{1}'.format(x.axis, x.chunk))
+
+        else:
+            namespaces.append(str(x))
+
+    return '/'.join(namespaces + [name, ]), '/'.join(axes)
+
+
+def get_axis_sizes(report_file):
+    """ Get the number of chunks of each axis in a report. Useful to estimate the size of axes which are split by jobs,
+    and so are not known until a workflow runs.
+
+    :param report_file: Path of report file.
+    :returns: A dictionary with axis names as keys and the mean number of chunks per chunk of the parent axes as values.
+    """
+    chunks = {}
+
+    with open(report_file, 'r') as fh:
+        for row in csv.DictReader(fh, delimiter='\t'):
+            axes = [x.split(':', 1) for x in row['axes'].split('/') if x != '']
+
+            for i, (axis, _) in enumerate(axes):
+                parent = tuple(tuple(x) for x in axes[:i])
+
+                chunks.setdefault(axis, {}).setdefault(parent, set()).add(tuple(axes[i]))
+
+    axis_sizes = {}
+
+    for axis, parent_chunks in chunks.items():
+        axis_sizes[axis] = int(round(sum(len(x) for x in parent_chunks.values()) / float(len(parent_chunks))))
+
+    return axis_sizes
+
+
+def load_report(report_file):
+    """ Load a report file as a DataFrame.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(report_file, sep='\t', converters={'axes': str})
+
+    df['axis'] = df['axes'].apply(lambda x: '/'.join([y.split(':')[0] for y in x.split('/') if y != '']))
+
+    return df
+
+
+def summarise_report(df, by_axis=False):
+    """ Summarise the resources used by each task in a report.
+
+    :param df: DataFrame loaded by :func:`load_report`.
+    :param by_axis: If True tasks are also grouped by the names of the axes they were split over.
+    :returns: A DataFrame with one row per task.
+    """
+    import pandas as pd
+
+    group_cols = ['task_name', ]
+
+    if by_axis:
+        group_cols.append('axis')
+
+    groups = df.groupby(group_cols)
+
+    summary = pd.DataFrame({
+        'num_jobs': groups.size(),
+        'num_failed': groups['finished'].apply(lambda x: (~x.astype(bool)).sum()),
+        'mean_wall_time': groups['wall_time'].mean(),
+        'max_wall_time': groups['wall_time'].max(),
+        'total_cpu_time': groups['cpu_time'].sum(),
+        'max_rss': groups['max_rss'].max(),
+        'max_mem': groups['mem'].max(),
+        'total_read_bytes': groups['read_bytes'].sum(),
+        'total_write_bytes': groups['write_bytes'].sum(),
+    })
+
+    summary = summary[[
+        'num_jobs',
+        'num_failed',
+        'mean_wall_time',
+        'max_wall_time',
+        'total_cpu_time',
+        'max_rss',
+        'max_mem',
+        'total_read_bytes',
+        'total_write_bytes',
+    ]]
+
+    summary = summary.sort_values(by='total_cpu_time', ascending=False)
+
+    return summary.reset_index()
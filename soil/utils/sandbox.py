@@ -0,0 +1,220 @@
+"""
+Conda sandboxes shared between runs.
+
+By default pypeliner creates the conda environments of a workflow inside its working directory, so every run solves and
+installs the same environments again. :class:`SharedCondaSandbox` creates them in a store shared by all runs instead,
+keyed by the sorted package set, and `soil-env prebuild` creates every environment used by the shipped workflows ahead
+of time.
+
+The store is the directory set by the SOIL_ENV_DIR environment variable, or the envs directory in the soil cache
+directory if it is not set. Set SOIL_ENV_DIR to an empty string to use the working directory. See
+:mod:`soil.utils.cache`.
+
+If relocatable archives of the environments have been created with `soil-env prebuild --archive` and the
+SOIL_ENV_LOCAL_DIR environment variable is set when a workflow is built, jobs unpack the archive to that directory on
+the node running them, usually a local disk, and use the local copy.
+
+An index of the files in each environment is written when it is created or unpacked, and again when packages have been
+added to it, so tasks locate the executables and config files they need with :func:`soil.utils.file_system.find`
+without walking the environment.
+"""
+import ast
+import functools
+import os
+import pypeliner.commandline as cli
+import shutil
+
+from pypeliner.sandbox import CondaSandbox
+
+import soil.utils.cache
+import soil.utils.file_system
+
+# File written to an unpacked environment once it is ready to use.
+READY_FILE = '.soil_ready'
+
+
+class SharedCondaSandbox(CondaSandbox):
+    """ Conda sandbox created in a store shared by all runs.
+
+    Creating an environment holds a lock in the store, so concurrent runs which need the same environment create it
+    once and the others wait for it.
+
+    :param local_dir: Directory on compute nodes where archived environments are unpacked. Defaults to the value of the
+        SOIL_ENV_LOCAL_DIR environment variable.
+    """
+
+    def __init__(self, channels=None, packages=None, pip_packages=None, local_dir=None):
+        # Sort so the environment is keyed by the package set and not the order packages were given
+        super(SharedCondaSandbox, self).__init__(
+            channels=sorted(channels or []),
+            packages=sorted(packages or []),
+            pip_packages=sorted(pip_packages or [])
+        )
+
+        if local_dir is None:
+            local_dir = os.environ.get('SOIL_ENV_LOCAL_DIR') or None
+
+        self.local_dir = local_dir
+
+    @property
+    def archive_file(self):
+        if self.prefix is None:
+            return None
+
+        return self.prefix + '.tar.gz'
+
+    def create_archive(self):
+        """ Create a relocatable archive of the environment with conda-pack, if it does not exist.
+        """
+        if os.path.exists(self.archive_file):
+            return False
+
+        tmp_file = self.archive_file + '.tmp'
+
+        cli.execute('conda', 'pack', '--force', '--prefix', self.prefix, '--output', tmp_file)
+
+        os.rename(tmp_file, self.archive_file)
+
+        return True
+
+    def create_conda_env(self, env_dir):
+        store_dir = get_env_store_dir()
+
+        if store_dir is None:
+            created = super(SharedCondaSandbox, self).create_conda_env(env_dir)
+
+            self._write_file_index()
+
+            return created
+
+        soil.utils.cache.makedirs(store_dir)
+
+        prefix = os.path.join(store_dir, self._get_prefix())
+
+        # Avoid taking the lock once the environment exists
+        if os.path.exists(os.path.join(prefix, 'sandbox_config.yaml')):
+            self.prefix = prefix
+
+            # Environments created before indexes were written or with packages added since
+            self._write_file_index()
+
+            return False
+
+        with soil.utils.cache.lock(prefix + '.lock'):
+            # Left by a process which died while creating the environment
+            if os.path.exists(prefix) and (not os.path.exists(os.path.join(prefix, 'sandbox_config.yaml'))):
+                shutil.rmtree(prefix)
+
+            created = super(SharedCondaSandbox, self).create_conda_env(store_dir)
+
+            self._write_file_index()
+
+            return created
+
+    def wrap_function(self, func):
+        wrapped_func = super(SharedCondaSandbox, self).wrap_function(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self._use_local_copy()
+
+            return wrapped_func(*args, **kwargs)
+
+        return wrapper
+
+    def _use_local_copy(self):
+        """ Switch to a copy of the environment on the local disk of the node, unpacking the archive if needed.
+        """
+        if (self.local_dir is None) or (self.prefix is None) or (not os.path.exists(self.archive_file)):
+            return
+
+        local_prefix = os.path.join(self.local_dir, os.path.basename(self.prefix))
+
+        if not os.path.exists(os.path.join(local_prefix, READY_FILE)):
+            soil.utils.cache.makedirs(self.local_dir)
+
+            with soil.utils.cache.lock(local_prefix + '.lock'):
+                if not os.path.exists(os.path.join(local_prefix, READY_FILE)):
+                    if os.path.exists(local_prefix):
+                        shutil.rmtree(local_prefix)
+
+                    os.makedirs(local_prefix)
+
+                    cli.execute('tar', '-xzf', self.archive_file, '-C', local_prefix)
+
+                    # Paths in conda environments are absolute, so fix them for the new location
+                    cli.execute(os.path.join(local_prefix, 'bin', 'conda-unpack'))
+
+                    soil.utils.file_system.write_index(local_prefix)
+
+                    open(os.path.join(local_prefix, READY_FILE), 'w').close()
+
+        self.prefix = local_prefix
+
+    def _write_file_index(self):
+        # Stores of other users may be read only, in which case tasks walk the environment
+        if not soil.utils.file_system.has_current_index(self.prefix):
+            soil.utils.file_system.write_index(self.prefix)
+
+
+class NoSandbox(object):
+    """ Sandbox which runs a task in the environment of the runner.
+
+    pypeliner uses the default sandbox of the workflow for tasks whose sandbox is None, so pure Python tasks of a
+    workflow with a default sandbox use this to run without activating a conda environment.
+    """
+
+    # Logged by pypeliner as the name of the sandbox, as for tasks of workflows without a sandbox
+    prefix = 'root'
+
+    def create_conda_env(self, env_dir):
+        return False
+
+    def wrap_function(self, func):
+        return func
+
+
+def get_env_store_dir():
+    """ Get the directory where shared conda environments are stored or None if environments are not shared.
+    """
+    if 'SOIL_ENV_DIR' in os.environ:
+        return os.environ['SOIL_ENV_DIR'] or None
+
+    cache_dir = soil.utils.cache.get_cache_dir()
+
+    if cache_dir is None:
+        return None
+
+    return os.path.join(cache_dir, 'envs')
+
+
+def get_workflow_package_sets():
+    """ Find the package sets used by the shipped workflows from the calls to :func:`soil.utils.workflow.get_sandbox`
+    in the soil source.
+
+    :returns: A sorted list of tuples of package names.
+    """
+    soil_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    package_sets = set()
+
+    for dir_name, _, file_names in os.walk(soil_dir):
+        for file_name in file_names:
+            if not file_name.endswith('.py'):
+                continue
+
+            with open(os.path.join(dir_name, file_name), 'r') as fh:
+                tree = ast.parse(fh.read())
+
+            for node in ast.walk(tree):
+                if not isinstance(node, ast.Call) or (len(node.args) != 1):
+                    continue
+
+                func_name = getattr(node.func, 'attr', getattr(node.func, 'id', None))
+
+                if (func_name == 'get_sandbox') and isinstance(node.args[0], (ast.List, ast.Tuple)):
+                    names = [x.s for x in node.args[0].elts if isinstance(x, ast.Str)]
+
+                    package_sets.add(tuple(sorted(names)))
+
+    return sorted(package_sets)
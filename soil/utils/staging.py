@@ -0,0 +1,115 @@
+"""
+Placing the temporary space of jobs on storage local to the node which runs the job.
+
+The working directory of a run is usually on a shared file system, so tasks which do a lot of random IO in their
+temporary space, such as sorting and duplicate marking, are limited by the network. If a local scratch directory is
+set, jobs wrapped by :class:`StagingJobQueue` place their `mgd.TempSpace` directories there instead, and remove them
+when the job finishes. Input and output files stay in the working directory.
+
+The local scratch directory can contain environment variables such as $TMPDIR, which are expanded on the node running
+the job. Jobs run as usual if the directory does not exist on the node.
+"""
+import os
+import pypeliner.arguments
+import pypeliner.execqueue.base
+import shutil
+import tempfile
+
+
+class StagedJob(object):
+    """ Wrapper for a job sent to a pypeliner queue which places the temporary space of the job on local storage when it
+    is called.
+
+    Attributes are forwarded to the wrapped job, so the wrapper can be used in place of the job by pypeliner.
+
+    :param job: The job sent to the queue.
+    :param local_dir: Directory on the node running the job where temporary space is placed.
+    """
+
+    def __init__(self, job, local_dir):
+        self.__dict__['job'] = job
+
+        self.__dict__['local_dir'] = local_dir
+
+    def __getattr__(self, name):
+        # Avoid forwarding special methods pickle looks for, and recursing before the job is set when unpickling
+        if name.startswith('__') or ('job' not in self.__dict__):
+            raise AttributeError(name)
+
+        return getattr(self.__dict__['job'], name)
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+
+        else:
+            setattr(self.__dict__['job'], name, value)
+
+    def __call__(self):
+        local_dir = os.path.expandvars(self.local_dir)
+
+        if not os.path.isdir(local_dir):
+            return self.job()
+
+        stage_dir = tempfile.mkdtemp(prefix='soil_stage_', dir=local_dir)
+
+        try:
+            self._stage(stage_dir)
+
+            self.job()
+
+        finally:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+
+    def _stage(self, stage_dir):
+        for idx, arg in enumerate(self.job.arglist):
+            if isinstance(arg, pypeliner.arguments.TempSpaceArg):
+                arg.filename = os.path.join(stage_dir, str(idx), os.path.basename(arg.filename))
+
+
+class StagingJobQueue(pypeliner.execqueue.base.JobQueue):
+    """ Queue which wraps the jobs sent to another queue in :class:`StagedJob`.
+
+    :param queue: The pypeliner queue to submit jobs to.
+    :param local_dir: Directory on the nodes running jobs where temporary space is placed.
+    """
+
+    def __init__(self, queue, local_dir):
+        self.queue = queue
+
+        self.local_dir = local_dir
+
+    def __enter__(self):
+        self.queue.__enter__()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.queue.__exit__(exc_type, exc_value, traceback)
+
+    def send(self, ctx, name, sent, temps_dir):
+        # Local jobs run on the host, which is not where the scratch directory is meant to be
+        if (not ctx.get('local', False)) and hasattr(sent, 'arglist'):
+            sent = StagedJob(sent, self.local_dir)
+
+        self.queue.send(ctx, name, sent, temps_dir)
+
+    def wait(self, *args, **kwargs):
+        return self.queue.wait(*args, **kwargs)
+
+    def receive(self, name):
+        received = self.queue.receive(name)
+
+        if isinstance(received, StagedJob):
+            received = received.job
+
+        return received
+
+    @property
+    def length(self):
+        return self.queue.length
+
+    @property
+    def empty(self):
+        return self.queue.empty
+
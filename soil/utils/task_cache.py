@@ -0,0 +1,313 @@
+"""
+Content addressed cache of the output files of expensive tasks, shared between runs.
+
+The working directory of a run is deleted when it finishes, so re-running a wrapper on the same inputs recomputes every
+task. Tasks decorated with :func:`cached_task` store their outputs under a key computed from the checksums of their
+input files, the source of the module defining the task, the other arguments and the versions of the conda packages
+the task runs. Later jobs with the same key link or copy the stored outputs instead of running the task. Changes to
+helpers the task imports from other modules are not detected, so bump the `version` of the task when they change its
+outputs.
+
+The cache is opt-in. It is enabled by setting the SOIL_TASK_CACHE_DIR environment variable to a directory, which can be
+shared between users. The `--task-cache-dir` option of runners sets this for the jobs of a run. Stored files are read
+only copies of the outputs, and outputs restored from the cache are hard linked to them when possible.
+
+Jobs which compute the same entry at the same time, such as the index builds of a reference shared by the samples of a
+batch, hold a lock in the cache so one job runs the task and the others wait to reuse its outputs.
+"""
+import contextlib
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import tempfile
+
+import soil.utils.cache
+import soil.utils.conda
+
+# Number of bytes read at a time when computing checksums.
+BLOCK_SIZE = 2 ** 20
+
+# Increment to invalidate existing cache entries if the layout of the cache changes.
+VERSION = 1
+
+
+def cached_task(inputs, outputs, packages=(), ignore=('tmp_dir', 'threads'), related_outputs=None, version=0):
+    """ Decorator to cache the output files of a task.
+
+    :param inputs: Names of the arguments which are input files. Values can be paths or collections of paths.
+    :param outputs: Names of the arguments which are output files.
+    :param packages: Names of the packages in :data:`soil.utils.conda.packages` the task uses.
+    :param ignore: Names of arguments which do not change the outputs, such as temporary directories and threads.
+    :param related_outputs: Optional function which is called with the same arguments as the decorated function and
+        returns a list of paths of additional files it creates, such as indexes written alongside an output.
+    :param version: Increment to invalidate the entries of the task when its outputs change without a change to the
+        module defining it, such as a change to a helper imported from another module.
+    """
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_dir = get_task_cache_dir()
+
+            if cache_dir is None:
+                return func(*args, **kwargs)
+
+            call_args = inspect.getcallargs(func, *args, **kwargs)
+
+            key = _get_key(func, call_args, inputs, outputs, packages, ignore, version, cache_dir)
+
+            entry_dir = os.path.join(cache_dir, 'entries', key[:2], key)
+
+            out_files = [call_args[x] for x in outputs]
+
+            if related_outputs is not None:
+                out_files.extend(related_outputs(*args, **kwargs))
+
+            if _restore_entry(entry_dir, out_files):
+                return
+
+            with _lock(entry_dir + '.lock'):
+                # Stored by the job which held the lock
+                if _restore_entry(entry_dir, out_files):
+                    return
+
+                func(*args, **kwargs)
+
+                _store_entry(cache_dir, entry_dir, out_files)
+
+        return wrapper
+
+    return decorator
+
+
+def get_task_cache_dir():
+    """ Get the directory where task outputs are cached or None if the cache is disabled.
+    """
+    return os.environ.get('SOIL_TASK_CACHE_DIR') or None
+
+
+def get_checksum(file_name, cache_dir):
+    """ Get the MD5 checksum of a file. Checksums are stored in the cache directory by path, size and modification time
+    so each version of a file is only read once.
+
+    :param file_name: Path of file.
+    :param cache_dir: Path of task cache directory.
+    """
+    file_name = os.path.abspath(file_name)
+
+    stat = os.stat(file_name)
+
+    file_id = (file_name, stat.st_size, stat.st_mtime)
+
+    checksum_file = os.path.join(cache_dir, 'checksums', hashlib.md5(repr(file_id)).hexdigest())
+
+    if os.path.exists(checksum_file):
+        with open(checksum_file, 'r') as fh:
+            return fh.read().strip()
+
+    md5 = hashlib.md5()
+
+    with open(file_name, 'rb') as fh:
+        for block in iter(lambda: fh.read(BLOCK_SIZE), b''):
+            md5.update(block)
+
+    checksum = md5.hexdigest()
+
+    try:
+        _write_file(checksum_file, checksum)
+
+    except Exception:
+        pass
+
+    return checksum
+
+
+def _get_key(func, call_args, inputs, outputs, packages, ignore, version, cache_dir):
+    """ Compute the key of a call from the task code, the arguments which are not files, the checksums of the input
+    files and the versions of the packages.
+    """
+    params = []
+
+    for name, value in sorted(call_args.items()):
+        if (name in inputs) or (name in outputs) or (name in ignore):
+            continue
+
+        params.append((name, _normalise(value)))
+
+    checksums = []
+
+    for name in inputs:
+        checksums.append((name, [get_checksum(x, cache_dir) for x in _get_file_names(call_args[name])]))
+
+    package_versions = []
+
+    for name in packages:
+        package = soil.utils.conda.packages[name]
+
+        package_versions.append((package.channel, package.name, package.version))
+
+    key = [
+        VERSION,
+        func.__module__,
+        func.__name__,
+        version,
+        _get_source_checksum(func),
+        params,
+        checksums,
+        package_versions,
+    ]
+
+    return hashlib.md5(repr(key)).hexdigest()
+
+
+def _get_file_names(value):
+    """ Get a list of paths from an argument which is a path, or a list or dict of paths as passed by pypeliner for
+    merges.
+    """
+    if value is None:
+        return []
+
+    elif isinstance(value, dict):
+        return [value[x] for x in sorted(value)]
+
+    elif isinstance(value, (list, tuple)):
+        return list(value)
+
+    return [value, ]
+
+
+def _get_source_checksum(func):
+    """ Get the checksum of the source of the module defining a function, so changes to the helpers and constants the
+    function uses, such as the command lines it builds, invalidate entries. Falls back to the code of the function if
+    the source is not available.
+    """
+    try:
+        file_name = inspect.getsourcefile(func)
+
+    except TypeError:
+        file_name = None
+
+    if (file_name is None) or (not os.path.exists(file_name)):
+        code = func.__code__
+
+        return hashlib.md5(repr((code.co_code, code.co_consts))).hexdigest()
+
+    with open(file_name, 'rb') as fh:
+        return hashlib.md5(fh.read()).hexdigest()
+
+
+def _normalise(value):
+    """ Convert a value to a form with a stable repr, since dicts and sets have no defined order.
+    """
+    if isinstance(value, dict):
+        return sorted((k, _normalise(v)) for k, v in value.items())
+
+    elif isinstance(value, (set, frozenset)):
+        return sorted(_normalise(x) for x in value)
+
+    elif isinstance(value, (list, tuple)):
+        return [_normalise(x) for x in value]
+
+    return value
+
+
+def _restore_entry(entry_dir, out_files):
+    """ Link or copy the files of a cache entry to the output files of a task. Returns False if there is no entry.
+    """
+    manifest_file = os.path.join(entry_dir, 'manifest.pickle')
+
+    if not os.path.exists(manifest_file):
+        return False
+
+    try:
+        with open(manifest_file, 'rb') as fh:
+            manifest = pickle.load(fh)
+
+    except Exception:
+        return False
+
+    if len(manifest) != len(out_files):
+        return False
+
+    for cache_name, out_file in zip(manifest, out_files):
+        _link_or_copy(os.path.join(entry_dir, cache_name), out_file)
+
+    return True
+
+
+def _store_entry(cache_dir, entry_dir, out_files):
+    # Failing to store outputs should never fail the task which created them
+    try:
+        if os.path.exists(entry_dir):
+            return
+
+        tmp_dir = tempfile.mkdtemp(dir=soil.utils.cache.makedirs(os.path.join(cache_dir, 'tmp')))
+
+        manifest = []
+
+        for idx, file_name in enumerate(out_files):
+            cache_name = str(idx)
+
+            # Copy rather than link, since making a link read only would also make the output of the run read only
+            shutil.copyfile(file_name, os.path.join(tmp_dir, cache_name))
+
+            # Stored files are shared by every run which uses them, so prevent them from being modified in place
+            os.chmod(os.path.join(tmp_dir, cache_name), 0o444)
+
+            manifest.append(cache_name)
+
+        with open(os.path.join(tmp_dir, 'manifest.pickle'), 'wb') as fh:
+            pickle.dump(manifest, fh, pickle.HIGHEST_PROTOCOL)
+
+        soil.utils.cache.makedirs(os.path.dirname(entry_dir))
+
+        # Another job may have stored the same entry, in which case the rename fails and this copy is discarded
+        try:
+            os.rename(tmp_dir, entry_dir)
+
+        except OSError:
+            shutil.rmtree(tmp_dir)
+
+    except Exception:
+        pass
+
+
+@contextlib.contextmanager
+def _lock(lock_dir):
+    """ Hold the lock of a cache entry, see :func:`soil.utils.cache.lock`. The lock is not required for correctness, so
+    the task runs without it if it cannot be created.
+    """
+    try:
+        soil.utils.cache.makedirs(os.path.dirname(lock_dir))
+
+    except OSError:
+        yield
+
+        return
+
+    with soil.utils.cache.lock(lock_dir):
+        yield
+
+
+def _link_or_copy(src, dst):
+    if os.path.exists(dst):
+        os.remove(dst)
+
+    try:
+        os.link(src, dst)
+
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _write_file(file_name, contents):
+    fd, tmp_file = tempfile.mkstemp(dir=soil.utils.cache.makedirs(os.path.dirname(file_name)), suffix='.tmp')
+
+    with os.fdopen(fd, 'w') as fh:
+        fh.write(contents)
+
+    os.rename(tmp_file, file_name)
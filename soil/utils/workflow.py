@@ -1,13 +1,16 @@
-from pypeliner.sandbox import CondaSandbox
+import pypeliner.managed as mgd
 
 import soil.utils.conda
+import soil.utils.genome
+import soil.utils.sandbox
 
 
 def flatten_input(files):
     """ Takes a collection and returns a list. Useful for writing functions that may be used as one-to-one or
     many-to-one actions by pypeliner.
 
-    :param files: A collection, usually of file paths.
+    :param files: A collection, usually of file paths. If this is a list of dicts with disjoint keys, such as the
+        outputs of jobs split over complementary axes, the dicts are merged and the values sorted by key.
     :returns: A flattened list.
 
     >>> flatten_input({'a': '/foo/bar/a', 'b': '/foo/bar/b'})
@@ -16,10 +19,21 @@ def flatten_input(files):
     >>> flatten_input('/foo/bar/a')
     [''/foo/bar/a',]
 
+    >>> flatten_input([{0: '/foo/bar/a', 2: '/foo/bar/c'}, {1: '/foo/bar/b'}])
+    ['/foo/bar/a', '/foo/bar/b', '/foo/bar/c']
+
     """
     if type(files) == dict:
         parsed_files = [files[x] for x in sorted(files)]
 
+    elif _is_disjoint_dicts(files):
+        merged_files = {}
+
+        for x in files:
+            merged_files.update(x)
+
+        parsed_files = [merged_files[x] for x in sorted(merged_files)]
+
     elif type(files) == str:
         parsed_files = [files, ]
 
@@ -53,4 +67,64 @@ def get_sandbox(package_names):
 
             package_strs.add(package.conda_str)
 
-    return CondaSandbox(channels=sorted(channels), packages=sorted(package_strs), pip_packages=pip_packages)
+    return soil.utils.sandbox.SharedCondaSandbox(channels=channels, packages=package_strs, pip_packages=pip_packages)
+
+
+def set_regions(workflow, bam_file, split_size, ctx, hotspot_factor=None, hotspot_ctx=None, **kwargs):
+    """ Add the region plan for a BAM file to a workflow as the `config` object split over the `regions` axis.
+
+    If hotspot_ctx is set the regions from hotspots are put on a separate `hotspot_regions` axis, so jobs on these
+    regions can be given more resources. The keys of the two axes are disjoint, so outputs from both can be passed to
+    functions which use :func:`flatten_input` as a list and will be merged in genome order.
+
+    :param workflow: Workflow to add the region plan to.
+    :param bam_file: Path of BAM file.
+    :param split_size: See :func:`soil.utils.genome.get_bam_regions`.
+    :param ctx: Context for jobs on the `regions` axis.
+    :param hotspot_factor: See :func:`soil.utils.genome.get_hotspot_regions`.
+    :param hotspot_ctx: Context for jobs on the `hotspot_regions` axis. Requires hotspot_factor to be set.
+    :param kwargs: Passed to :func:`soil.utils.genome.get_bam_regions`.
+    :returns: A list of tuples of job name suffix, axis and context for each axis jobs should be split over.
+    """
+    if hotspot_ctx is None:
+        workflow.setobj(
+            obj=mgd.TempOutputObj('config', 'regions'),
+            value=soil.utils.genome.get_bam_regions(bam_file, split_size, hotspot_factor=hotspot_factor, **kwargs)
+        )
+
+        return [('', 'regions', ctx), ]
+
+    if hotspot_factor is None:
+        raise Exception('hotspot_factor must be set to use hotspot_ctx')
+
+    regions, hotspot_regions = soil.utils.genome.get_hotspot_regions(
+        bam_file,
+        soil.utils.genome.get_bam_regions(bam_file, split_size, **kwargs),
+        hotspot_factor
+    )
+
+    workflow.setobj(obj=mgd.TempOutputObj('config', 'regions'), value=regions)
+
+    region_axes = [('', 'regions', ctx), ]
+
+    if len(hotspot_regions) > 0:
+        workflow.setobj(obj=mgd.TempOutputObj('config', 'hotspot_regions'), value=hotspot_regions)
+
+        region_axes.append(('_hotspots', 'hotspot_regions', hotspot_ctx))
+
+    return region_axes
+
+
+def _is_disjoint_dicts(files):
+    if (type(files) != list) or (len(files) == 0) or (not all([type(x) == dict for x in files])):
+        return False
+
+    keys = set()
+
+    for x in files:
+        if len(keys & set(x.keys())) > 0:
+            return False
+
+        keys.update(x.keys())
+
+    return True
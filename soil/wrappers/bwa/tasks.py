@@ -3,6 +3,8 @@ Wrappers for BWA http://bio-bwa.sourceforge.net/.
 """
 import pypeliner.commandline as cli
 
+import soil.utils.task_cache
+
 
 def index(ref_genome_fasta_file, out_sentinel_file):
     """ Build an index of a FASTA file for use with the BWA alignment programs.
@@ -18,6 +20,9 @@ def index(ref_genome_fasta_file, out_sentinel_file):
     open(out_sentinel_file, 'w').close()
 
 
+@soil.utils.task_cache.cached_task(
+    ['fastq_file_1', 'fastq_file_2', 'ref_genome_fasta_file'], ['out_bam_file'], packages=['bwa', 'samtools']
+)
 def mem_paired_end(fastq_file_1, fastq_file_2, ref_genome_fasta_file, out_bam_file, read_group_info=None, threads=1):
     """ Align paired end FASTQ files using `bwa mem`.
 
@@ -2,6 +2,7 @@ import pysam
 import pypeliner
 import pypeliner.managed as mgd
 
+import soil.utils.cache
 import soil.utils.workflow
 
 import tasks
@@ -80,6 +81,7 @@ def create_ref_panel_phase_workflow(genetic_map_file, ref_file, target_file, out
     return workflow
 
 
+@soil.utils.cache.cached('variant_file')
 def get_chromosomes(variant_file):
     vf = pysam.VariantFile(variant_file, 'r')
 
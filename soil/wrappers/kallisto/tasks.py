@@ -2,7 +2,10 @@ import os
 import pypeliner.commandline as cli
 import shutil
 
+import soil.utils.task_cache
 
+
+@soil.utils.task_cache.cached_task(['in_file'], ['out_file'], packages=['kallisto'])
 def build_index(in_file, out_file, kmer_length=31):
     """ Build an index file for Kallisto
 
@@ -1,18 +1,22 @@
 from __future__ import division
 
 import os
-import pandas as pd
-import pyteomics.fasta
 import pypeliner.commandline as cli
 import re
 import shutil
 import string
 
 import soil.utils.package_data
+import soil.utils.task_cache
 import soil.utils.workflow
 
+# Extensions of the index files MSGF+ writes alongside a database
+INDEX_EXTENSIONS = ['.canno', '.cnlcp', '.csarr', '.cseq']
+
 
 def build_decoy_db(in_file, out_file, decoy_only=True, decoy_prefix='XXX_'):
+    import pyteomics.fasta
+
     pyteomics.fasta.write_decoy_db(in_file, out_file, decoy_only=decoy_only, prefix=decoy_prefix)
 
 
@@ -38,6 +42,13 @@ def build_index_sentinel(in_file, sentinel_file, **kwargs):
     open(sentinel_file, 'w').close()
 
 
+def _get_index_files(in_file, out_file, add_decoys=True):
+    prefix = os.path.splitext(out_file.replace('.tmp', ''))[0]
+
+    return [prefix + x for x in INDEX_EXTENSIONS]
+
+
+@soil.utils.task_cache.cached_task(['in_file'], ['out_file'], packages=['msgf_plus'], related_outputs=_get_index_files)
 def build_index(in_file, out_file, add_decoys=True):
     """ Build an indexed database.
 
@@ -114,6 +125,8 @@ def convert_msgf_to_final(in_file, out_file):
 
 
 def load_msgf_df(file_name):
+    import pandas as pd
+
     def get_unmodified_peptide(peptide):
         if '.' in peptide:
             peptide = peptide.split('.')[1]
@@ -156,6 +169,8 @@ def load_msgf_df(file_name):
 
 
 def merge_results(in_files, out_file):
+    import pandas as pd
+
     data = []
 
     for file_name in soil.utils.workflow.flatten_input(in_files):
@@ -251,6 +266,8 @@ def write_mods_files(file_name, num_mods, fixed_mods, variable_mods):
 
 
 def _get_modification_string(mod, fixed=True):
+    import pandas as pd
+
     base_mod, aa = re.search('(.*)\s\((.*)\)', mod).groups()
 
     if '-term' in aa.lower():
@@ -26,7 +26,25 @@ import workflows
     help='''Chromosome to analyze. Can be specified multiple times i.e. -c chr1 -c chrX to analyze chromosomes 1 and X.
     '''
 )
-def paired(normal_bam_file, tumour_bam_file, ref_genome_fasta_file, out_vcf_file, chromosomes):
+@click.option(
+    '-sm', '--split-method', default='fixed', type=click.Choice(['coverage', 'fixed']),
+    help='''How to split the genome into regions for parallel jobs. Use fixed for regions of equal length or coverage
+    for regions with roughly equal numbers of reads based on the BAM index.'''
+)
+@click.option(
+    '-tb', '--target-bed-file', default=None, type=click.Path(exists=True, resolve_path=True),
+    help='''Path of BED file with target intervals, for example exome baits. If set regions for parallel jobs are built
+    from the padded targets and the split method is ignored.'''
+)
+def paired(
+        normal_bam_file,
+        tumour_bam_file,
+        ref_genome_fasta_file,
+        out_vcf_file,
+        chromosomes,
+        split_method,
+        target_bed_file):
+
     if len(chromosomes) == 0:
         chromosomes = None
 
@@ -37,7 +55,9 @@ def paired(normal_bam_file, tumour_bam_file, ref_genome_fasta_file, out_vcf_file
         out_vcf_file,
         chromosomes=chromosomes,
         normal_name='normal',
+        split_method=split_method,
         split_size=int(1e7),
+        target_bed_file=target_bed_file,
         tumour_name='tumour'
     )
 
@@ -1,6 +1,8 @@
 import os
 import pypeliner.commandline as cli
 
+import soil.utils.genome
+
 
 def run_filter_mutect(in_file, out_file):
     cmd = [
@@ -35,12 +37,29 @@ def run_mutect_paired(
         '-tumor', tumour_name,
         '-I', normal_bam_file,
         '-normal', normal_name,
-        '-L', region,
         '-O', out_file
     ]
 
+    # Use an interval file when there are many regions to keep the command line short
+    regions = soil.utils.genome.get_region_list(region)
+
+    if len(regions) == 1:
+        intervals_file = None
+
+        cmd.extend(['-L', regions[0]])
+
+    else:
+        intervals_file = out_file + '.intervals.list'
+
+        soil.utils.genome.write_regions_file(regions, intervals_file)
+
+        cmd.extend(['-L', intervals_file])
+
     cli.execute(*cmd)
 
+    if intervals_file is not None:
+        os.unlink(intervals_file)
+
     idx_file = out_file + '.idx'
 
     if os.path.exists(idx_file):
@@ -2,6 +2,7 @@ import pysam
 import pypeliner
 import pypeliner.managed as mgd
 
+import soil.utils.cache
 import soil.utils.genome
 import soil.utils.workflow
 import soil.wrappers.samtools.tasks
@@ -19,7 +20,9 @@ def create_mutect_paired_workflow(
         out_file,
         chromosomes=None,
         normal_name='normal',
+        split_method='fixed',
         split_size=int(1e7),
+        target_bed_file=None,
         tumour_name='tumour'):
 
     normal_name = get_sample(normal_bam_file, normal_name)
@@ -32,7 +35,14 @@ def create_mutect_paired_workflow(
 
     workflow.setobj(
         obj=pypeliner.managed.TempOutputObj('config', 'regions'),
-        value=soil.utils.genome.get_bam_regions(normal_bam_file, split_size, chromosomes=chromosomes)
+        value=soil.utils.genome.get_bam_regions(
+            normal_bam_file,
+            split_size,
+            chromosomes=chromosomes,
+            ref_genome_fasta_file=ref_genome_fasta_file,
+            split_method=split_method,
+            target_bed_file=target_bed_file
+        )
     )
 
     workflow.transform(
@@ -89,6 +99,7 @@ def create_mutect_paired_workflow(
     return workflow
 
 
+@soil.utils.cache.cached('file_name')
 def get_sample(file_name, orig_name):
     bam = pysam.AlignmentFile(file_name)
 
@@ -2,6 +2,7 @@ import pysam
 import pypeliner
 import pypeliner.managed as mgd
 
+import soil.utils.cache
 import soil.utils.workflow
 import tasks
 
@@ -51,6 +52,7 @@ def create_optitype_workflow(bam_file, hla_type_file, is_rna=False, threads=1):
     return workflow
 
 
+@soil.utils.cache.cached('bam_file')
 def check_chr_prefix(bam_file):
     bam = pysam.AlignmentFile(bam_file)
 
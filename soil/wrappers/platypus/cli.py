@@ -26,7 +26,17 @@ import workflows
     '--rna', is_flag=True,
     help='''Set this flag if the BAM file contains RNA-Seq data. Will pre-process the files with opossum.'''
 )
-def single_sample(bam_file, ref_genome_fasta_file, out_vcf_file, chromosomes, rna):
+@click.option(
+    '-sm', '--split-method', default='fixed', type=click.Choice(['coverage', 'fixed']),
+    help='''How to split the genome into regions for parallel jobs. Use fixed for regions of equal length or coverage
+    for regions with roughly equal numbers of reads based on the BAM index.'''
+)
+@click.option(
+    '-tb', '--target-bed-file', default=None, type=click.Path(exists=True, resolve_path=True),
+    help='''Path of BED file with target intervals, for example exome baits. If set regions for parallel jobs are built
+    from the padded targets and the split method is ignored.'''
+)
+def single_sample(bam_file, ref_genome_fasta_file, out_vcf_file, chromosomes, rna, split_method, target_bed_file):
     if len(chromosomes) == 0:
         chromosomes = 'default'
 
@@ -36,6 +46,8 @@ def single_sample(bam_file, ref_genome_fasta_file, out_vcf_file, chromosomes, rn
             ref_genome_fasta_file,
             out_vcf_file,
             chromosomes=chromosomes,
+            split_method=split_method,
+            target_bed_file=target_bed_file,
         )
 
     else:
@@ -44,6 +56,8 @@ def single_sample(bam_file, ref_genome_fasta_file, out_vcf_file, chromosomes, rn
             ref_genome_fasta_file,
             out_vcf_file,
             chromosomes=chromosomes,
+            split_method=split_method,
+            target_bed_file=target_bed_file,
         )
 
 
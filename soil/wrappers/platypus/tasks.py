@@ -1,6 +1,8 @@
 import os
 import pypeliner.commandline as cli
 
+import soil.utils.genome
+
 
 def call_variants(bam_file, ref_genome_fasta_file, log_file, out_file, region, rna=False):
     if not os.path.exists(bam_file + '.bai'):
@@ -17,10 +19,23 @@ def call_variants(bam_file, ref_genome_fasta_file, log_file, out_file, region, r
         '--bamFiles', bam_file,
         '--logFileName', log_file,
         '--refFile', ref_genome_fasta_file,
-        '--regions', region,
         '-o', out_file,
     ]
 
+    regions = soil.utils.genome.get_region_list(region)
+
+    if len(regions) == 1:
+        regions_file = None
+
+        cmd.extend(['--regions', regions[0]])
+
+    else:
+        regions_file = out_file + '.regions.txt'
+
+        soil.utils.genome.write_regions_file(regions, regions_file)
+
+        cmd.extend(['--regions', regions_file])
+
     if rna:
         cmd.extend([
             '--filterDuplicates', 0,
@@ -36,6 +51,9 @@ def call_variants(bam_file, ref_genome_fasta_file, log_file, out_file, region, r
     if tmp_index:
         os.unlink(bam_file + '.bai')
 
+    if regions_file is not None:
+        os.unlink(regions_file)
+
 
 def fix_rna_bam(in_file, out_file):
     cmd = [
@@ -15,7 +15,9 @@ def create_single_sample_workflow(
         bam_file,
         ref_genome_fasta_file,
         out_file, chromosomes='default',
-        split_size=int(1e7)):
+        split_method='fixed',
+        split_size=int(1e7),
+        target_bed_file=None):
 
     sandbox = soil.utils.workflow.get_sandbox(['bcftools', 'samtools', 'platypus'])
 
@@ -23,7 +25,14 @@ def create_single_sample_workflow(
 
     workflow.setobj(
         obj=pypeliner.managed.TempOutputObj('config', 'regions'),
-        value=soil.utils.genome.get_bam_regions(bam_file, split_size, chromosomes=chromosomes)
+        value=soil.utils.genome.get_bam_regions(
+            bam_file,
+            split_size,
+            chromosomes=chromosomes,
+            ref_genome_fasta_file=ref_genome_fasta_file,
+            split_method=split_method,
+            target_bed_file=target_bed_file
+        )
     )
 
     workflow.transform(
@@ -78,7 +87,9 @@ def create_rna_single_sample_workflow(
         ref_genome_fasta_file,
         out_file,
         chromosomes='default',
-        split_size=int(1e7)):
+        split_method='fixed',
+        split_size=int(1e7),
+        target_bed_file=None):
 
     sandbox = soil.utils.workflow.get_sandbox(['bcftools', 'samtools', 'opossum', 'platypus'])
 
@@ -86,20 +97,24 @@ def create_rna_single_sample_workflow(
 
     workflow.setobj(
         obj=pypeliner.managed.TempOutputObj('config', 'regions'),
-        value=soil.utils.genome.get_bam_regions(bam_file, split_size, chromosomes=chromosomes)
+        value=soil.utils.genome.get_bam_regions(
+            bam_file,
+            split_size,
+            chromosomes=chromosomes,
+            ref_genome_fasta_file=ref_genome_fasta_file,
+            split_method=split_method,
+            target_bed_file=target_bed_file
+        )
     )
 
-    workflow.commandline(
+    workflow.transform(
         name='split_bam',
         axes=('regions',),
+        func=soil.wrappers.samtools.tasks.extract_regions,
         args=(
-            'samtools',
-            'view',
-            '-b',
             mgd.InputFile(bam_file),
-            mgd.TempInputObj('config', 'regions'),
-            '>',
             mgd.TempOutputFile('raw.bam', 'regions'),
+            mgd.TempInputObj('config', 'regions'),
         )
     )
 
@@ -1,5 +1,4 @@
 import os
-import pandas as pd
 import pypeliner.commandline as cli
 import shutil
 
@@ -41,6 +40,7 @@ def split_mzml_file(in_file, out_file_callback, tmp_dir, split_size=int(1e3), va
 
 
 def _get_num_spectrum(in_file, tmp_dir):
+    import pandas as pd
 
     if os.path.exists(tmp_dir):
         shutil.rmtree(tmp_dir)
@@ -7,7 +7,12 @@ import shutil
 
 from soil.utils.workflow import flatten_input
 
+import soil.utils.task_cache
 
+
+@soil.utils.task_cache.cached_task(
+    ['in_file'], ['out_file'], packages=['sambamba'], ignore=['tmp_dir', 'memory', 'threads']
+)
 def sort(in_file, out_file, tmp_dir, memory=24, threads=1):
     """ Sort a BAM file by coordinate.
 
@@ -35,6 +40,7 @@ def sort(in_file, out_file, tmp_dir, memory=24, threads=1):
     shutil.rmtree(tmp_dir)
 
 
+@soil.utils.task_cache.cached_task(['in_files'], ['out_file'], packages=['sambamba'])
 def markdups(in_files, out_file, tmp_dir, threads=1):
     """ Merge files and mark duplicate reads in a file.
 
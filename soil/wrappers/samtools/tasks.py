@@ -7,6 +7,7 @@ import os
 import pypeliner.commandline as cli
 import shutil
 
+import soil.utils.genome
 import soil.utils.workflow
 
 
@@ -69,6 +70,52 @@ def concatenate_vcf(in_files, out_file, allow_overlap=False, bcf_output=False, i
         index_vcf(out_file, index_file=index_file)
 
 
+def extract_regions(in_file, out_file, region):
+    """ Extract the reads overlapping one or more regions from a BAM file.
+
+    :param in_file: Path of indexed BAM file.
+    :param out_file: Path where BAM file will be written.
+    :param region: A samtools region string or list of region strings.
+    """
+    cmd = ['samtools', 'view', '-b', '-o', out_file, in_file]
+
+    cmd.extend(soil.utils.genome.get_region_list(region))
+
+    cli.execute(*cmd)
+
+
+def mpileup(bam_file, ref_genome_fasta_file, out_file, region):
+    """ Run samtools mpileup over one or more regions of a BAM file.
+
+    :param bam_file: Path of indexed BAM file.
+    :param ref_genome_fasta_file: Path of reference genome FASTA file.
+    :param out_file: Path where pileup file will be written.
+    :param region: A samtools region string or list of region strings. Lists are passed to mpileup as a BED file.
+    """
+    regions = soil.utils.genome.get_region_list(region)
+
+    cmd = ['samtools', 'mpileup', '-f', ref_genome_fasta_file, '-o', out_file]
+
+    if len(regions) == 1:
+        bed_file = None
+
+        cmd.extend(['-r', regions[0]])
+
+    else:
+        bed_file = out_file + '.regions.bed'
+
+        soil.utils.genome.write_regions_file(regions, bed_file, bed=True)
+
+        cmd.extend(['-l', bed_file])
+
+    cmd.append(bam_file)
+
+    cli.execute(*cmd)
+
+    if bed_file is not None:
+        os.unlink(bed_file)
+
+
 def index_fasta(in_file, out_file):
     """ Build a samtools index for a FASTA file.
 
@@ -30,7 +30,43 @@ import workflows
     '-e', '--exome', is_flag=True,
     help='''Set this if the data is from exome sequencing. Disables depth filtering.'''
 )
-def somatic(normal_bam_file, tumour_bam_file, ref_genome_fasta_file, out_vcf_file, chromosomes, exome):
+@click.option(
+    '-sm', '--split-method', default='fixed', type=click.Choice(['coverage', 'fixed']),
+    help='''How to split the genome into regions for parallel jobs. Use fixed for regions of equal length or coverage
+    for regions with roughly equal numbers of reads based on the BAM index.'''
+)
+@click.option(
+    '-tb', '--target-bed-file', default=None, type=click.Path(exists=True, resolve_path=True),
+    help='''Path of BED file with target intervals, for example exome baits. If set regions for parallel jobs are built
+    from the padded targets and the split method is ignored.'''
+)
+@click.option(
+    '-hf', '--hotspot-factor', default=None, type=float,
+    help='''If set, regions with more than this multiple of the median read volume in the BAM index are split into finer
+    regions. Useful for data with extreme depth in some regions such as the mitochondrial genome or amplified loci.'''
+)
+@click.option(
+    '-hm', '--hotspot-mem', default=None, type=int,
+    help='''Memory in GB for variant calling jobs on hotspot regions. Requires --hotspot-factor to be set.'''
+)
+def somatic(
+        normal_bam_file,
+        tumour_bam_file,
+        ref_genome_fasta_file,
+        out_vcf_file,
+        chromosomes,
+        exome,
+        split_method,
+        target_bed_file,
+        hotspot_factor,
+        hotspot_mem):
+
+    if hotspot_mem is None:
+        hotspot_ctx = None
+
+    else:
+        hotspot_ctx = dict(workflows.med_mem_ctx, mem=hotspot_mem)
+
     if len(chromosomes) == 0:
         chromosomes = 'default'
 
@@ -41,6 +77,10 @@ def somatic(normal_bam_file, tumour_bam_file, ref_genome_fasta_file, out_vcf_fil
         out_vcf_file,
         chromosomes=chromosomes,
         is_exome=exome,
+        split_method=split_method,
+        target_bed_file=target_bed_file,
+        hotspot_factor=hotspot_factor,
+        hotspot_ctx=hotspot_ctx,
     )
 
 
@@ -10,6 +10,8 @@ import pypeliner.commandline as cli
 import shutil
 
 import soil.utils.file_system
+import soil.utils.genome
+import soil.utils.task_cache
 
 
 def call_genome_segment(
@@ -60,7 +62,6 @@ def call_genome_segment(
         '--stats-file', stats_file,
 
         # strelkaSharedWorkflow.py
-        '--region', region,
         '--ref', ref_genome_fasta_file,
         '-genome-size', genome_size,
         '-max-indel-size', 50,
@@ -95,6 +96,9 @@ def call_genome_segment(
         '--somatic-indel-scoring-model-file', soil.utils.file_system.find('somaticIndelScoringModels.json', share_dir),
     ]
 
+    for r in soil.utils.genome.get_region_list(region):
+        cmd.extend(['--region', r])
+
     if not is_exome:
         cmd.extend([
             '--strelka-chrom-depth-file', chrom_depth_file,
@@ -108,6 +112,7 @@ def call_genome_segment(
     shutil.move(tmp_snv_file, snv_file)
 
 
+@soil.utils.task_cache.cached_task(['ref_genome_fasta_file'], ['out_file'], packages=['strelka'])
 def count_fasta_bases(ref_genome_fasta_file, out_file):
     share_dir = os.path.join(os.environ['CONDA_PREFIX'], 'share')
 
@@ -1,8 +1,8 @@
-import pandas as pd
 import pypeliner
 import pypeliner.managed as mgd
 
 import soil.utils.genome
+import soil.utils.sandbox
 import soil.utils.workflow
 import soil.wrappers.samtools.tasks
 import soil.wrappers.strelka.tasks
@@ -18,15 +18,27 @@ def create_somatic_workflow(
         out_file,
         chromosomes='default',
         is_exome=False,
-        split_size=int(1e7)):
+        split_method='fixed',
+        split_size=int(1e7),
+        target_bed_file=None,
+        hotspot_factor=None,
+        hotspot_ctx=None):
 
     sandbox = soil.utils.workflow.get_sandbox(['bcftools', 'samtools', 'strelka'])
 
     workflow = pypeliner.workflow.Workflow(default_ctx=med_mem_ctx, default_sandbox=sandbox)
 
-    workflow.setobj(
-        obj=mgd.TempOutputObj('config', 'regions'),
-        value=soil.utils.genome.get_bam_regions(normal_bam_file, split_size, chromosomes=chromosomes)
+    region_axes = soil.utils.workflow.set_regions(
+        workflow,
+        normal_bam_file,
+        split_size,
+        med_mem_ctx,
+        chromosomes=chromosomes,
+        ref_genome_fasta_file=ref_genome_fasta_file,
+        split_method=split_method,
+        target_bed_file=target_bed_file,
+        hotspot_factor=hotspot_factor,
+        hotspot_ctx=hotspot_ctx
     )
 
     workflow.setobj(
@@ -53,7 +65,7 @@ def create_somatic_workflow(
             mgd.TempInputFile('ref_base_counts.tsv'),
             chromosomes,
         ),
-        sandbox=None,
+        sandbox=soil.utils.sandbox.NoSandbox(),
     )
 
     workflow.transform(
@@ -70,39 +82,42 @@ def create_somatic_workflow(
 
     workflow.transform(
         name='merge_chromosome_depths',
+        ctx={'local': True},
         func=soil.wrappers.strelka.tasks.merge_chromosome_depth,
         args=(
             mgd.TempInputFile('chrom_depth.txt', 'chrom_axis'),
             mgd.TempOutputFile('chrom_depth_merged.txt'),
         ),
-        sandbox=None,
+        sandbox=soil.utils.sandbox.NoSandbox(),
     )
 
-    workflow.transform(
-        name='call_genome_segment',
-        axes=('regions',),
-        func=soil.wrappers.strelka.tasks.call_genome_segment,
-        args=(
-            mgd.TempInputFile('chrom_depth_merged.txt'),
-            mgd.InputFile(normal_bam_file),
-            mgd.InputFile(tumour_bam_file),
-            mgd.InputFile(ref_genome_fasta_file),
-            mgd.TempOutputFile('indels.vcf', 'regions'),
-            mgd.TempOutputFile('snvs.vcf', 'regions'),
-            mgd.TempSpace('call_genome_segment_tmp', 'regions'),
-            mgd.TempInputObj('config', 'regions'),
-            mgd.TempInputObj('genome_size'),
-        ),
-        kwargs={
-            'is_exome': is_exome,
-        }
-    )
+    for suffix, axis, ctx in region_axes:
+        workflow.transform(
+            name='call_genome_segment' + suffix,
+            axes=(axis,),
+            ctx=ctx,
+            func=soil.wrappers.strelka.tasks.call_genome_segment,
+            args=(
+                mgd.TempInputFile('chrom_depth_merged.txt'),
+                mgd.InputFile(normal_bam_file),
+                mgd.InputFile(tumour_bam_file),
+                mgd.InputFile(ref_genome_fasta_file),
+                mgd.TempOutputFile('indels.vcf', axis),
+                mgd.TempOutputFile('snvs.vcf', axis),
+                mgd.TempSpace('call_genome_segment_tmp', axis),
+                mgd.TempInputObj('config', axis),
+                mgd.TempInputObj('genome_size'),
+            ),
+            kwargs={
+                'is_exome': is_exome,
+            }
+        )
 
     workflow.transform(
         name='merge_indels',
         func=soil.wrappers.samtools.tasks.concatenate_vcf,
         args=(
-            mgd.TempInputFile('indels.vcf', 'regions'),
+            [mgd.TempInputFile('indels.vcf', axis) for _, axis, _ in region_axes],
             mgd.TempOutputFile('indels.vcf.gz'),
         ),
     )
@@ -111,7 +126,7 @@ def create_somatic_workflow(
         name='merge_snvs',
         func=soil.wrappers.samtools.tasks.concatenate_vcf,
         args=(
-            mgd.TempInputFile('snvs.vcf', 'regions'),
+            [mgd.TempInputFile('snvs.vcf', axis) for _, axis, _ in region_axes],
             mgd.TempOutputFile('snvs.vcf.gz'),
         ),
     )
@@ -164,6 +179,8 @@ def get_chromosomes(bam_file, chromosomes=None):
 
 
 def get_known_genome_size(bam_file, size_file, chromosomes):
+    import pandas as pd
+
     chromosomes = _get_chromosomes(bam_file, chromosomes)
 
     sizes = pd.read_csv(
@@ -1,15 +1,12 @@
 import glob
 import itertools
-import numpy as np
 import os
-import pandas as pd
 import pkg_resources
 import pypeliner.commandline as cli
-import pysam
 import shutil
 import tarfile
-import vcf
 
+import soil.utils.task_cache
 import soil.utils.workflow
 
 
@@ -53,6 +50,10 @@ def get_snv_allele_counts_for_vcf_targets(
         count_duplicates=False,
         min_bqual=0,
         min_mqual=0):
+    import numpy as np
+    import pandas as pd
+    import pysam
+    import vcf
 
     nucleotides = ('A', 'C', 'G', 'T')
 
@@ -101,6 +102,7 @@ def get_snv_allele_counts_for_vcf_targets(
 
 
 def merge_counts(in_files, out_file):
+    import pandas as pd
 
     in_files = soil.utils.workflow.flatten_input(in_files)
 
@@ -163,6 +165,7 @@ def create_intialization_parameters():
     return init_params
 
 
+@soil.utils.task_cache.cached_task(['coverage_file', 'snp_file'], ['out_file'], packages=['titan'])
 def run_titan(
         coverage_file,
         snp_file,
@@ -224,6 +227,7 @@ def run_titan(
 
 
 def build_run_stats_file(in_files, init_params, out_file):
+    import pandas as pd
 
     init_params = pd.DataFrame.from_dict(init_params, orient='index')
 
@@ -248,6 +252,8 @@ def build_run_stats_file(in_files, init_params, out_file):
 
 
 def _read_titan_params(tar_file):
+    import numpy as np
+
     archive = tarfile.open(tar_file, 'r:gz')
 
     for name in archive.getnames():
@@ -268,6 +274,7 @@ def _read_titan_params(tar_file):
 
 
 def build_final_results_file(counts_file, coverage_file, run_files, stats_file, out_file, tmp_dir):
+    import pandas as pd
 
     if os.path.exists(tmp_dir):
         shutil.rmtree(tmp_dir)
@@ -1,6 +1,7 @@
 import pypeliner
 import pypeliner.managed as mgd
 
+import soil.utils.sandbox
 import soil.utils.workflow
 import soil.wrappers.platypus.workflows
 
@@ -245,11 +246,13 @@ def create_allele_counts_workflow(
 
     workflow.transform(
         name='merge_counts',
+        ctx={'local': True},
         func=tasks.merge_counts,
         args=(
             mgd.TempInputFile('split.tsv', 'split'),
             mgd.OutputFile(allele_counts_file)
-        )
+        ),
+        sandbox=soil.utils.sandbox.NoSandbox(),
     )
 
     return workflow
@@ -1,5 +1,4 @@
 import os
-import pandas as pd
 import pypeliner.commandline as cli
 import shutil
 import subprocess
@@ -77,6 +76,8 @@ def run_topiary(
 
 
 def reformat_output(in_files, out_file):
+    import pandas as pd
+
     data = []
 
     for file_name in soil.utils.workflow.flatten_input(in_files):
@@ -1,7 +1,10 @@
+import os
 import pipes
 import pypeliner.commandline as cli
 import subprocess
 
+import soil.utils.genome
+
 
 def run_vardict_paired(
         normal_bam_file,
@@ -17,19 +20,35 @@ def run_vardict_paired(
         '-b', pipes.quote('{0}|{1}'.format(tumour_bam_file, normal_bam_file)),
         '-f', min_allele_frequency,
         '-G', ref_genome_fasta_file,
-        '-R', region,
         '-th', 1
     ]
 
     if remove_duplicate_reads:
         cmd.append('-t')
 
+    regions = soil.utils.genome.get_region_list(region)
+
+    if len(regions) == 1:
+        bed_file = None
+
+        cmd.extend(['-R', regions[0]])
+
+    else:
+        bed_file = out_file + '.regions.bed'
+
+        soil.utils.genome.write_regions_file(regions, bed_file, bed=True)
+
+        cmd.extend(['-c', 1, '-S', 2, '-E', 3, bed_file])
+
     cmd.extend(['>', out_file])
 
     cmd_str = ' '.join([str(x) for x in cmd])
 
     subprocess.check_call(cmd_str, shell=True)
 
+    if bed_file is not None:
+        os.unlink(bed_file)
+
 
 def run_test_somatic(in_file, out_file):
     cmd = [
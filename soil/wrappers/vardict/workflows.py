@@ -1,7 +1,6 @@
 import pypeliner
 import pypeliner.managed as mgd
 
-import soil.utils.genome
 import soil.utils.workflow
 import soil.wrappers.samtools.tasks
 
@@ -17,67 +16,80 @@ def create_vardict_paired_workflow(
         ref_genome_fasta_file,
         out_file,
         chromosomes=None,
-        split_size=int(5e6)):
+        split_method='fixed',
+        split_size=int(5e6),
+        target_bed_file=None,
+        hotspot_factor=None,
+        hotspot_ctx=None):
 
     sandbox = soil.utils.workflow.get_sandbox(['bcftools', 'samtools', 'vardict', 'vardict-java'])
 
     workflow = pypeliner.workflow.Workflow(default_ctx=low_mem_ctx, default_sandbox=sandbox)
 
-    workflow.setobj(
-        obj=pypeliner.managed.TempOutputObj('config', 'regions'),
-        value=soil.utils.genome.get_bam_regions(normal_bam_file, split_size, chromosomes=chromosomes)
+    region_axes = soil.utils.workflow.set_regions(
+        workflow,
+        normal_bam_file,
+        split_size,
+        med_mem_ctx,
+        chromosomes=chromosomes,
+        ref_genome_fasta_file=ref_genome_fasta_file,
+        split_method=split_method,
+        target_bed_file=target_bed_file,
+        hotspot_factor=hotspot_factor,
+        hotspot_ctx=hotspot_ctx
     )
 
-    workflow.transform(
-        name='run_vardict',
-        axes=('regions',),
-        ctx=med_mem_ctx,
-        func=tasks.run_vardict_paired,
-        args=(
-            mgd.InputFile(normal_bam_file),
-            mgd.InputFile(tumour_bam_file),
-            mgd.InputFile(ref_genome_fasta_file),
-            mgd.TempInputObj('config', 'regions'),
-            mgd.TempOutputFile('call.tsv', 'regions')
+    for suffix, axis, ctx in region_axes:
+        workflow.transform(
+            name='run_vardict' + suffix,
+            axes=(axis,),
+            ctx=ctx,
+            func=tasks.run_vardict_paired,
+            args=(
+                mgd.InputFile(normal_bam_file),
+                mgd.InputFile(tumour_bam_file),
+                mgd.InputFile(ref_genome_fasta_file),
+                mgd.TempInputObj('config', axis),
+                mgd.TempOutputFile('call.tsv', axis)
+            )
         )
-    )
 
-    workflow.transform(
-        name='test_somatic',
-        axes=('regions',),
-        func=tasks.run_test_somatic,
-        args=(
-            mgd.TempInputFile('call.tsv', 'regions'),
-            mgd.TempOutputFile('somatic.tsv', 'regions')
+        workflow.transform(
+            name='test_somatic' + suffix,
+            axes=(axis,),
+            func=tasks.run_test_somatic,
+            args=(
+                mgd.TempInputFile('call.tsv', axis),
+                mgd.TempOutputFile('somatic.tsv', axis)
+            )
         )
-    )
 
-    workflow.transform(
-        name='write_vcf',
-        axes=('regions',),
-        func=tasks.run_build_paired_vcf,
-        args=(
-            mgd.TempInputFile('somatic.tsv', 'regions'),
-            mgd.TempOutputFile('region.vcf', 'regions')
+        workflow.transform(
+            name='write_vcf' + suffix,
+            axes=(axis,),
+            func=tasks.run_build_paired_vcf,
+            args=(
+                mgd.TempInputFile('somatic.tsv', axis),
+                mgd.TempOutputFile('region.vcf', axis)
+            )
         )
-    )
 
-    workflow.commandline(
-        name='compress_vcf',
-        axes=('regions',),
-        args=(
-            'bcftools', 'view',
-            '-O', 'z',
-            '-o', mgd.TempOutputFile('region.vcf.gz', 'regions'),
-            mgd.TempInputFile('region.vcf', 'regions')
+        workflow.commandline(
+            name='compress_vcf' + suffix,
+            axes=(axis,),
+            args=(
+                'bcftools', 'view',
+                '-O', 'z',
+                '-o', mgd.TempOutputFile('region.vcf.gz', axis),
+                mgd.TempInputFile('region.vcf', axis)
+            )
         )
-    )
 
     workflow.transform(
         name='concatenate_vcfs',
         func=soil.wrappers.samtools.tasks.concatenate_vcf,
         args=(
-            mgd.TempInputFile('region.vcf.gz', 'regions'),
+            [mgd.TempInputFile('region.vcf.gz', axis) for _, axis, _ in region_axes],
             mgd.TempOutputFile('merged.vcf.gz'),
         )
     )
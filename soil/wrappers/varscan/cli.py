@@ -9,8 +9,10 @@ import workflows
 @click.option('-r', '--ref_genome_fasta_file', required=True, type=click.Path(exists=True, resolve_path=True))
 @click.option('-o', '--out_vcf_file', required=True, type=click.Path(resolve_path=True))
 @click.option('-c', '--chromosomes', multiple=True, type=str)
+@click.option('-m', '--split_method', default='fixed', type=click.Choice(['coverage', 'fixed']))
 @click.option('-s', '--split_size', default=int(1e7), type=int)
-def pileup2snp(bam_file, ref_genome_fasta_file, out_vcf_file, chromosomes, split_size):
+@click.option('-t', '--target_bed_file', default=None, type=click.Path(exists=True, resolve_path=True))
+def pileup2snp(bam_file, ref_genome_fasta_file, out_vcf_file, chromosomes, split_method, split_size, target_bed_file):
     if len(chromosomes) == 0:
         chromosomes = None
 
@@ -19,7 +21,9 @@ def pileup2snp(bam_file, ref_genome_fasta_file, out_vcf_file, chromosomes, split
         ref_genome_fasta_file,
         out_vcf_file,
         chromosomes=chromosomes,
-        split_size=split_size
+        split_method=split_method,
+        split_size=split_size,
+        target_bed_file=target_bed_file
     )
 
 
@@ -16,7 +16,14 @@ low_mem_ctx = {'mem': 2, 'mem_retry_factor': 2, 'num_retry': 3}
 med_mem_ctx = {'mem': 4, 'mem_retry_factor': 2, 'num_retry': 3}
 
 
-def create_pileup2snp_workflow(bam_file, ref_genome_fasta_file, out_file, chromosomes=None, split_size=int(1e7)):
+def create_pileup2snp_workflow(
+        bam_file,
+        ref_genome_fasta_file,
+        out_file,
+        chromosomes=None,
+        split_method='fixed',
+        split_size=int(1e7),
+        target_bed_file=None):
 
     sandbox = soil.utils.workflow.get_sandbox(['bcftools', 'samtools', 'varscan'])
 
@@ -24,19 +31,25 @@ def create_pileup2snp_workflow(bam_file, ref_genome_fasta_file, out_file, chromo
 
     workflow.setobj(
         obj=pypeliner.managed.TempOutputObj('config', 'regions'),
-        value=soil.utils.genome.get_bam_regions(bam_file, split_size, chromosomes=chromosomes)
+        value=soil.utils.genome.get_bam_regions(
+            bam_file,
+            split_size,
+            chromosomes=chromosomes,
+            ref_genome_fasta_file=ref_genome_fasta_file,
+            split_method=split_method,
+            target_bed_file=target_bed_file
+        )
     )
 
-    workflow.commandline(
+    workflow.transform(
         name='run_mpileup',
         axes=('regions',),
+        func=soil.wrappers.samtools.tasks.mpileup,
         args=(
-            'samtools',
-            'mpileup',
-            '-f', mgd.InputFile(ref_genome_fasta_file),
-            '-o', mgd.TempOutputFile('region.mpileup', 'regions'),
-            '-r', mgd.TempInputObj('config', 'regions'),
             mgd.InputFile(bam_file),
+            mgd.InputFile(ref_genome_fasta_file),
+            mgd.TempOutputFile('region.mpileup', 'regions'),
+            mgd.TempInputObj('config', 'regions'),
         )
     )
 